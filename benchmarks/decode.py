@@ -0,0 +1,77 @@
+# compare per-segment librosa.load decoding against single-pass streaming
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from src.tools.loader import AudioStream
+from .synthetic import write_recording
+
+
+def time_backend(file: str, backend: str, sr: int, duration: float):
+    stream = AudioStream(file, sr=sr, duration=duration, backend=backend)
+    start = time.perf_counter()
+    segments = [segment.data for segment in stream]
+    return time.perf_counter() - start, segments
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.decode",
+        description="compare per-segment and streaming decoding",
+    )
+    parser.add_argument("--file", help="existing .wav to decode")
+    parser.add_argument("--length", type=float, default=1800)
+    parser.add_argument("--native-sr", type=int, default=44100)
+    parser.add_argument("--sr", type=int, default=22050)
+    parser.add_argument("--segment", type=float, default=60)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        file = args.file
+        if file is None:
+            file = write_recording(
+                os.path.join(directory, "synthetic.wav"),
+                args.length,
+                args.native_sr,
+            )
+        # warm up decoder and resampler imports before timing
+        next(AudioStream(file, sr=args.sr, duration=args.segment))
+        results = {}
+        for backend in AudioStream.backends:
+            elapsed, segments = time_backend(
+                file, backend, args.sr, args.segment
+            )
+            results[backend] = segments
+            print(
+                "%-8s %8.3f s for %d segments"
+                % (backend, elapsed, len(segments))
+            )
+        reference = results["librosa"]
+        for backend, segments in results.items():
+            lengths_match = [len(a) for a in segments] == [
+                len(b) for b in reference
+            ]
+            # per-segment resampling differs from the continuous stream
+            # only within the filter's support at each segment edge
+            edge = 256
+            error = max(
+                float(np.max(np.abs(a - b), initial=0))
+                for a, b in zip(segments, reference)
+            )
+            interior_error = max(
+                float(np.max(np.abs(a - b)[edge:-edge], initial=0))
+                for a, b in zip(segments, reference)
+            )
+            print(
+                "%-8s lengths match: %s, max abs difference: %.2e "
+                "(%.2e away from segment edges)"
+                % (backend, lengths_match, error, interior_error)
+            )
+
+
+if __name__ == "__main__":
+    main()
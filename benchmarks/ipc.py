@@ -0,0 +1,99 @@
+# compare the bytes and latency of pool tasks that carry the whole
+# coordinator against tasks carrying a segment job description, and the
+# replies of workers returning arrays against writing them to shared memory
+
+import argparse
+import os
+import pickle
+import tempfile
+import time
+
+import numpy as np
+
+from src.analysis.coordinator import AnalysisCoordinator
+from src.analysis.pool import get_executor, shutdown
+from src.analysis.shared import SharedResults
+from src.tools.loader import AudioStream
+from .synthetic import write_recording
+
+
+def _receive(payload: bytes) -> int:
+    return len(pickle.loads(payload))
+
+
+# mean seconds to send a payload to a worker and get its reply
+def time_round_trip(payload: bytes, repeats: int) -> float:
+    executor = get_executor()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        executor.submit(_receive, payload).result()
+    return (time.perf_counter() - start) / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.ipc",
+        description="compare the pool tasks and replies of the analysis",
+    )
+    parser.add_argument("--file", help="existing .wav to analyse")
+    parser.add_argument("--length", type=float, default=3600)
+    parser.add_argument("--segment", type=float, default=60)
+    parser.add_argument("--repeats", type=int, default=50)
+    args = parser.parse_args()
+    indices = ["SpDiv", "ACI", "HfVar"]
+
+    with tempfile.TemporaryDirectory() as directory:
+        file = args.file
+        if file is None:
+            file = write_recording(
+                os.path.join(directory, "synthetic.wav"), args.length
+            )
+        stream = AudioStream(file, duration=args.segment)
+        coordinator = AnalysisCoordinator(stream)
+        segments = stream.getNumberOfSegments()
+        coordinator.spectrogram.shape = (segments, 256)
+        shared = SharedResults(indices, (segments, 256))
+        layout = shared.getLayout()
+        rng = np.random.default_rng(0)
+        # warm up the workers before timing
+        time_round_trip(pickle.dumps(()), 4)
+        print(
+            "%-9s %-12s %12s %12s" % ("progress", "task", "bytes", "latency")
+        )
+        added = 0
+        for progress in (0, 0.5, 1):
+            # results the frame would have accumulated by this point
+            while added < int(progress * segments):
+                coordinator.spectrogram.addSegment(
+                    added, {index: rng.random(256) for index in indices}
+                )
+                added += 1
+            i = max(added - 1, 0)
+            tasks = {
+                "coordinator": (coordinator, i, *indices),
+                "job": next(coordinator.getJobs([i], indices, layout)),
+            }
+            for name, task in tasks.items():
+                payload = pickle.dumps(task)
+                latency = time_round_trip(payload, args.repeats)
+                print(
+                    "%-9s %-12s %12d %9.3f ms"
+                    % (
+                        "%d%%" % (100 * progress),
+                        name,
+                        len(payload),
+                        1000 * latency,
+                    )
+                )
+        result = {index: rng.random(256) for index in indices}
+        token = (list(result), [])
+        print(
+            "reply for a segment: %d bytes as arrays, %d bytes as a token"
+            % (len(pickle.dumps((result, []))), len(pickle.dumps(token)))
+        )
+        shared.release()
+    shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+# compare the vectorised spectral diversity against the original loops
+
+import argparse
+import time
+
+import numpy as np
+
+from src.tools.loader import AudioStream
+from src.analysis.spectral_indices import spectral_diversity
+
+
+# the implementation before vectorising, kept to compare against
+def legacy_spectral_diversity(S_ampl: np.ndarray) -> int:
+    S_grouped = [
+        np.nanmean(
+            np.pad(
+                band,
+                (0, 3 - band.size % 3),
+                mode="constant",
+                constant_values=np.nan,
+            ).reshape(-1, 3),
+            axis=1,
+        )
+        for band in S_ampl
+    ]
+    S_binary = np.vstack(
+        [
+            legacy_remove_isolated_peaks(np.where(band > 0.07, 1, 0))
+            for band in S_grouped
+        ]
+    )
+    return legacy_cluster_peaks(S_binary)
+
+
+def legacy_remove_isolated_peaks(band: np.ndarray) -> np.ndarray:
+    for i in range(1, len(band) - 1):
+        if band[i - 1] == 0 and band[i + 1] == 0:
+            band[i] = 0
+    return band
+
+
+def legacy_cluster_peaks(S_binary: np.ndarray) -> int:
+    training_set = S_binary[np.count_nonzero(S_binary, axis=1) > 2]
+    if len(training_set) < 9:
+        return 0
+    initial_representatives = np.random.randint(len(training_set), size=2)
+    clusters = [initial_representatives[0], initial_representatives[1]]
+    cluster_sizes = np.array([1, 1])
+
+    iterations = 0
+    old_cluster_sizes = None
+    while iterations < 20 and old_cluster_sizes != cluster_sizes:
+        old_cluster_sizes = cluster_sizes
+        for i, vector in enumerate(training_set):
+            if i not in clusters:
+                similarity = np.zeros(len(clusters))
+                for j, cluster in enumerate(clusters):
+                    representative = training_set[cluster]
+                    similarity[j] = np.sum(representative & vector) / np.sum(
+                        representative | vector
+                    )
+                cluster = np.argmax(similarity)
+                if similarity[cluster] > 0.15:
+                    clusters.append(i)
+                    np.append(cluster_sizes, 1)
+                else:
+                    cluster_sizes[cluster] += 1
+        clusters = np.array(clusters)[cluster_sizes > 1]
+        cluster_sizes = cluster_sizes[cluster_sizes > 1]
+        iterations += 1
+    cluster_sizes = cluster_sizes[cluster_sizes > 3]
+    return len(cluster_sizes)
+
+
+# amplitude spectrograms with bands of repeated peak patterns
+def synthetic_spectrograms(count: int, frequencies: int, frames: int):
+    rng = np.random.default_rng(0)
+    patterns = rng.random((8, frames)) < 0.1
+    for _ in range(count):
+        S = rng.gamma(0.5, 0.01, (frequencies, frames))
+        rows = rng.choice(frequencies, frequencies // 2, replace=False)
+        choices = rng.integers(len(patterns), size=len(rows))
+        S[rows] += 0.2 * patterns[choices]
+        yield S
+
+
+def time_function(function, spectrograms):
+    results = []
+    start = time.perf_counter()
+    for S in spectrograms:
+        try:
+            results.append(function(S))
+        except Exception as exc:
+            results.append(type(exc).__name__)
+    return time.perf_counter() - start, results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--file", help="existing .wav to take segments of")
+    parser.add_argument("--segments", type=int, default=10)
+    parser.add_argument("--segment", type=float, default=60)
+    args = parser.parse_args()
+
+    if args.file is None:
+        # shape of a 60 s segment at 22050 Hz
+        spectrograms = list(synthetic_spectrograms(args.segments, 256, 5166))
+    else:
+        stream = AudioStream(args.file, duration=args.segment)
+        segments = min(args.segments, stream.getNumberOfSegments())
+        spectrograms = [
+            np.sqrt(stream.getSegment(i).getSpectrogram()[0])
+            for i in range(segments)
+        ]
+
+    functions = {
+        "legacy": legacy_spectral_diversity,
+        "vectorised": lambda S: spectral_diversity(None, S),
+    }
+    timings = {}
+    for name, function in functions.items():
+        elapsed, results = time_function(function, spectrograms)
+        timings[name] = elapsed
+        print(
+            "%-10s %8.3f s  %7.1f ms/segment  results %s"
+            % (
+                name,
+                elapsed,
+                1000 * elapsed / len(spectrograms),
+                results,
+            )
+        )
+    print("speedup %.1fx" % (timings["legacy"] / timings["vectorised"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+# time every index, both denoisers, the decoding backends, saving and
+# loading results and whole analyses on synthetic recordings, writing the
+# timings to a JSON baseline that later runs are compared against
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from src.analysis.analyzer import Analyzer, index_mapping
+from src.analysis.coordinator import AnalysisCoordinator, supported_indices
+from src.analysis.pool import get_max_workers, set_max_workers, shutdown
+from src.analysis.store import IndexStore
+from src.tools.loader import AudioSegment, AudioStream
+from src.tools.noise import spectrogram_denoise, waveform_denoise
+from .synthetic import write_recording
+
+Timings = Dict[str, Dict[str, float]]
+
+
+# seconds per call of a function, over several repeats
+def time_function(
+    function: Callable[[], Any], repeats: int, setup=None
+) -> Dict[str, float]:
+    times = []
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return {
+        "median": statistics.median(times),
+        "min": min(times),
+        "repeats": repeats,
+    }
+
+
+def benchmark_indices(
+    segment: AudioSegment, repeats: int, timings: Timings
+) -> None:
+    # the spectrogram and waveform are cached by the segment, so each index
+    # is timed without the stages every index shares
+    segment.getSpectrogram()
+    segment.getWaveform()
+    segment.getAmplitudeSpectrogram()
+    segment.getDecibelSpectrogram()
+    for index in index_mapping:
+        timings["index/%s" % (index)] = time_function(
+            lambda: Analyzer(segment).calculateIndices(index), repeats
+        )
+
+
+def benchmark_stages(
+    segment: AudioSegment, repeats: int, timings: Timings
+) -> None:
+    fresh = AudioSegment(segment.data, segment.sr, denoise=False)
+    timings["stft"] = time_function(
+        fresh.getSpectrogram, repeats, setup=fresh.release
+    )
+    S, _, _ = fresh.getSpectrogram()
+    avg = np.average(segment.data)
+    waveform = 20 * np.log10(np.abs(segment.data / avg))
+    timings["denoise/waveform"] = time_function(
+        lambda: waveform_denoise(waveform), repeats
+    )
+    timings["denoise/spectrogram"] = time_function(
+        lambda: spectrogram_denoise(S), repeats
+    )
+
+
+def benchmark_decoding(
+    file: str, sr: int, duration: float, repeats: int, timings: Timings
+) -> None:
+    # warm up decoder and resampler imports before timing
+    next(AudioStream(file, sr=sr, duration=duration))
+    for backend in AudioStream.backends:
+        timings["decode/%s" % (backend)] = time_function(
+            lambda: [
+                segment.data
+                for segment in AudioStream(
+                    file, sr=sr, duration=duration, backend=backend
+                )
+            ],
+            repeats,
+        )
+
+
+def benchmark_analysis(
+    file: str,
+    sr: int,
+    duration: float,
+    workers: List[int],
+    repeats: int,
+    timings: Timings,
+    directory: str,
+) -> None:
+    stream = AudioStream(file, sr=sr, duration=duration)
+    for max_workers in workers:
+        set_max_workers(max_workers)
+        # start the pool before timing
+        warm_up = stream.createStream(0, duration, duration)
+        AnalysisCoordinator(warm_up).calculateIndices("ACI")
+        timings["analysis/%d workers" % (max_workers)] = time_function(
+            lambda: AnalysisCoordinator(stream).calculateIndices(
+                *supported_indices
+            ),
+            repeats,
+        )
+    set_max_workers(None)
+    coordinator = AnalysisCoordinator(stream)
+    coordinator.calculateIndices(*supported_indices)
+    for ext in (".csv", IndexStore.extension):
+        path = os.path.join(directory, "indices" + ext)
+
+        def remove():
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            elif os.path.exists(path):
+                os.remove(path)
+
+        timings["save%s" % (ext)] = time_function(
+            lambda: coordinator.saveIndices(path), repeats, setup=remove
+        )
+        timings["load%s" % (ext)] = time_function(
+            lambda: AnalysisCoordinator(stream).loadIndices(path), repeats
+        )
+
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    timings: Timings = {}
+    with tempfile.TemporaryDirectory() as directory:
+        file = write_recording(
+            os.path.join(directory, "synthetic.wav"),
+            args.length,
+            args.native_sr,
+            seed=args.seed,
+        )
+        segment = next(AudioStream(file, sr=args.sr, duration=args.segment))
+        benchmark_indices(segment, args.repeats, timings)
+        benchmark_stages(segment, args.repeats, timings)
+        benchmark_decoding(file, args.sr, args.segment, args.repeats, timings)
+        benchmark_analysis(
+            file,
+            args.sr,
+            args.segment,
+            args.workers,
+            args.repeats,
+            timings,
+            directory,
+        )
+    shutdown()
+    return {
+        "metadata": {
+            "commit": _commit(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "length": args.length,
+            "native_sr": args.native_sr,
+            "sr": args.sr,
+            "segment": args.segment,
+            "seed": args.seed,
+            "repeats": args.repeats,
+        },
+        "timings": timings,
+    }
+
+
+# relative change of the fastest repeat of every benchmark in both runs,
+# which varies less than the median for short benchmarks; slower than the
+# threshold counts as a regression
+def compare(
+    baseline: Dict[str, Any], current: Dict[str, Any], threshold: float
+) -> List[str]:
+    regressions = []
+    print(
+        "%-24s %12s %12s %9s"
+        % ("benchmark", "baseline (s)", "current (s)", "change")
+    )
+    for name, timing in current["timings"].items():
+        if name not in baseline["timings"]:
+            continue
+        before = baseline["timings"][name]["min"]
+        after = timing["min"]
+        change = after / before - 1 if before > 0 else 0.0
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = " slower"
+        print(
+            "%-24s %12.4f %12.4f %+8.1f%%%s"
+            % (name, before, after, 100 * change, flag)
+        )
+    for key in ("length", "native_sr", "sr", "segment", "cpus"):
+        if baseline["metadata"].get(key) != current["metadata"].get(key):
+            print(
+                "warning: %s differs from the baseline (%s, now %s)"
+                % (
+                    key,
+                    baseline["metadata"].get(key),
+                    current["metadata"][key],
+                )
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.suite",
+        description="time indices, denoising, decoding and analyses",
+    )
+    parser.add_argument("--length", type=float, default=300)
+    parser.add_argument("--native-sr", type=int, default=44100)
+    parser.add_argument("--sr", type=int, default=22050)
+    parser.add_argument("--segment", type=float, default=60)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="+",
+        default=sorted({1, 4, get_max_workers()}),
+    )
+    parser.add_argument("--output", help="write the timings to this .json")
+    parser.add_argument("--baseline", help=".json of an earlier run")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="relative slowdown reported as a regression",
+    )
+    args = parser.parse_args()
+
+    current = run(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, current, args.threshold)
+        if regressions:
+            print("regressions: %s" % (", ".join(regressions)))
+            sys.exit(1)
+    else:
+        for name, timing in current["timings"].items():
+            print("%-24s %10.4f s" % (name, timing["median"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+# generate synthetic field recordings (background noise plus bird-like chirps)
+
+import numpy as np
+import soundfile as sf
+
+
+def synthesize_recording(
+    duration: float,
+    sr: int = 44100,
+    chirps_per_minute: float = 30,
+    seed: int = 0,
+) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    n = int(duration * sr)
+    # pink-ish background noise: white noise through a one-pole low pass
+    noise = rng.normal(0, 0.01, n).astype(np.float32)
+    noise = np.cumsum(noise) * 0.02 + noise
+    noise -= np.mean(noise)
+    y = noise.astype(np.float32)
+    # linear chirps between 2 and 8 kHz with a hann envelope
+    num_chirps = int(chirps_per_minute * duration / 60)
+    for _ in range(num_chirps):
+        length = int(rng.uniform(0.05, 0.4) * sr)
+        start = int(rng.integers(0, max(1, n - length)))
+        f0, f1 = rng.uniform(2000, min(8000, sr / 2 - 1), size=2)
+        t = np.arange(length) / sr
+        phase = 2 * np.pi * (f0 * t + (f1 - f0) * t**2 / (2 * t[-1]))
+        chirp = rng.uniform(0.05, 0.3) * np.hanning(length) * np.sin(phase)
+        y[start : start + length] += chirp[: n - start].astype(np.float32)
+    return np.clip(y, -1, 1)
+
+
+def write_recording(
+    path: str,
+    duration: float,
+    sr: int = 44100,
+    chirps_per_minute: float = 30,
+    seed: int = 0,
+) -> str:
+    y = synthesize_recording(duration, sr, chirps_per_minute, seed)
+    sf.write(path, y, sr, subtype="PCM_16")
+    return path
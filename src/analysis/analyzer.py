@@ -1,42 +1,80 @@
 # class for calculating acoustic indices given an audio segment
 
-from typing import Dict, Callable, Iterable
+from typing import Dict, Callable, Iterable, List, Tuple
 
 import traceback
 
+from .graph import ComputationGraph, Dependency, Node
 from .temporal_indices import *
 from .spectral_indices import *
 from .secondary_indices import *
 from src.tools.interfaces import IAnalyzer, IAudioSegment
 
+# computation graph of intermediate results shared between indices
+_nodes: Dict[str, Node] = {
+    # primitives
+    "envelope": (temporal_envelope, {}),
+    "background": (temporal_background, {"envelope": "envelope"}),
+    "amplitude": (amplitude_spectrogram, {}),
+    "decibels": (decibel_spectrogram, {}),
+    # temporal indices
+    "Ht": (temporal_entropy, {"envelope": "envelope"}),
+    "M": (amplitude_median, {}),
+    "BgN": (background_noise, {}),
+    "SNR": (signal_to_noise_ratio, {}),
+    "AcAct": (
+        acoustic_activity,
+        {"envelope": "envelope", "background": "background"},
+    ),
+    "AE": (
+        acoustic_event_proportion_and_duration,
+        {"envelope": "envelope", "background": "background"},
+    ),
+    # spectral indices
+    "Hf": (spectral_entropy, {}),
+    "SpDiv": (spectral_diversity, {"S_ampl": "amplitude"}),
+    "SpAct": (spectral_activity, {"S_dB": "decibels"}),
+    "ACI": (acoustic_complexity_index, {"S_ampl": "amplitude"}),
+    "AEI": (acoustic_evenness_index, {"S_ampl": "amplitude"}),
+    "BioI": (bioacoustic_index, {"S_ampl": "amplitude"}),
+    "FreqCov": (frequency_band_cover, {"S_dB": "decibels"}),
+    "NDSI": (normalized_difference_soundscape_index, {}),
+    # secondary indices
+    "ARI": (acoustic_richness_index, {"Ht": "Ht", "M": "M"}),
+    "H": (acoustic_entropy, {"Ht": "Ht", "Hf": ("Hf", 0)}),
+}
+
+# graph node (and element of its result) giving each index
+index_mapping: Dict[str, Dependency] = {
+    "Ht": "Ht",
+    "M": "M",
+    "BgN": "BgN",
+    "SNR": "SNR",
+    "AcAct": "AcAct",
+    "AEFrac": ("AE", 0),
+    "AEDur": ("AE", 1),
+    "Hf": ("Hf", 0),
+    "HfVar": ("Hf", 1),
+    "HfMax": ("Hf", 2),
+    "SpDiv": "SpDiv",
+    "SpAct": "SpAct",
+    "ACI": "ACI",
+    "AEI": "AEI",
+    "BioI": "BioI",
+    "LFreqCov": ("FreqCov", 0),
+    "MFreqCov": ("FreqCov", 1),
+    "HFreqCov": ("FreqCov", 2),
+    "NDSI": "NDSI",
+    "ARI": "ARI",
+    "H": "H",
+}
+
 
 class Analyzer(IAnalyzer):
     def __init__(self, segment: IAudioSegment):
         self.segment = segment
-        self._index_mapping: Dict[str, Callable] = {
-            "Ht": temporal_entropy,
-            "M": amplitude_median,
-            "BgN": background_noise,
-            "SNR": signal_to_noise_ratio,
-            "AcAct": acoustic_activity,
-            "AEFrac": acoustic_event_proportion_and_duration,
-            "AEDur": acoustic_event_proportion_and_duration,
-            "Hf": spectral_entropy,
-            "HfVar": spectral_entropy,
-            "HfMax": spectral_entropy,
-            "SpDiv": spectral_diversity,
-            "SpAct": spectral_activity,
-            "ACI": acoustic_complexity_index,
-            "AEI": acoustic_evenness_index,
-            "BioI": bioacoustic_index,
-            "LFreqCov": frequency_band_cover,
-            "MFreqCov": frequency_band_cover,
-            "HFreqCov": frequency_band_cover,
-            "NDSI": normalized_difference_soundscape_index,
-            "ARI": acoustic_richness_index,
-            "H": acoustic_entropy,
-        }
-        self._calculated: dict[Callable, np.ndarray] = {}
+        self.graph = ComputationGraph(segment, _nodes)
+        self._index_mapping = index_mapping
 
     def calculateIndices(
         self, *indices: str
@@ -44,27 +82,22 @@ class Analyzer(IAnalyzer):
         results = {}
         log = []
         for index in indices:
-            function = self._index_mapping[index]
-            if function in self._calculated:
-                results[index] = self._get_correct_result(
-                    index, self._calculated[function]
-                )
             try:
-                result = function(self.segment)
-                self._calculated[function] = result
-                results[index] = self._get_correct_result(index, result)
+                result = self.graph.get(self._index_mapping[index])
+                results[index] = self._get_correct_result(result)
             except:
                 log.append((index, traceback.format_exc()))
         return results, log
 
-    def _get_correct_result(self, index: str, result) -> np.ndarray:
-        value = result
-        if index == "AEFrac" or index == "Hf" or index == "LFreqCov":
-            value = result[0]
-        if index == "AEDur" or index == "HfVar" or index == "MFreqCov":
-            value = result[1]
-        if index == "HfMax" or index == "HFreqCov":
-            value = result[2]
+    # free the segment's cached arrays and intermediate results
+    def release(self) -> None:
+        self.graph.clear()
+        self.segment.release()
+
+    def getCacheStats(self) -> Dict[str, Tuple[int, int]]:
+        return self.graph.getCacheStats()
+
+    def _get_correct_result(self, value) -> np.ndarray:
         if isinstance(value, Iterable):
             return np.array(value)
         else:
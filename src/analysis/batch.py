@@ -0,0 +1,375 @@
+# analyse whole directories of recordings without the interface, sharing
+# one process pool between the segments of every file
+
+import argparse
+import glob
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from .cache import IndexCache
+from .coordinator import (
+    CANCEL_POLL,
+    AnalysisCoordinator,
+    SegmentEvent,
+    SegmentJob,
+    calculate_segments,
+    supported_indices,
+)
+from .journal import ResultJournal, journal_path
+from .pool import get_executor, get_max_workers, set_max_workers
+from .store import IndexStore
+from src.tools import profiling
+from src.tools.loader import AudioStream
+
+
+class FileAnalysis:
+    def __init__(
+        self,
+        file: str,
+        path: str,
+        indices: List[str],
+        sr: int = 22050,
+        duration: float = 60,
+        backend: str = "librosa",
+        batch_size: int = 4,
+        cache: Optional[IndexCache] = None,
+    ):
+        self.file = file
+        self.path = path
+        stream = AudioStream(file, sr, duration, backend=backend)
+        self.coordinator = AnalysisCoordinator(
+            stream, batch_size=batch_size, cache=cache
+        )
+        self._loadStore()
+        self.journal: Optional[ResultJournal] = None
+        if any(
+            index not in self.coordinator.spectrogram.getIndices()
+            for index in indices
+        ):
+            # checkpoint finished segments, to resume an interrupted run
+            self.journal = ResultJournal(
+                journal_path(path), self.coordinator.getMetadata()
+            )
+        self.indices, self.results, self.pending = (
+            self.coordinator.prepareIndices(*indices, journal=self.journal)
+        )
+        self.remaining = len(self.pending)
+        self.failed_indices: Set[str] = set()
+
+    # keep the indices of an earlier run over the same segments
+    def _loadStore(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        metadata = json.loads(json.dumps(self.coordinator.getMetadata()))
+        try:
+            store = IndexStore(self.path)
+        except ValueError:
+            return
+        if {key: store.metadata.get(key) for key in metadata} == metadata:
+            self.coordinator.loadIndices(self.path)
+
+    def getJobs(self) -> Iterator[SegmentJob]:
+        return self.coordinator.getJobs(
+            self.pending, self.indices, self.results.getLayout()
+        )
+
+    # seconds of audio in the segments analysed by this run
+    def getDuration(self) -> float:
+        stream = self.coordinator.stream
+        length = stream.time_limits[1] - stream.time_limits[0]
+        return sum(
+            min(stream.segment_duration, length - i * stream.segment_duration)
+            for i in self.pending
+        )
+
+    def collectSegments(
+        self, future: Future, job: SegmentJob, submitted: float, start: float
+    ) -> List[SegmentEvent]:
+        events = self.coordinator.collectSegments(
+            future, job, self.results, self.journal, submitted, start
+        )
+        for event in events:
+            self.failed_indices.update(index for (index, _) in event.errors)
+        self.remaining -= len(job.segments)
+        if self.remaining == 0:
+            self.finish()
+        return events
+
+    def finish(self) -> None:
+        if not self.indices and self.journal is None:
+            return
+        self.coordinator.finishIndices(self.results, self.failed_indices)
+        if self.failed_indices:
+            # the journal holds only the segments that succeeded, so the
+            # next run calculates the failed ones again
+            if self.journal is not None:
+                self.journal.close()
+            print(
+                "not saving %s, %s failed on some segments"
+                % (self.path, ", ".join(sorted(self.failed_indices))),
+                flush=True,
+            )
+            return
+        self.coordinator.saveIndices(self.path)
+        if self.journal is not None:
+            self.journal.remove()
+        print("saved %s" % (self.path), flush=True)
+
+
+class BatchRunner:
+    def __init__(
+        self,
+        files: List[str],
+        indices: List[str],
+        output: Optional[str] = None,
+        sr: int = 22050,
+        duration: float = 60,
+        backend: str = "librosa",
+        max_workers: Optional[int] = None,
+        batch_size: int = 4,
+        cache: Optional[IndexCache] = None,
+    ):
+        if any(index not in supported_indices for index in indices):
+            raise ValueError("Unsupported acoustic indices were specified.")
+        self.files = files
+        self.indices = indices
+        self.output = output
+        self.sr = sr
+        self.duration = duration
+        self.backend = backend
+        self.max_workers = max_workers or get_max_workers()
+        # cap on jobs in flight, across every file
+        self.max_pending = 2 * self.max_workers
+        self.batch_size = batch_size
+        self.cache = cache
+        self.analyses: List[FileAnalysis] = []
+        self.skipped: List[Tuple[str, str]] = []
+        # set to stop the run going on
+        self._cancelled = threading.Event()
+        self._paths = [self.getStorePath(file) for file in files]
+        if len(set(self._paths)) != len(self._paths):
+            raise ValueError(
+                "recordings with the same name would share a store in %s"
+                % (output)
+            )
+
+    def getStorePath(self, file: str) -> str:
+        name = os.path.splitext(os.path.basename(file))[0]
+        directory = self.output or os.path.dirname(file)
+        return os.path.join(directory, name + IndexStore.extension)
+
+    # jobs of every file in turn, opening a file only once its jobs are
+    # reached, so the pool moves on to the next file while the last jobs
+    # of the previous one finish
+    def _iterJobs(self) -> Iterator[Tuple[FileAnalysis, SegmentJob]]:
+        for file, path in zip(self.files, self._paths):
+            try:
+                analysis = FileAnalysis(
+                    file,
+                    path,
+                    self.indices,
+                    self.sr,
+                    self.duration,
+                    self.backend,
+                    self.batch_size,
+                    self.cache,
+                )
+            except (OSError, RuntimeError, ValueError) as exc:
+                print("skipping %s: %s" % (file, exc), flush=True)
+                self.skipped.append((file, str(exc)))
+                continue
+            self.analyses.append(analysis)
+            if not analysis.pending:
+                analysis.finish()
+                continue
+            for job in analysis.getJobs():
+                yield analysis, job
+
+    # analyse every file, yielding each segment's results as it finishes
+    def iterSegments(self) -> Iterator[Tuple[FileAnalysis, SegmentEvent]]:
+        # the run's own flag, so a cancel before it starts isn't lost
+        self._cancelled = threading.Event()
+        return self._iterSegments(self._cancelled)
+
+    def _iterSegments(
+        self, cancelled: threading.Event
+    ) -> Iterator[Tuple[FileAnalysis, SegmentEvent]]:
+        start = time.perf_counter()
+        jobs = self._iterJobs()
+        futures_to_job: Dict[Future, Tuple[FileAnalysis, SegmentJob]] = {}
+        submitted: Dict[Future, float] = {}
+        executor = get_executor()
+        finished = False
+        try:
+            while not cancelled.is_set():
+                while len(futures_to_job) < self.max_pending:
+                    item = next(jobs, None)
+                    if item is None:
+                        break
+                    future = executor.submit(calculate_segments, item[1])
+                    futures_to_job[future] = item
+                    submitted[future] = time.perf_counter()
+                if not futures_to_job:
+                    break
+                done, _ = wait(
+                    futures_to_job,
+                    timeout=CANCEL_POLL,
+                    return_when=FIRST_COMPLETED,
+                )
+                for future in done:
+                    analysis, job = futures_to_job.pop(future)
+                    events = analysis.collectSegments(
+                        future, job, submitted.pop(future), start
+                    )
+                    for event in events:
+                        yield analysis, event
+            finished = not cancelled.is_set()
+        finally:
+            if not finished:
+                for future in futures_to_job:
+                    future.cancel()
+                # journals keep what was finished, for the next run
+                for analysis in self.analyses:
+                    analysis.results.release()
+
+    # stop a run going on in another thread
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    def run(self) -> Dict[str, Any]:
+        start = time.perf_counter()
+        first_result = None
+        for analysis, event in self.iterSegments():
+            analysis.coordinator.reportErrors(event.segment, event.errors)
+            if first_result is None:
+                first_result = event.elapsed
+        wall_time = time.perf_counter() - start
+        audio_time = sum(analysis.getDuration() for analysis in self.analyses)
+        return {
+            "files": len(self.analyses),
+            "skipped": len(self.skipped),
+            "failed": sum(
+                1 for analysis in self.analyses if analysis.failed_indices
+            ),
+            "audio_hours": audio_time / 3600,
+            "wall_hours": wall_time / 3600,
+            "throughput": audio_time / wall_time if wall_time else 0.0,
+            "first_result": first_result,
+        }
+
+
+# recordings named by directories (their .wav files) and glob patterns
+def find_recordings(paths: List[str], recursive: bool = False) -> List[str]:
+    files: List[str] = []
+    for path in paths:
+        if os.path.isdir(path):
+            pattern = os.path.join(path, "**" if recursive else "", "*")
+            matches = [
+                match
+                for match in glob.glob(pattern, recursive=recursive)
+                if match.lower().endswith(".wav")
+            ]
+        else:
+            matches = glob.glob(path, recursive=recursive)
+        for match in sorted(matches):
+            if os.path.isfile(match) and match not in files:
+                files.append(match)
+    return files
+
+
+def main(args: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        prog="python -m src.analysis.batch",
+        description="calculate acoustic indices over many recordings",
+    )
+    parser.add_argument(
+        "paths", nargs="+", help="directories of .wav files or glob patterns"
+    )
+    parser.add_argument(
+        "--indices", nargs="+", required=True, choices=supported_indices
+    )
+    parser.add_argument(
+        "--output",
+        help="directory of the index stores, by default beside each recording",
+    )
+    parser.add_argument("--recursive", action="store_true")
+    parser.add_argument("--sr", type=int, default=22050)
+    parser.add_argument(
+        "--duration", type=float, default=60, help="segment duration (s)"
+    )
+    parser.add_argument(
+        "--backend", default="librosa", choices=AudioStream.backends
+    )
+    parser.add_argument(
+        "--workers", type=int, help="processes, by default one per cpu"
+    )
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument(
+        "--cache", action="store_true", help="reuse and keep cached results"
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="print the time spent in each stage and index",
+    )
+    parser.add_argument(
+        "--profile-json", help="write the timing of every stage to a .json"
+    )
+    parser.add_argument(
+        "--profile-trace",
+        help="write the timing of every stage as a chrome trace",
+    )
+    args = parser.parse_args(args)
+
+    files = find_recordings(args.paths, args.recursive)
+    if not files:
+        parser.error("no recordings found")
+    if args.output is not None:
+        os.makedirs(args.output, exist_ok=True)
+    set_max_workers(args.workers)
+    if args.profile or args.profile_json or args.profile_trace:
+        profiling.enable()
+    runner = BatchRunner(
+        files,
+        args.indices,
+        output=args.output,
+        sr=args.sr,
+        duration=args.duration,
+        backend=args.backend,
+        batch_size=args.batch_size,
+        cache=IndexCache() if args.cache else None,
+    )
+    report = runner.run()
+    print(
+        "analysed %.2f h of audio from %d files (%d skipped, %d failed) in "
+        "%.2f h"
+        % (
+            report["audio_hours"],
+            report["files"],
+            report["skipped"],
+            report["failed"],
+            report["wall_hours"],
+        )
+    )
+    print(
+        "throughput: %.1f audio-hours per wall-hour" % (report["throughput"])
+    )
+    if report["first_result"] is not None:
+        print("first results after %.2f s" % (report["first_result"]))
+    if args.profile:
+        print(profiling.format_summary())
+    if args.profile_json:
+        profiling.write_json(args.profile_json)
+    if args.profile_trace:
+        profiling.write_chrome_trace(args.profile_trace)
+    if report["failed"] or report["skipped"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+# class for calculating acoustic indices for several audio segments at once
+
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import maad
+import numpy as np
+
+from .graph import Dependency
+from .analyzer import Analyzer, index_mapping
+from src.tools import profiling
+from src.tools.interfaces import IAudioSegment
+
+# vectorised versions of the spectral indices in spectral_indices.py,
+# taking stacked (segments, frequencies, times) spectrograms and returning
+# one result per segment. decibel thresholds are applied to the linear
+# spectrograms and most indices reduce each row once, so the stack is
+# passed over as few times as possible; results match maad up to rounding
+
+
+def batch_spectral_activity(S: np.ndarray, fn: np.ndarray) -> np.ndarray:
+    return _row_activity(S, _power(6))
+
+
+def batch_acoustic_complexity_index(
+    S_ampl: np.ndarray, fn: np.ndarray
+) -> np.ndarray:
+    differences = np.sum(np.abs(np.diff(S_ampl, axis=2)), axis=2)
+    return differences / np.sum(S_ampl, axis=2)
+
+
+def batch_acoustic_evenness_index(
+    S_ampl: np.ndarray,
+    fn: np.ndarray,
+    fmax: int = 20000,
+    bin_step: int = 500,
+    db_threshold: int = -50,
+) -> np.ndarray:
+    # relative to each segment's maximum, as maad normalises by it
+    threshold = _batch_max(S_ampl) * _power(db_threshold / 2)
+    activity = _row_activity(S_ampl, threshold)
+    scores = np.stack(
+        [
+            np.mean(
+                activity[:, maad.util.index_bw(fn, (f0, f0 + bin_step))], 1
+            )
+            for f0 in range(0, fmax - bin_step + 1, bin_step)
+        ],
+        axis=1,
+    )
+    # gini coefficient of each segment's scores
+    n = scores.shape[1]
+    scores = np.sort(scores, axis=1)
+    totals = np.sum(scores, axis=1)
+    weighted = np.sum(scores * np.arange(1, n + 1), axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        gini = (2 * weighted / totals - (n + 1)) / n
+    return np.where(totals == 0, 0, gini)
+
+
+def batch_bioacoustic_index(
+    S_ampl: np.ndarray, fn: np.ndarray, flim: Tuple[int, int] = (2000, 11000)
+) -> np.ndarray:
+    means = np.mean(S_ampl, axis=2) / _batch_max(S_ampl)[:, :, 0]
+    band = maad.util.index_bw(fn, flim)
+    mean_dB = maad.util.amplitude2dB(means)[:, band]
+    mean_dB -= np.min(mean_dB, axis=1, keepdims=True)
+    return np.sum(mean_dB, axis=1) / (fn[1] - fn[0])
+
+
+def batch_frequency_band_cover(
+    S: np.ndarray, fn: np.ndarray, db_threshold: int = 3
+) -> List[Tuple[float, float, float]]:
+    activity = _row_activity(S, _power(db_threshold))
+    low, mid, high = [
+        np.mean(activity[:, maad.util.index_bw(fn, flim)], axis=1)
+        for flim in ((0, 482), (482, 3500), (3500, 11000))
+    ]
+    return list(zip(low, mid, high))
+
+
+def batch_normalized_difference_soundscape_index(
+    S: np.ndarray, fn: np.ndarray, bin_step: int = 1000
+) -> np.ndarray:
+    # energy in 1 kHz bins, as maad.util.into_bins
+    totals = np.sum(S, axis=2)
+    bins = np.arange(fn[0], fn[-1] + bin_step, bin_step)
+    rows = [(fn >= b0) & (fn < b1) for b0, b1 in zip(bins[:-1], bins[1:])]
+    energy = np.stack([np.mean(totals[:, r], axis=1) for r in rows], axis=1)
+    energy *= np.mean([np.sum(r) for r in rows])
+    bins = bins[:-1]
+    bio = np.sum(energy[:, maad.util.index_bw(bins, (2000, 11000))], axis=1)
+    anthro = np.sum(energy[:, maad.util.index_bw(bins, (1000, 2000))], axis=1)
+    return (bio - anthro) / (bio + anthro)
+
+
+# fraction of each row's time frames at or above the threshold
+def _row_activity(S: np.ndarray, threshold) -> np.ndarray:
+    return np.count_nonzero(S >= threshold, axis=2) / S.shape[2]
+
+
+def _power(db: float) -> float:
+    return 10 ** (db / 10)
+
+
+def _batch_max(S: np.ndarray) -> np.ndarray:
+    return np.max(S, axis=(1, 2), keepdims=True)
+
+
+# graph nodes with a batch implementation, and the spectrogram they take
+_batch_nodes: Dict[str, Tuple[Callable, str]] = {
+    "SpAct": (batch_spectral_activity, "power"),
+    "ACI": (batch_acoustic_complexity_index, "amplitude"),
+    "AEI": (batch_acoustic_evenness_index, "amplitude"),
+    "BioI": (batch_bioacoustic_index, "amplitude"),
+    "FreqCov": (batch_frequency_band_cover, "power"),
+    "NDSI": (batch_normalized_difference_soundscape_index, "power"),
+}
+
+
+class BatchAnalyzer:
+    def __init__(
+        self,
+        segments: Sequence[IAudioSegment],
+        numbers: Optional[Sequence[int]] = None,
+    ):
+        self.segments = list(segments)
+        self.analyzers = [Analyzer(segment) for segment in self.segments]
+        # segment numbers in their stream, labelling profiling records
+        self.numbers = list(numbers or range(len(self.segments)))
+
+    # results and log of each segment, as Analyzer.calculateIndices
+    def calculateIndices(
+        self, *indices: str
+    ) -> List[Tuple[Dict[str, np.ndarray], List[Tuple[str, str]]]]:
+        nodes = {
+            _node_name(index_mapping[index])
+            for index in indices
+            if index in index_mapping
+        }
+        batch_nodes = [name for name in _batch_nodes if name in nodes]
+        if batch_nodes:
+            for group in self._groupSegments():
+                self._calculateGroup(group, batch_nodes)
+        # everything without a batch implementation (or whose batch
+        # failed) is computed per segment from the seeded graphs
+        results = []
+        for number, analyzer in zip(self.numbers, self.analyzers):
+            with profiling.tags(segment=number):
+                results.append(analyzer.calculateIndices(*indices))
+        return results
+
+    def release(self) -> None:
+        for analyzer in self.analyzers:
+            analyzer.release()
+
+    # segments whose spectrograms can be stacked, i.e. have the same shape
+    def _groupSegments(self) -> List[List[int]]:
+        groups: Dict[tuple, List[int]] = {}
+        for i, segment in enumerate(self.segments):
+            try:
+                with profiling.tags(segment=self.numbers[i]):
+                    S, _, fn = segment.getSpectrogram()
+            except Exception:
+                # left for the segment's own analyzer to report
+                continue
+            key = (S.shape, np.asarray(fn).tobytes())
+            groups.setdefault(key, []).append(i)
+        return list(groups.values())
+
+    def _calculateGroup(self, group: List[int], batch_nodes: List[str]):
+        _, _, fn = self.segments[group[0]].getSpectrogram()
+        fn = np.asarray(fn)
+        S = np.stack([self.segments[i].getSpectrogram()[0] for i in group])
+        stacks = {"power": S}
+        for name in batch_nodes:
+            function, kind = _batch_nodes[name]
+            if kind not in stacks:
+                stacks[kind] = np.sqrt(S)
+            try:
+                with profiling.stage("batch node", name) as entry:
+                    values = function(stacks[kind], fn)
+                    entry["segments"] = len(group)
+                    entry["bytes"] = stacks[kind].nbytes
+            except Exception:
+                continue
+            for i, value in zip(group, values):
+                self.analyzers[i].graph.set(name, value)
+
+
+def _node_name(dependency: Dependency) -> str:
+    return dependency[0] if isinstance(dependency, tuple) else dependency
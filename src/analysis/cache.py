@@ -0,0 +1,255 @@
+# persistent cache of index results, addressed by the audio content and
+# every parameter the results depend on, with least recently used eviction
+
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .store import replace_file
+from src.tools.interfaces import IAudioStream
+from src.tools.loader import AudioSegment
+
+# bump when a change to the analysis invalidates cached results
+CACHE_VERSION = 1
+
+
+def default_cache_directory() -> str:
+    return os.environ.get(
+        "ACOUSTIC_INDICES_CACHE",
+        os.path.join(os.path.expanduser("~"), ".cache", "acoustic_indices"),
+    )
+
+
+class IndexCache:
+    def __init__(
+        self, directory: Optional[str] = None, max_bytes: int = 2**30
+    ):
+        self.directory = directory or default_cache_directory()
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+        self._digests_path = os.path.join(self.directory, "files.json")
+        # read once, when the first digest is needed
+        self._digests: Optional[Dict[str, str]] = None
+        self._lock = threading.Lock()
+
+    # copies, e.g. sent to another process, read the digests again
+    def __getstate__(self) -> Dict[str, Any]:
+        state = dict(self.__dict__, _digests=None)
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    # everything a result of the index over the stream depends on
+    def getKey(self, stream: IAudioStream, index: str) -> Dict[str, Any]:
+        return {
+            "version": CACHE_VERSION,
+            "audio": self.getFileDigest(stream.file),
+            "sr": stream.sr,
+            "duration": stream.segment_duration,
+            "time_limits": [float(t) for t in stream.time_limits],
+            "spectrogram": AudioSegment.spectrogram_params,
+            "denoise": stream.denoise,
+            # backends resample differently
+            "backend": stream.backend,
+            "index": index,
+        }
+
+    def get(self, stream: IAudioStream, index: str) -> Optional[np.ndarray]:
+        path = self._entryPath(self.getKey(stream, index))
+        try:
+            result = np.load(path)
+        except (OSError, ValueError):
+            return None
+        # the modification time records when an entry was last used
+        os.utime(path)
+        return result
+
+    def put(self, stream: IAudioStream, index: str, result: np.ndarray):
+        key = self.getKey(stream, index)
+        path = self._entryPath(key)
+        replace_file(path, lambda f: np.save(f, result))
+        description = dict(key, file=os.path.abspath(stream.file))
+        replace_file(
+            path[: -len(".npy")] + ".json",
+            lambda f: f.write(json.dumps(description).encode()),
+        )
+        self.evict()
+
+    # entries, least recently used first
+    def getEntries(self) -> List[Dict[str, Any]]:
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".npy"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path[: -len(".npy")] + ".json") as f:
+                    entry = json.load(f)
+                stat = os.stat(path)
+            except (OSError, ValueError):
+                continue
+            entry.update(path=path, size=stat.st_size, used=stat.st_mtime)
+            entries.append(entry)
+        return sorted(entries, key=lambda entry: entry["used"])
+
+    def getSize(self) -> int:
+        return sum(entry["size"] for entry in self.getEntries())
+
+    # remove least recently used entries until the cache fits in max_bytes
+    def evict(self, max_bytes: Optional[int] = None) -> int:
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+        entries = self.getEntries()
+        size = sum(entry["size"] for entry in entries)
+        removed = 0
+        for entry in entries:
+            if size <= max_bytes:
+                break
+            self._remove(entry)
+            size -= entry["size"]
+            removed += 1
+        return removed
+
+    # remove entries of one audio file, or all of them
+    def purge(self, file: Optional[str] = None) -> int:
+        entries = self.getEntries()
+        if file is not None:
+            file = os.path.abspath(file)
+            entries = [entry for entry in entries if entry["file"] == file]
+        for entry in entries:
+            self._remove(entry)
+        return len(entries)
+
+    # hash of the file's content, remembered while its size and
+    # modification time stay the same
+    def getFileDigest(self, file: str) -> str:
+        identity = _file_identity(file)
+        with self._lock:
+            if self._digests is None:
+                self._digests = self._readDigests()
+            if identity in self._digests:
+                return self._digests[identity]
+        digest = _file_digest(file)
+        with self._lock:
+            # keep digests other processes added meanwhile, and drop those
+            # of files since removed or changed
+            digests = dict(self._readDigests(), **self._digests)
+            digests[identity] = digest
+            self._digests = {
+                key: value
+                for key, value in digests.items()
+                if _is_current(key)
+            }
+            replace_file(
+                self._digests_path,
+                lambda f: f.write(json.dumps(self._digests).encode()),
+            )
+        return digest
+
+    def _readDigests(self) -> Dict[str, str]:
+        try:
+            with open(self._digests_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _entryPath(self, key: Dict[str, Any]) -> str:
+        encoded = json.dumps(key, sort_keys=True).encode()
+        name = hashlib.sha256(encoded).hexdigest()
+        return os.path.join(self.directory, name + ".npy")
+
+    def _remove(self, entry: Dict[str, Any]) -> None:
+        for path in (entry["path"], entry["path"][: -len(".npy")] + ".json"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+# path, size and modification time, which change when a file is rewritten
+def _file_identity(file: str) -> str:
+    stat = os.stat(file)
+    return "%s:%d:%d" % (os.path.abspath(file), stat.st_size, stat.st_mtime_ns)
+
+
+def _is_current(identity: str) -> bool:
+    path = identity.rsplit(":", 2)[0]
+    try:
+        return _file_identity(path) == identity
+    except OSError:
+        return False
+
+
+def _file_digest(file: str, chunk_size: int = 2**22) -> str:
+    digest = hashlib.blake2b(digest_size=20)
+    with open(file, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _format_size(size: float) -> str:
+    for unit in ("B", "KiB", "MiB"):
+        if size < 1024:
+            return "%.1f %s" % (size, unit)
+        size /= 1024
+    return "%.1f GiB" % (size)
+
+
+def main(args: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        prog="python -m src.analysis.cache",
+        description="inspect and purge the cache of calculated indices",
+    )
+    parser.add_argument("--directory", default=default_cache_directory())
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="list entries, least recently used first")
+    commands.add_parser("stats", help="show the number and size of entries")
+    purge = commands.add_parser("purge", help="remove entries")
+    scope = purge.add_mutually_exclusive_group(required=True)
+    scope.add_argument("--all", action="store_true", help="every entry")
+    scope.add_argument("--file", help="entries of this audio file")
+    scope.add_argument(
+        "--max-bytes",
+        type=int,
+        help="least recently used entries, down to this size",
+    )
+    args = parser.parse_args(args)
+
+    cache = IndexCache(args.directory)
+    if args.command == "list":
+        for entry in cache.getEntries():
+            print(
+                "%s  %-8s %10s  %s  sr=%d duration=%g"
+                % (
+                    time.strftime(
+                        "%Y-%m-%d %H:%M", time.localtime(entry["used"])
+                    ),
+                    entry["index"],
+                    _format_size(entry["size"]),
+                    entry["file"],
+                    entry["sr"],
+                    entry["duration"],
+                )
+            )
+    elif args.command == "stats":
+        print("directory: %s" % (cache.directory))
+        print("entries:   %d" % (len(cache.getEntries())))
+        print("size:      %s" % (_format_size(cache.getSize())))
+    elif args.max_bytes is not None:
+        print("removed %d entries" % (cache.evict(args.max_bytes)))
+    else:
+        print("removed %d entries" % (cache.purge(args.file)))
+
+
+if __name__ == "__main__":
+    main()
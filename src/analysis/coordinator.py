@@ -1,14 +1,39 @@
 # coordinate multiple analyzers in parallel
 
+import asyncio
 import os
-from concurrent.futures import ProcessPoolExecutor, as_completed
-from typing import Dict, List
+import pickle
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from functools import lru_cache
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
 import numpy as np
 import pandas as pd
-import itertools
 
 from .analyzer import Analyzer
+from .batch_analyzer import BatchAnalyzer
+from .cache import IndexCache
 from .spectrogram import Spectrogram
+from .journal import ResultJournal
+from .pool import get_executor, get_max_workers
+from .shared import SharedLayout, SharedResults, attach_results
+from .pyramid import STFTPyramid, open_pyramid
+from .store import IndexStore, save_store
+from src.tools import profiling
+from src.tools.loader import AudioStream
+from src.tools.wav import file_version
 from src.tools.interfaces import (
     ICoordinator,
     ISpectrogram,
@@ -16,52 +41,214 @@ from src.tools.interfaces import (
     IAudioSegment,
 )
 
+supported_indices = [
+    "Ht",
+    "M",
+    "BgN",
+    "SNR",
+    "AcAct",
+    "AEFrac",
+    "AEDur",
+    "Hf",
+    "HfVar",
+    "HfMax",
+    "SpDiv",
+    "SpAct",
+    "ACI",
+    "AEI",
+    "BioI",
+    "LFreqCov",
+    "MFreqCov",
+    "HFreqCov",
+    "NDSI",
+    "ARI",
+    "H",
+]
+
+
+StreamSource = Tuple[str, int, float, Tuple[float, float], str, bool]
+
+
+# everything a worker needs to analyse some segments of a recording
+class SegmentJob(NamedTuple):
+    source: StreamSource
+    segments: Tuple[int, ...]
+    indices: Tuple[str, ...]
+    layout: SharedLayout
+    # record the time spent in each stage of the analysis
+    profile: bool = False
+
+
+# a segment's results as its analysis finishes
+class SegmentEvent(NamedTuple):
+    segment: int
+    result: Dict[str, np.ndarray]
+    errors: List[Tuple[str, Exception]]
+    # seconds since the analysis started, and since the segment's job
+    # was submitted
+    elapsed: float
+    latency: float
+    # seconds a worker spent on the segment
+    compute_time: float
+
 
 class AnalysisCoordinator(ICoordinator):
-    def __init__(self, stream: IAudioStream):
+    def __init__(
+        self,
+        stream: IAudioStream,
+        max_workers: Optional[int] = None,
+        max_pending: Optional[int] = None,
+        batch_size: int = 4,
+        cache: Optional[IndexCache] = None,
+    ):
         self.stream = stream
         self.spectrogram = Spectrogram({}, sr=stream.sr)
+        # workers of the shared pool kept busy by this coordinator
+        self.max_workers = max_workers or get_max_workers()
+        # cap on batches in flight, so memory doesn't grow with file length
+        self.max_pending = max_pending or 2 * self.max_workers
+        # segments analysed together, sharing vectorised index calculations
+        self.batch_size = batch_size
+        # results of earlier analyses of the same audio and parameters
+        self.cache = cache
+        # set to stop the analysis running
+        self._cancelled = threading.Event()
+
+    # copies, e.g. sent to another process, start without a run to cancel
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        del state["_cancelled"]
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._cancelled = threading.Event()
 
     def calculateSegment(self, i: int, *indices: str) -> Dict[str, np.ndarray]:
-        segment = next(itertools.islice(self.stream, i, None))
+        segment = self.stream.getSegment(i)
         analyzer = Analyzer(segment)
         result, log = analyzer.calculateIndices(*indices)
-        for (index, exc) in log:
-            print(
-                "Segment starting at %r generated an exception for index %s: %s"
-                % (
-                    self.stream.segmentToTimestamp(i),
-                    index,
-                    exc,
-                ),
-                flush=True,
-            )
+        self.reportErrors(i, log)
         return result
 
-    def calculateIndices(self, *indices: str) -> ISpectrogram:
-        supported_indices = [
-            "Ht",
-            "M",
-            "BgN",
-            "SNR",
-            "AcAct",
-            "AEFrac",
-            "AEDur",
-            "Hf",
-            "HfVar",
-            "HfMax",
-            "SpDiv",
-            "SpAct",
-            "ACI",
-            "AEI",
-            "BioI",
-            "LFreqCov",
-            "MFreqCov",
-            "HFreqCov",
-            "NDSI",
-            "ARI",
-            "H",
-        ]
+    def calculateIndices(
+        self, *indices: str, journal: Optional[ResultJournal] = None
+    ) -> ISpectrogram:
+        for event in self.iterSegments(*indices, journal=journal):
+            self.reportErrors(event.segment, event.errors)
+        return self.spectrogram
+
+    # analyse the segments, yielding each one's results as it finishes;
+    # meanwhile the spectrogram shows the results as they are written
+    def iterSegments(
+        self, *indices: str, journal: Optional[ResultJournal] = None
+    ) -> Iterator[SegmentEvent]:
+        # a flag of the run's own, made before the generator first runs so
+        # a cancel arriving in between isn't lost
+        self._cancelled = threading.Event()
+        return self._iterSegments(self._cancelled, indices, journal)
+
+    def _iterSegments(
+        self,
+        cancelled: threading.Event,
+        indices: Sequence[str],
+        journal: Optional[ResultJournal],
+    ) -> Iterator[SegmentEvent]:
+        start = time.perf_counter()
+        indices, results, pending = self.prepareIndices(
+            *indices, journal=journal
+        )
+        for index, result in results.results.items():
+            self.spectrogram.addIndex(index, result)
+        jobs = self.getJobs(pending, indices, results.getLayout())
+        futures_to_job: Dict[Future, SegmentJob] = {}
+        submitted: Dict[Future, float] = {}
+        failed_indices: Set[str] = set()
+        executor = get_executor()
+        finished = False
+        try:
+            while not cancelled.is_set():
+                while len(futures_to_job) < self.max_pending:
+                    job = next(jobs, None)
+                    if job is None:
+                        break
+                    future = executor.submit(calculate_segments, job)
+                    futures_to_job[future] = job
+                    submitted[future] = time.perf_counter()
+                if not futures_to_job:
+                    break
+                # wake up now and then to notice cancellation
+                done, _ = wait(
+                    futures_to_job,
+                    timeout=CANCEL_POLL,
+                    return_when=FIRST_COMPLETED,
+                )
+                for future in done:
+                    job = futures_to_job.pop(future)
+                    events = self.collectSegments(
+                        future,
+                        job,
+                        results,
+                        journal,
+                        submitted.pop(future),
+                        start,
+                    )
+                    for event in events:
+                        failed_indices.update(
+                            index for (index, _) in event.errors
+                        )
+                        yield event
+            finished = not cancelled.is_set()
+        finally:
+            if not finished:
+                # stopped early, so keep none of the partial results
+                for future in futures_to_job:
+                    future.cancel()
+                for index in results.results:
+                    self.spectrogram.removeIndex(index)
+                results.release()
+        if finished:
+            self.finishIndices(results, failed_indices)
+
+    # stop an analysis running in another thread, dropping its results;
+    # segments already analysed remain in its journal
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    # iterSegments for asyncio, analysing in a thread of the event loop
+    async def aiterSegments(
+        self, *indices: str, journal: Optional[ResultJournal] = None
+    ) -> AsyncIterator[SegmentEvent]:
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+
+        # started here, so cancelling before the thread runs stops it
+        events = self.iterSegments(*indices, journal=journal)
+
+        def produce():
+            try:
+                for event in events:
+                    loop.call_soon_threadsafe(queue.put_nowait, event)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, None)
+
+        producer = loop.run_in_executor(None, produce)
+        try:
+            while True:
+                event = await queue.get()
+                if event is None:
+                    break
+                yield event
+        finally:
+            if not producer.done():
+                self.cancel()
+            await producer
+
+    # indices still to calculate, their shared result matrices (filled in
+    # from the journal when resuming) and the segments still to analyse
+    def prepareIndices(
+        self, *indices: str, journal: Optional[ResultJournal] = None
+    ) -> Tuple[List[str], SharedResults, List[int]]:
         uncalculated_indices = [
             index
             for index in indices
@@ -69,53 +256,159 @@ class AnalysisCoordinator(ICoordinator):
         ]
         if any([i not in supported_indices for i in uncalculated_indices]):
             raise ValueError("Unsupported acoustic indices were specified.")
-
-        results = {
-            index: np.zeros((self.stream.getNumberOfSegments(), 256))
+        cached_indices = self.loadCachedIndices(*uncalculated_indices)
+        uncalculated_indices = [
+            index
             for index in uncalculated_indices
-        }
-        analyzers = [Analyzer(segment) for segment in self.stream]
-        with ProcessPoolExecutor() as executor:
-            futures_to_segment = {
-                executor.submit(
-                    analyzer.calculateIndices, *uncalculated_indices
-                ): i
-                for i, analyzer in enumerate(analyzers)
-            }
-            for future in as_completed(futures_to_segment):
-                segment_number = futures_to_segment[future]
-                try:
-                    result, log = future.result()
-                    for index in result:
-                        results[index][segment_number] = result[index]
-                    for (index, exc) in log:
-                        print(
-                            "Segment starting at %r generated an exception for index %s: %s"
-                            % (
-                                self.stream.segmentToTimestamp(segment_number),
-                                index,
-                                exc,
-                            )
-                        )
-                except Exception as exc:
-                    print(
-                        "Segment starting at %r generated an exception: %s"
-                        % (
-                            self.stream.segmentToTimestamp(segment_number),
-                            exc,
-                        ),
-                        flush=True,
-                    )
-        for index, result in results.items():
-            self.spectrogram.addIndex(index, result)
+            if index not in cached_indices
+        ]
+
+        results = SharedResults(
+            uncalculated_indices, (self.stream.getNumberOfSegments(), 256)
+        )
+        pending = list(range(self.stream.getNumberOfSegments()))
+        if not uncalculated_indices:
+            pending = []
+        elif journal is not None:
+            # resume, skipping segments already journalled
+            completed = journal.getCompleted(uncalculated_indices)
+            for i in completed:
+                for index in uncalculated_indices:
+                    results.results[index][i] = journal.getResults()[i][index]
+            pending = [i for i in pending if i not in completed]
+        return uncalculated_indices, results, pending
+
+    # workers decode their own segments from the file and write their
+    # results to the shared matrices, so only the stream parameters,
+    # segment numbers and names of the matrices are sent with each task
+    def getJobs(
+        self, pending: List[int], indices: List[str], layout: SharedLayout
+    ) -> Iterator[SegmentJob]:
+        source = stream_source(self.stream)
+        # smaller batches when there are too few segments to keep every
+        # worker busy, so short recordings are spread over the pool
+        batch_size = max(
+            min(self.batch_size, -(-len(pending) // self.max_workers)), 1
+        )
+        return (
+            SegmentJob(
+                source,
+                tuple(pending[start : start + batch_size]),
+                tuple(indices),
+                layout,
+                profiling.is_enabled(),
+            )
+            for start in range(0, len(pending), batch_size)
+        )
+
+    # add copies of the calculated results to the spectrogram, replacing
+    # any views of the shared matrices, then free them
+    def finishIndices(
+        self, results: SharedResults, failed_indices: Set[str]
+    ) -> ISpectrogram:
+        with profiling.stage("assemble") as entry:
+            for index, result in results.copy().items():
+                self.spectrogram.addIndex(index, result)
+                entry["bytes"] += result.nbytes
+                # results with failed segments are calculated again next time
+                if self.cache is not None and index not in failed_indices:
+                    self.cache.put(self.stream, index, result)
+            results.release()
         return self.spectrogram
 
+    # add cached results of the indices, returning those that were found
+    def loadCachedIndices(self, *indices: str) -> List[str]:
+        if self.cache is None:
+            return []
+        found = []
+        for index in indices:
+            result = self.cache.get(self.stream, index)
+            if result is not None:
+                self.spectrogram.addIndex(index, result)
+                found.append(index)
+        return found
+
+    # events for the segments of a finished job, journalling their results
+    def collectSegments(
+        self,
+        future: Future,
+        job: SegmentJob,
+        results: SharedResults,
+        journal: Optional[ResultJournal],
+        submitted: float,
+        start: float,
+    ) -> List[SegmentEvent]:
+        now = time.perf_counter()
+        try:
+            tokens, records = future.result()
+        except Exception as exc:
+            # every index of the job's segments failed
+            tokens = [
+                ([], [(index, exc) for index in job.indices], 0.0)
+                for _ in job.segments
+            ]
+            records = []
+        if profiling.is_enabled():
+            profiling.extend(records)
+            # time between processes: queueing, pickling and transfer
+            compute_time = sum(seconds for (_, _, seconds) in tokens)
+            profiling.record(
+                "ipc",
+                max(now - submitted - compute_time, 0.0),
+                nbytes=len(pickle.dumps(job)) + len(pickle.dumps(tokens)),
+                segments=list(job.segments),
+            )
+        events = []
+        with profiling.stage("collect") as entry:
+            for segment_number, (written, log, seconds) in zip(
+                job.segments, tokens
+            ):
+                result = results.copy(segment_number, written)
+                # the spectrogram views the rows the workers wrote
+                self.spectrogram.invalidate(*written)
+                if journal is not None:
+                    journal.append(segment_number, result)
+                entry["bytes"] += sum(
+                    value.nbytes for value in result.values()
+                )
+                events.append(
+                    SegmentEvent(
+                        segment_number,
+                        result,
+                        log,
+                        now - start,
+                        now - submitted,
+                        seconds,
+                    )
+                )
+        return events
+
+    # print the exceptions raised by indices of a segment, returning them
+    def reportErrors(
+        self, segment_number: int, log: List[Tuple[str, Exception]]
+    ) -> Set[str]:
+        for (index, exc) in log:
+            print(
+                "Segment starting at %r generated an exception for index %s: %s"
+                % (
+                    self.stream.segmentToTimestamp(segment_number),
+                    index,
+                    exc,
+                ),
+                flush=True,
+            )
+        return {index for (index, _) in log}
+
     def loadIndices(self, path: str) -> ISpectrogram:
-        _, ext = os.path.splitext(path)
-        if ext.lower() != ".csv":
-            raise ValueError("file is not a .csv: %s" % (path))
+        ext = _results_format(path)
         if not os.path.exists(path):
             raise ValueError("file doesn't exist: %s" % (path))
+        if ext == IndexStore.extension:
+            # indices are mapped, only read as they are displayed
+            loaded = IndexStore(path).toSpectrogram()
+            for index in loaded.getIndices():
+                self.spectrogram.addIndex(index, loaded.getResult(index))
+            return self.spectrogram
         df = pd.read_csv(path, header=[0, 1], index_col=0)
         if df.index.nlevels != 1 or df.columns.nlevels != 2:
             raise ValueError(
@@ -134,9 +427,12 @@ class AnalysisCoordinator(ICoordinator):
         return self.spectrogram
 
     def saveIndices(self, path: str) -> None:
-        _, ext = os.path.splitext(path)
-        if ext.lower() != ".csv":
-            raise ValueError("file is not a .csv: %s" % (path))
+        if _results_format(path) == IndexStore.extension:
+            save_store(path, self.spectrogram, self.getMetadata())
+        else:
+            self._exportCSV(path)
+
+    def _exportCSV(self, path: str) -> None:
         acoustic_indices = self.spectrogram.getIndices()
         time_indices = [
             self.stream.segmentToTimestamp(t)
@@ -147,17 +443,114 @@ class AnalysisCoordinator(ICoordinator):
         col_index = pd.MultiIndex.from_product(
             [time_indices, acoustic_indices], names=["time", "index"]
         )
-        df = pd.DataFrame(0, index=row_index, columns=col_index)
-        for index in acoustic_indices:
-            result = pd.DataFrame(
-                self.spectrogram.getResult(index).transpose(),
-                index=row_index,
-                columns=pd.MultiIndex.from_product(
-                    [time_indices, [index]], names=["time", "index"]
-                ),
-            )
-            df.loc[:, pd.IndexSlice[:, index]] = result  # type: ignore
+        # (frequencies, time x index) columns, in the order of col_index
+        results = np.stack(
+            [self.spectrogram.getResult(i) for i in acoustic_indices], axis=2
+        )
+        df = pd.DataFrame(
+            results.transpose(1, 0, 2).reshape(len(freq_indices), -1),
+            index=row_index,
+            columns=col_index,
+        )
         df.to_csv(path)
 
-    def getSTFT(self, n_fft: int = 2048, hop_length: int = 1024) -> np.ndarray:
-        return self.stream.createSTFT(n_fft, hop_length)
+    # description of the analysis, kept with saved and journalled results
+    def getMetadata(self) -> Dict[str, Any]:
+        return {
+            "file": self.stream.file,
+            "sr": self.stream.sr,
+            "duration": self.stream.segment_duration,
+            "time_limits": [float(t) for t in self.stream.time_limits],
+            "segments": self.stream.getNumberOfSegments(),
+        }
+
+    # backed by a memory-mapped .npy if a path is given
+    def getSTFT(
+        self,
+        n_fft: int = 2048,
+        hop_length: int = 1024,
+        path: Optional[str] = None,
+    ) -> np.ndarray:
+        return self.stream.createSTFT(n_fft, hop_length, path)
+
+    # tiled multi-resolution stft for zoomable views, built at path unless
+    # a pyramid of the same stft is already there
+    def getSTFTPyramid(
+        self,
+        path: str,
+        n_fft: int = 2048,
+        hop_length: int = 1024,
+        **kwargs: Any,
+    ) -> STFTPyramid:
+        return open_pyramid(self.stream, path, n_fft, hop_length, **kwargs)
+
+
+# results are kept in an index store, or exported to a wide .csv
+def _results_format(path: str) -> str:
+    _, ext = os.path.splitext(path.rstrip(os.sep))
+    if ext.lower() not in (IndexStore.extension, ".csv"):
+        raise ValueError(
+            "file is not a %s or .csv: %s" % (IndexStore.extension, path)
+        )
+    return ext.lower()
+
+
+def stream_source(stream: IAudioStream) -> StreamSource:
+    return (
+        stream.file,
+        stream.sr,
+        stream.segment_duration,
+        tuple(stream.time_limits),
+        stream.backend,
+        stream.denoise,
+    )
+
+
+# how often a waiting analysis checks whether it was cancelled (s)
+CANCEL_POLL = 0.1
+
+
+# each worker keeps its recently used streams (and their file maps) open,
+# until their file is rewritten
+def _open_stream(source: StreamSource) -> IAudioStream:
+    return _open_stream_version(source, file_version(source[0]))
+
+
+@lru_cache(maxsize=8)
+def _open_stream_version(
+    source: StreamSource, version: Tuple[int, int]
+) -> IAudioStream:
+    return AudioStream(*source)
+
+
+# write the results of the job's segments to the shared matrices,
+# returning the indices written, the log and the seconds spent on each,
+# and the worker's profiling records
+def calculate_segments(
+    job: SegmentJob,
+) -> Tuple[
+    List[Tuple[List[str], List[Tuple[str, Exception]], float]],
+    List[profiling.Record],
+]:
+    start = time.perf_counter()
+    profiling.enable(job.profile)
+    stream = _open_stream(job.source)
+    segments = []
+    for i in job.segments:
+        with profiling.tags(segment=i):
+            segments.append(stream.getSegment(i))
+    analyzer = BatchAnalyzer(segments, job.segments)
+    try:
+        batch_results = analyzer.calculateIndices(*job.indices)
+    finally:
+        analyzer.release()
+    with profiling.stage("write") as entry:
+        with attach_results(job.layout) as shared:
+            for i, (result, _) in zip(job.segments, batch_results):
+                for index in result:
+                    shared[index][i] = result[index]
+                    entry["bytes"] += result[index].nbytes
+    # segments of a batch are analysed together, so share the time evenly
+    seconds = (time.perf_counter() - start) / len(job.segments)
+    tokens = [(list(result), log, seconds) for result, log in batch_results]
+    return tokens, profiling.drain()
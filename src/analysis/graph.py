@@ -0,0 +1,55 @@
+# per-segment computation graph, computing each intermediate result once
+
+from typing import Any, Callable, Dict, Tuple, Union
+
+from src.tools import profiling
+from src.tools.interfaces import IAudioSegment
+
+# a dependency is a node name, or (node name, position) to select one
+# element of a node that returns several values
+Dependency = Union[str, Tuple[str, int]]
+Node = Tuple[Callable, Dict[str, Dependency]]
+
+
+class ComputationGraph:
+    def __init__(self, segment: IAudioSegment, nodes: Dict[str, Node]):
+        self.segment = segment
+        self.nodes = nodes
+        self._values: Dict[str, Any] = {}
+        self.hits: Dict[str, int] = {}
+        self.misses: Dict[str, int] = {}
+
+    def get(self, dependency: Dependency) -> Any:
+        if isinstance(dependency, tuple):
+            name, position = dependency
+            return self.get(name)[position]
+        name = dependency
+        if name in self._values:
+            self.hits[name] = self.hits.get(name, 0) + 1
+            return self._values[name]
+        # compute the node from its (memoised) inputs
+        function, dependencies = self.nodes[name]
+        inputs = {
+            argument: self.get(input_dependency)
+            for argument, input_dependency in dependencies.items()
+        }
+        self.misses[name] = self.misses.get(name, 0) + 1
+        with profiling.stage("node", name) as entry:
+            value = function(self.segment, **inputs)
+            entry["bytes"] = getattr(value, "nbytes", 0)
+        self._values[name] = value
+        return value
+
+    # provide a node's value computed elsewhere, e.g. for a batch of segments
+    def set(self, name: str, value: Any) -> None:
+        self._values[name] = value
+
+    def clear(self) -> None:
+        self._values = {}
+
+    # (hits, misses) per node; misses count how often a node was computed
+    def getCacheStats(self) -> Dict[str, Tuple[int, int]]:
+        return {
+            name: (self.hits.get(name, 0), self.misses.get(name, 0))
+            for name in set(self.hits) | set(self.misses)
+        }
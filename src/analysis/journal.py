@@ -0,0 +1,137 @@
+# append-only journal of per-segment index results, so an analysis can
+# be checkpointed as segments finish and resumed after a crash
+
+import json
+import os
+import struct
+import zlib
+from typing import Any, Dict, Iterable, Iterator, Set, Tuple
+
+import numpy as np
+
+from .spectrogram import Spectrogram
+from .store import IndexStore, save_store
+from src.tools.interfaces import ISpectrogram
+
+_MAGIC = b"INDEXJOURNAL1\n"
+_LENGTH = struct.Struct("<I")
+# segment number and body length, then the body and its crc32
+_RECORD = struct.Struct("<qI")
+_CRC = struct.Struct("<I")
+
+
+class ResultJournal:
+    def __init__(self, path: str, metadata: Dict[str, Any]):
+        self.path = path
+        # as it reads back from the header
+        self.metadata = json.loads(json.dumps(metadata))
+        self._records: Dict[int, Dict[str, np.ndarray]] = {}
+        if os.path.exists(path):
+            self._load()
+        else:
+            with open(path, "wb") as f:
+                header = json.dumps(self.metadata).encode()
+                f.write(_MAGIC + _LENGTH.pack(len(header)) + header)
+        self._file = open(path, "ab")
+
+    # write a finished segment once; later records replace earlier ones
+    def append(self, i: int, result: Dict[str, np.ndarray]) -> None:
+        if not result:
+            return
+        body = b"".join(
+            _encode(index, value) for index, value in result.items()
+        )
+        self._file.write(_RECORD.pack(i, len(body)) + body)
+        self._file.write(_CRC.pack(zlib.crc32(body)))
+        self._file.flush()
+        self._records.setdefault(i, {}).update(result)
+
+    # segments with a result for every one of the indices
+    def getCompleted(self, indices: Iterable[str]) -> Set[int]:
+        indices = set(indices)
+        return {
+            i for i, result in self._records.items() if indices <= set(result)
+        }
+
+    def getResults(self) -> Dict[int, Dict[str, np.ndarray]]:
+        return self._records
+
+    # results so far, with zeros for segments not yet journalled
+    def toSpectrogram(self) -> ISpectrogram:
+        spectrogram = Spectrogram({}, sr=self.metadata["sr"])
+        for i, result in sorted(self._records.items()):
+            if not hasattr(spectrogram, "shape"):
+                bins = len(next(iter(result.values())))
+                spectrogram.shape = (self.metadata["segments"], bins)
+            spectrogram.addSegment(i, result)
+        return spectrogram
+
+    # write the journalled results to an index store
+    def compact(self, path: str) -> IndexStore:
+        return save_store(path, self.toSpectrogram(), self.metadata)
+
+    def close(self) -> None:
+        self._file.close()
+
+    def remove(self) -> None:
+        self.close()
+        os.remove(self.path)
+
+    def _load(self) -> None:
+        with open(self.path, "rb") as f:
+            data = f.read()
+        if not data.startswith(_MAGIC):
+            raise ValueError("not a result journal: %s" % (self.path))
+        (length,) = _LENGTH.unpack_from(data, len(_MAGIC))
+        start = len(_MAGIC) + _LENGTH.size
+        metadata = json.loads(data[start : start + length])
+        if metadata != self.metadata:
+            raise ValueError(
+                "journal %s was written for a different analysis: %s"
+                % (self.path, metadata)
+            )
+        end = start + length
+        for end, i, result in _read_records(data, end):
+            self._records.setdefault(i, {}).update(result)
+        # drop a record torn by a crash, so appends follow the last good one
+        if end < len(data):
+            with open(self.path, "r+b") as f:
+                f.truncate(end)
+
+
+def _read_records(
+    data: bytes, offset: int
+) -> Iterator[Tuple[int, int, Dict[str, np.ndarray]]]:
+    while offset + _RECORD.size <= len(data):
+        i, length = _RECORD.unpack_from(data, offset)
+        start = offset + _RECORD.size
+        end = start + length + _CRC.size
+        if end > len(data):
+            return
+        body = data[start : start + length]
+        if _CRC.unpack_from(data, start + length)[0] != zlib.crc32(body):
+            return
+        yield end, i, dict(_decode(body))
+        offset = end
+
+
+def _encode(index: str, value: np.ndarray) -> bytes:
+    name = index.encode()
+    value = np.ascontiguousarray(value, dtype="<f8")
+    return struct.pack("<BI", len(name), value.size) + name + value.tobytes()
+
+
+def _decode(body: bytes) -> Iterator[Tuple[str, np.ndarray]]:
+    offset = 0
+    while offset < len(body):
+        name_length, size = struct.unpack_from("<BI", body, offset)
+        offset += 5
+        name = body[offset : offset + name_length].decode()
+        offset += name_length
+        value = np.frombuffer(body, dtype="<f8", count=size, offset=offset)
+        offset += 8 * size
+        yield name, value.copy()
+
+
+def journal_path(save_file: str) -> str:
+    return save_file.rstrip(os.sep) + ".journal"
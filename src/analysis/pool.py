@@ -0,0 +1,55 @@
+# one worker pool shared by every analysis in the application, started on
+# first use, with workers that import the analysis stack as they start
+
+import atexit
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+_executor: Optional[ProcessPoolExecutor] = None
+_max_workers: Optional[int] = None
+
+
+def _warm_up() -> None:
+    # librosa, maad and scipy take seconds to import, paid once per worker
+    # rather than by the first segment it analyses
+    from . import coordinator  # noqa: F401
+
+
+# workers of the pool, from ACOUSTIC_INDICES_WORKERS or the number of cpus
+def get_max_workers() -> int:
+    if _max_workers is not None:
+        return _max_workers
+    workers = os.environ.get("ACOUSTIC_INDICES_WORKERS")
+    if workers:
+        return int(workers)
+    return os.cpu_count() or 1
+
+
+# resize the pool, restarting it on its next use if it was running
+def set_max_workers(max_workers: Optional[int]) -> None:
+    global _max_workers
+    if max_workers is not None and max_workers < 1:
+        raise ValueError("at least one worker is needed: %r" % (max_workers))
+    if max_workers != _max_workers:
+        shutdown()
+    _max_workers = max_workers
+
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=get_max_workers(), initializer=_warm_up
+        )
+    return _executor
+
+
+def shutdown(wait: bool = True) -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=wait, cancel_futures=True)
+        _executor = None
+
+
+atexit.register(shutdown)
@@ -0,0 +1,227 @@
+# multi-resolution magnitude spectrogram on disk: level 0 is the stft,
+# each further level pools `factor` frames of the one below into one (like
+# the mipmaps of an image), and every level is split into tiles of a fixed
+# number of frames, one .npy each, so a view only reads the tiles it shows
+
+import json
+import os
+import shutil
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .store import replace_file
+from src.tools.interfaces import IAudioStream
+
+_pooling = {"max": np.maximum.reduceat, "mean": np.add.reduceat}
+
+
+class STFTPyramid:
+    extension = ".pyramid"
+    version = 1
+
+    def __init__(self, path: str):
+        metadata_path = os.path.join(path, "metadata.json")
+        if not os.path.isfile(metadata_path):
+            raise ValueError("not an stft pyramid: %s" % (path))
+        with open(metadata_path) as f:
+            self.metadata: Dict[str, Any] = json.load(f)
+        if self.metadata.get("version") != self.version:
+            raise ValueError(
+                "unsupported stft pyramid version %s: %s"
+                % (self.metadata.get("version"), path)
+            )
+        self.path = path
+
+    def getLevels(self) -> int:
+        return len(self.metadata["frames"])
+
+    # number of frames of a level
+    def getFrames(self, level: int) -> int:
+        return self.metadata["frames"][level]
+
+    def getTiles(self, level: int) -> int:
+        return -(self.getFrames(level) // -self.metadata["tile_frames"])
+
+    # seconds covered by one frame of a level
+    def getFrameDuration(self, level: int) -> float:
+        return (
+            self.metadata["hop_length"]
+            * self.metadata["factor"] ** level
+            / self.metadata["sr"]
+        )
+
+    # coarsest level that still has at least one frame per pixel of a view
+    # showing the given seconds per pixel
+    def chooseLevel(self, seconds_per_pixel: float) -> int:
+        level = 0
+        while (
+            level + 1 < self.getLevels()
+            and self.getFrameDuration(level + 1) <= seconds_per_pixel
+        ):
+            level += 1
+        return level
+
+    # memory-mapped (frequencies, frames) magnitudes of one tile
+    def getTile(self, level: int, tile: int) -> np.ndarray:
+        if not 0 <= level < self.getLevels():
+            raise ValueError(
+                "level %d is not in the stft pyramid: %s" % (level, self.path)
+            )
+        if not 0 <= tile < self.getTiles(level):
+            raise ValueError(
+                "tile %d is not in level %d of the stft pyramid: %s"
+                % (tile, level, self.path)
+            )
+        return np.load(self._tilePath(level, tile), mmap_mode="r")
+
+    # magnitudes of a level between two times (s, relative to the start
+    # of the stream), read from the tiles they span, with the time of
+    # their first frame
+    def getRange(
+        self, level: int, start: float, end: float
+    ) -> Tuple[np.ndarray, float]:
+        duration = self.getFrameDuration(level)
+        tile_frames = self.metadata["tile_frames"]
+        first = min(max(int(start // duration), 0), self.getFrames(level))
+        last = min(max(int(-(-end // duration)), first), self.getFrames(level))
+        tiles = [
+            self.getTile(level, tile)
+            for tile in range(first // tile_frames, -(-last // tile_frames))
+        ]
+        if not tiles:
+            return np.empty((self.metadata["bins"], 0), np.float32), start
+        offset = (first // tile_frames) * tile_frames
+        S = np.concatenate(tiles, axis=1)[:, first - offset : last - offset]
+        return S, first * duration
+
+    def matches(self, metadata: Dict[str, Any]) -> bool:
+        return all(self.metadata.get(key) == metadata[key] for key in metadata)
+
+    def _tilePath(self, level: int, tile: int) -> str:
+        return tile_path(self.path, level, tile)
+
+
+def tile_path(path: str, level: int, tile: int) -> str:
+    return os.path.join(path, str(level), "%06d.npy" % (tile))
+
+
+# frames of each level, down to the first one that fits in a tile
+def count_frames(frames: int, tile_frames: int, factor: int) -> List[int]:
+    counts = [frames]
+    while counts[-1] > tile_frames:
+        counts.append(-(counts[-1] // -factor))
+    return counts
+
+
+# pool every `factor` frames of a (frequencies, frames) array into one,
+# the last group holding whatever frames are left
+def pool_frames(S: np.ndarray, factor: int, pooling: str) -> np.ndarray:
+    starts = np.arange(0, S.shape[1], factor)
+    pooled = _pooling[pooling](S, starts, axis=1)
+    if pooling == "mean":
+        sizes = np.minimum(factor, S.shape[1] - starts)
+        pooled /= sizes.astype(S.dtype)
+    return pooled
+
+
+# compute the stft of a stream block by block, writing full tiles of every
+# level as soon as they are complete so only one tile per level is held
+def build_pyramid(
+    stream: IAudioStream,
+    path: str,
+    n_fft: int = 2048,
+    hop_length: int = 1024,
+    tile_frames: int = 1024,
+    factor: int = 2,
+    pooling: str = "max",
+) -> STFTPyramid:
+    if pooling not in _pooling:
+        raise ValueError(
+            "unknown pooling %s, expected one of %s"
+            % (pooling, list(_pooling))
+        )
+    if factor < 2 or tile_frames % factor:
+        raise ValueError(
+            "tiles of %d frames can't be pooled by %d" % (tile_frames, factor)
+        )
+    metadata = pyramid_metadata(stream, n_fft, hop_length)
+    metadata.update(tile_frames=tile_frames, factor=factor, pooling=pooling)
+    frames = count_frames(metadata.pop("frames"), tile_frames, factor)
+    # drop an earlier pyramid first, so it can't be mistaken for this one
+    # if the build is interrupted
+    if os.path.isfile(os.path.join(path, "metadata.json")):
+        shutil.rmtree(path)
+    for level in range(len(frames)):
+        os.makedirs(os.path.join(path, str(level)), exist_ok=True)
+    # frames of each level not yet written, and tiles written
+    pending: List[List[np.ndarray]] = [[] for _ in frames]
+    counts = [0 for _ in frames]
+    tiles = [0 for _ in frames]
+
+    def add(level: int, S: np.ndarray, flush: bool = False) -> None:
+        if level >= len(frames):
+            return
+        if S.shape[1]:
+            pending[level].append(S)
+            counts[level] += S.shape[1]
+        while counts[level] >= tile_frames or (flush and counts[level]):
+            buffered = np.concatenate(pending[level], axis=1)
+            tile = buffered[:, :tile_frames]
+            np.save(tile_path(path, level, tiles[level]), tile)
+            tiles[level] += 1
+            rest = buffered[:, tile_frames:]
+            pending[level] = [rest] if rest.shape[1] else []
+            counts[level] = rest.shape[1]
+            add(level + 1, pool_frames(tile, factor, pooling))
+        if flush:
+            add(level + 1, np.empty((S.shape[0], 0), S.dtype), flush)
+
+    bins = 1 + n_fft // 2
+    for _, _, block in stream.iterSTFT(n_fft, hop_length):
+        add(0, block)
+    add(0, np.empty((bins, 0), np.float32), flush=True)
+    metadata.update(version=STFTPyramid.version, bins=bins, frames=frames)
+    # written last, so an interrupted build isn't mistaken for a pyramid
+    replace_file(
+        os.path.join(path, "metadata.json"),
+        lambda f: f.write(json.dumps(metadata, indent=2).encode()),
+    )
+    return STFTPyramid(path)
+
+
+# description of the stft a pyramid is built from
+def pyramid_metadata(
+    stream: IAudioStream, n_fft: int, hop_length: int
+) -> Dict[str, Any]:
+    return {
+        "file": stream.file,
+        "sr": stream.getNativeSampleRate(),
+        "time_limits": [float(t) for t in stream.time_limits],
+        "n_fft": n_fft,
+        "hop_length": hop_length,
+        "frames": stream.countSTFTFrames(n_fft, hop_length),
+    }
+
+
+# reuse the pyramid at path if it was built from the same stft
+def open_pyramid(
+    stream: IAudioStream,
+    path: str,
+    n_fft: int = 2048,
+    hop_length: int = 1024,
+    **kwargs: Any,
+) -> STFTPyramid:
+    try:
+        pyramid: Optional[STFTPyramid] = STFTPyramid(path)
+    except ValueError:
+        pyramid = None
+    metadata = pyramid_metadata(stream, n_fft, hop_length)
+    frames = metadata.pop("frames")
+    if (
+        pyramid is not None
+        and pyramid.matches(dict(metadata, **kwargs))
+        and pyramid.getFrames(0) == frames
+    ):
+        return pyramid
+    return build_pyramid(stream, path, n_fft, hop_length, **kwargs)
@@ -1,6 +1,6 @@
 # functions to calculate acoustic indices based on other calculated values
 
-from typing import List
+from typing import Optional
 
 import maad
 
@@ -9,14 +9,26 @@ from .spectral_indices import spectral_entropy
 from src.tools.interfaces import IAudioSegment
 
 
-def acoustic_richness_index(segment: IAudioSegment) -> float:
-    Ht = temporal_entropy(segment)
-    M = amplitude_median(segment)
+def acoustic_richness_index(
+    segment: IAudioSegment,
+    Ht: Optional[float] = None,
+    M: Optional[float] = None,
+) -> float:
+    if Ht is None:
+        Ht = temporal_entropy(segment)
+    if M is None:
+        M = amplitude_median(segment)
     ar = maad.features.acoustic_richness_index([Ht], [M])
     return ar[0]
 
 
-def acoustic_entropy(segment: IAudioSegment) -> float:
-    Ht = temporal_entropy(segment)
-    Hf, _, _ = spectral_entropy(segment)
+def acoustic_entropy(
+    segment: IAudioSegment,
+    Ht: Optional[float] = None,
+    Hf: Optional[float] = None,
+) -> float:
+    if Ht is None:
+        Ht = temporal_entropy(segment)
+    if Hf is None:
+        Hf, _, _ = spectral_entropy(segment)
     return Ht * Hf
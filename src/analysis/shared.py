@@ -0,0 +1,170 @@
+# (segments, frequencies) result matrices in shared memory, so workers
+# write their rows in place instead of sending results back to the parent
+
+import os
+import shutil
+import tempfile
+import warnings
+from contextlib import contextmanager
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+# where linux keeps shared memory, a tmpfs that may be much smaller than
+# memory (64 MB in containers by default)
+SHM_DIRECTORY = "/dev/shm"
+
+
+# what a worker needs to find the matrices: names of shared memory blocks,
+# or paths of files when the results didn't fit in shared memory
+class SharedLayout(NamedTuple):
+    shape: Tuple[int, int]
+    names: Tuple[Tuple[str, str], ...]
+    on_disk: bool = False
+
+
+class SharedResults:
+    dtype = np.float64
+
+    def __init__(
+        self,
+        indices: Iterable[str],
+        shape: Tuple[int, int],
+        on_disk: Optional[bool] = None,
+    ):
+        self.shape = tuple(shape)
+        indices = list(dict.fromkeys(indices))
+        size = max(int(np.prod(self.shape)), 1) * np.dtype(self.dtype).itemsize
+        if on_disk is None:
+            # writing past the space left in /dev/shm kills the process
+            # with SIGBUS rather than raising, so it is checked up front
+            on_disk = bool(np.prod(self.shape)) and (
+                size * len(indices) > _free_shared_memory()
+            )
+            if on_disk:
+                warnings.warn(
+                    "results don't fit in %s, mapping files instead"
+                    % (SHM_DIRECTORY),
+                    ResourceWarning,
+                )
+        self.on_disk = on_disk
+        self._blocks: Dict[str, SharedMemory] = {}
+        self._paths: Dict[str, str] = {}
+        self._directory: Optional[str] = None
+        self.results: Dict[str, np.ndarray] = {}
+        if on_disk:
+            self._directory = tempfile.mkdtemp(prefix="indices-")
+            _check_free_space(self._directory, size * len(indices))
+        for index in indices:
+            if on_disk:
+                path = os.path.join(self._directory, index + ".dat")
+                self._paths[index] = path
+                # new files read as zeros
+                result = np.memmap(
+                    path, dtype=self.dtype, mode="w+", shape=self.shape
+                )
+            else:
+                block = SharedMemory(create=True, size=size)
+                self._blocks[index] = block
+                result = np.ndarray(
+                    self.shape, dtype=self.dtype, buffer=block.buf
+                )
+                result[:] = 0
+            self.results[index] = result
+
+    def getLayout(self) -> SharedLayout:
+        if self.on_disk:
+            return SharedLayout(
+                self.shape, tuple(self._paths.items()), on_disk=True
+            )
+        return SharedLayout(
+            self.shape,
+            tuple(
+                (index, block.name) for index, block in self._blocks.items()
+            ),
+        )
+
+    # the results, or one segment's, copied out of shared memory
+    def copy(
+        self, i: Optional[int] = None, indices: Optional[Iterable[str]] = None
+    ) -> Dict[str, np.ndarray]:
+        if indices is None:
+            indices = self.results
+        if i is None:
+            return {index: np.array(self.results[index]) for index in indices}
+        return {index: np.array(self.results[index][i]) for index in indices}
+
+    # free the shared memory
+    def release(self) -> None:
+        self.results = {}
+        for block in self._blocks.values():
+            block.unlink()
+            _unclosed.append(block)
+        self._blocks = {}
+        _close_blocks()
+        if self._directory is not None:
+            # files still mapped by a view go once it does, except on
+            # windows, where they stay until the temporary files are cleared
+            shutil.rmtree(self._directory, ignore_errors=True)
+            self._directory = None
+            self._paths = {}
+
+
+# blocks released while another thread was still reading a view of them
+_unclosed: List[SharedMemory] = []
+
+
+def _close_blocks() -> None:
+    for block in list(_unclosed):
+        try:
+            block.close()
+        except BufferError:
+            # retried on the next release
+            continue
+        _unclosed.remove(block)
+
+
+# bytes left in /dev/shm, unlimited where shared memory isn't kept there
+def _free_shared_memory() -> float:
+    if not os.path.isdir(SHM_DIRECTORY):
+        return float("inf")
+    return shutil.disk_usage(SHM_DIRECTORY).free
+
+
+def _check_free_space(directory: str, size: int) -> None:
+    free = shutil.disk_usage(directory).free
+    if size > free:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise OSError(
+            "results need %d MB, but only %d MB are free in %s or %s"
+            % (size // 2**20, free // 2**20, SHM_DIRECTORY, directory)
+        )
+
+
+# the matrices of a layout, mapped for a worker to write its rows
+@contextmanager
+def attach_results(layout: SharedLayout) -> Iterator[Dict[str, np.ndarray]]:
+    if layout.on_disk:
+        blocks = []
+        results = {
+            index: np.memmap(
+                path, dtype=SharedResults.dtype, mode="r+", shape=layout.shape
+            )
+            for index, path in layout.names
+        }
+    else:
+        blocks = [SharedMemory(name=name) for _, name in layout.names]
+        results = {
+            index: np.ndarray(
+                layout.shape, dtype=SharedResults.dtype, buffer=block.buf
+            )
+            for (index, _), block in zip(layout.names, blocks)
+        }
+    try:
+        yield results
+    finally:
+        # views must go before the memory they map can be closed
+        results.clear()
+        for block in blocks:
+            block.close()
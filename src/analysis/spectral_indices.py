@@ -1,14 +1,22 @@
 # functions to calculate acoustic indices given spectral information
 
-from typing import List, Tuple
+from typing import Optional, Tuple
 import maad
 import numpy as np
 
 from src.tools.interfaces import IAudioSegment
 
 
+def amplitude_spectrogram(segment: IAudioSegment) -> np.ndarray:
+    return segment.getAmplitudeSpectrogram()
+
+
+def decibel_spectrogram(segment: IAudioSegment) -> np.ndarray:
+    return segment.getDecibelSpectrogram()
+
+
 def spectral_entropy(segment: IAudioSegment) -> Tuple[float, float, float]:
-    S, _, fn = segment.getSpectrogram()
+    S, fn = segment.getBandSpectrogram((482, 8820))
     result = maad.features.spectral_entropy(S, fn, flim=(482, 8820))
     if result is not None:
         av: float
@@ -20,105 +28,141 @@ def spectral_entropy(segment: IAudioSegment) -> Tuple[float, float, float]:
     return av, var, maxima
 
 
-def spectral_diversity(segment: IAudioSegment) -> int:
-    S, _, _ = segment.getSpectrogram()
-    S_ampl = np.sqrt(S)
-    S_grouped = [
-        np.nanmean(
-            np.pad(
-                band,
-                (0, 3 - band.size % 3),
-                mode="constant",
-                constant_values=np.NaN,
-            ).reshape(-1, 3),
-            axis=1,
-        )
-        for band in S_ampl
-    ]
-    S_binary = np.vstack(
-        [
-            _remove_isolated_peaks(np.where(band > 0.07, 1, 0))
-            for band in S_grouped
-        ]
+def spectral_diversity(
+    segment: IAudioSegment,
+    S_ampl: Optional[np.ndarray] = None,
+    seed: Optional[int] = 0,
+) -> int:
+    if S_ampl is None:
+        S_ampl = amplitude_spectrogram(segment)
+    S_binary = _remove_isolated_peaks(_group_frames(S_ampl) > 0.07)
+    return _cluster_peaks(S_binary, seed)
+
+
+# mean of every 3 frames, the last group averaging what remains. as in
+# the original, which padded every band by 3 - width % 3 frames, widths
+# divisible by 3 get an empty (nan) last group, so the last full group
+# isn't an end when isolated peaks are removed
+def _group_frames(S: np.ndarray, size: int = 3) -> np.ndarray:
+    full = S.shape[1] - S.shape[1] % size
+    groups = np.mean(S[:, :full].reshape(len(S), -1, size), axis=2)
+    if full == S.shape[1]:
+        remainder = np.full((len(S), 1), np.nan)
+    else:
+        remainder = np.mean(S[:, full:], axis=1, keepdims=True)
+    return np.hstack([groups, remainder])
+
+
+# drop peaks whose neighbours in time are both empty, keeping the ends
+def _remove_isolated_peaks(S_binary: np.ndarray) -> np.ndarray:
+    neighbours = np.ones_like(S_binary, dtype=bool)
+    neighbours[:, 1:-1] = S_binary[:, :-2] | S_binary[:, 2:]
+    return S_binary & neighbours
+
+
+# jaccard similarity between every pair of boolean rows
+def _jaccard_similarity(S_binary: np.ndarray) -> np.ndarray:
+    # counts are exact in float32 below 2**24 frames
+    X = S_binary.astype(np.float32)
+    intersection = X @ X.T
+    counts = np.sum(X, axis=1)
+    union = counts[:, None] + counts[None, :] - intersection
+    return np.divide(
+        intersection, union, out=np.zeros_like(union), where=union > 0
     )
-    return _cluster_peaks(S_binary)
 
 
-def _remove_isolated_peaks(band: np.ndarray) -> np.ndarray:
-    for i in range(1, len(band) - 1):
-        if band[i - 1] == 0 and band[i + 1] == 0:
-            band[i] = 0
-    return band
-
-
-def _cluster_peaks(S_binary: np.ndarray) -> int:
-    training_set: np.ndarray = S_binary[np.count_nonzero(S_binary, axis=1) > 2]
+def _cluster_peaks(
+    S_binary: np.ndarray, seed: Optional[int] = 0, threshold: float = 0.15
+) -> int:
+    training_set = S_binary[np.count_nonzero(S_binary, axis=1) > 2]
     if len(training_set) < 9:
         return 0
-    initial_representatives = np.random.randint(len(training_set), size=2)
-    clusters: List[int] = [
-        initial_representatives[0],
-        initial_representatives[1],
-    ]
-    cluster_sizes = np.array([1, 1])
-
-    iterations = 0
-    old_cluster_sizes = None
-    while iterations < 20 and old_cluster_sizes != cluster_sizes:
-        old_cluster_sizes = cluster_sizes
-        similarity = np.zeros((len(clusters), len(training_set)))
-        for i, vector in enumerate(training_set):
-            if i not in clusters:
-                similarity = np.zeros(len(clusters))
-                for j, cluster in enumerate(clusters):
-                    representative = training_set[cluster]
-                    similarity[j] = np.sum(
-                        np.array(representative) & np.array(vector)
-                    ) / np.sum(np.array(representative) | np.array(vector))
-                cluster = np.argmax(similarity)
-                if similarity[cluster] > 0.15:
-                    clusters.append(i)
-                    np.append(cluster_sizes, 1)
-                else:
-                    cluster_sizes[cluster] += 1
-        clusters = np.array(clusters)[cluster_sizes > 1]
-        cluster_sizes = cluster_sizes[cluster_sizes > 1]
-        iterations += 1
-    cluster_sizes = cluster_sizes[cluster_sizes > 3]
-    return len(cluster_sizes)
-
-
-def spectral_activity(segment: IAudioSegment) -> np.ndarray:
-    S, _, _ = segment.getSpectrogram()
-    S_dB = maad.util.power2dB(S)
+    similarity = _jaccard_similarity(training_set)
+    rng = np.random.default_rng(seed)
+    representatives = rng.choice(len(training_set), size=2, replace=False)
+
+    previous = None
+    for _ in range(20):
+        representatives = _add_representatives(
+            similarity, representatives, threshold
+        )
+        # each vector joins the cluster of its most similar representative
+        assignment = np.argmax(similarity[:, representatives], axis=1)
+        sizes = np.bincount(assignment, minlength=len(representatives))
+        # clusters of one vector are dropped and the vector tried again
+        representatives = representatives[sizes > 1]
+        if previous is not None and np.array_equal(representatives, previous):
+            break
+        previous = representatives
+    return int(np.count_nonzero(sizes > 3))
+
+
+# vectors, in order, not similar to any representative so far become
+# representatives of new clusters
+def _add_representatives(
+    similarity: np.ndarray, representatives: np.ndarray, threshold: float
+) -> np.ndarray:
+    representatives = list(representatives)
+    best = np.max(similarity[:, representatives], axis=1, initial=-1.0)
+    best[representatives] = np.inf
+    start = 0
+    while True:
+        candidates = np.flatnonzero(best[start:] <= threshold)
+        if len(candidates) == 0:
+            break
+        i = start + candidates[0]
+        representatives.append(i)
+        best = np.maximum(best, similarity[i])
+        best[i] = np.inf
+        start = i + 1
+    return np.array(representatives, dtype=int)
+
+
+def spectral_activity(
+    segment: IAudioSegment, S_dB: Optional[np.ndarray] = None
+) -> np.ndarray:
+    if S_dB is None:
+        S_dB = decibel_spectrogram(segment)
     frac, _, _ = maad.features.spectral_activity(S_dB)
     return frac
 
 
-def acoustic_complexity_index(segment: IAudioSegment) -> np.ndarray:
-    S, _, _ = segment.getSpectrogram()
-    S_ampl = np.sqrt(S)
+def acoustic_complexity_index(
+    segment: IAudioSegment, S_ampl: Optional[np.ndarray] = None
+) -> np.ndarray:
+    if S_ampl is None:
+        S_ampl = amplitude_spectrogram(segment)
     _, bins, _ = maad.features.acoustic_complexity_index(S_ampl)
     return bins  # average across bins
 
 
-def acoustic_evenness_index(segment: IAudioSegment) -> float:
-    S, _, fn = segment.getSpectrogram()
-    S_ampl = np.sqrt(S)
+def acoustic_evenness_index(
+    segment: IAudioSegment, S_ampl: Optional[np.ndarray] = None
+) -> float:
+    _, _, fn = segment.getSpectrogram()
+    if S_ampl is None:
+        S_ampl = amplitude_spectrogram(segment)
     return maad.features.acoustic_eveness_index(S_ampl, fn)
 
 
-def bioacoustic_index(segment: IAudioSegment) -> float:
-    S, _, fn = segment.getSpectrogram()
-    S_ampl = np.sqrt(S)
+def bioacoustic_index(
+    segment: IAudioSegment, S_ampl: Optional[np.ndarray] = None
+) -> float:
+    _, _, fn = segment.getSpectrogram()
+    if S_ampl is None:
+        S_ampl = amplitude_spectrogram(segment)
     return maad.features.bioacoustics_index(S_ampl, fn, flim=(2000, 11000))
 
 
 def frequency_band_cover(
-    segment: IAudioSegment, db_threshold: int = 3
+    segment: IAudioSegment,
+    db_threshold: int = 3,
+    S_dB: Optional[np.ndarray] = None,
 ) -> Tuple[float, float, float]:
-    S, _, fn = segment.getSpectrogram()
-    S_dB = maad.util.power2dB(S)
+    _, _, fn = segment.getSpectrogram()
+    if S_dB is None:
+        S_dB = decibel_spectrogram(segment)
     low, mid, high = maad.features.spectral_cover(
         S_dB,
         fn,
@@ -1,11 +1,16 @@
 # 2d array of floats to represent long-duration spectrogram result
 
-from typing import Dict, List, Optional, Tuple
+import threading
+import warnings
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
 
 import numpy as np
 
 from src.tools.interfaces import ISpectrogram
 
+# segments converted to colours at a time, bounding the float32 buffer
+_color_block = 1024
+
 
 class Spectrogram(ISpectrogram):
     def __init__(self, result: Dict[str, np.ndarray], sr: int):
@@ -18,20 +23,104 @@ class Spectrogram(ISpectrogram):
             self.shape = shapes.pop()
         self.result = result
         self.sr = sr
+        self._color_ranges: Dict[Tuple[str, float], Tuple[float, float]] = {}
+        # ranges are read by the interface while an analysis thread
+        # invalidates them
+        self._color_ranges_lock = threading.Lock()
+
+    # copies, e.g. sent to another process, get a lock of their own
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        del state["_color_ranges_lock"]
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._color_ranges_lock = threading.Lock()
 
     def getResult(self, index: str) -> np.ndarray:
         if index not in self.result:
             raise ValueError(f"{index} not available to get.")
         return self.result[index]
 
-    def getColorResult(self, index: str) -> np.ndarray:
-        if index not in self.result:
-            raise ValueError(f"{index} not available to get.")
-        result = self.result[index]
-        result = result - np.min(result)  # lower bound is 0
-        if np.max(result) != 0:
-            result *= 1.0 / np.max(result)  # normalize to 0 to 1 for kivy RGB
-        return result
+    # values between 0 and 1 for kivy RGB, from the index's range (or its
+    # percentiles, clipping the values outside them) and optionally on a
+    # log scale
+    def getColorResult(
+        self, index: str, percentile: float = 0, log: bool = False
+    ) -> np.ndarray:
+        low, high = self.getColorRange(index, percentile)
+        result = np.asarray(self.getResult(index), dtype=float)
+        colors = np.subtract(result, low)
+        _scale_colors(colors, low, high, log)
+        return colors
+
+    # (min, max) of an index, or its (percentile, 100 - percentile), kept
+    # until its results change
+    def getColorRange(
+        self, index: str, percentile: float = 0
+    ) -> Tuple[float, float]:
+        if not 0 <= percentile < 50:
+            raise ValueError(
+                "percentile should be in [0, 50), not %s" % (percentile)
+            )
+        key = (index, percentile)
+        # held while calculating, so a range invalidated meanwhile isn't
+        # stored
+        with self._color_ranges_lock:
+            if key not in self._color_ranges:
+                self._color_ranges[key] = _color_range(
+                    self.getResult(index), percentile
+                )
+            return self._color_ranges[key]
+
+    # (frequencies, segments, rgb) bytes of three indices, laid out as a
+    # kivy texture, converted a block of segments at a time. ranges
+    # replace the range of each index, e.g. of the segments finished so far
+    def getColorImage(
+        self,
+        indices: Sequence[str],
+        segments: Union[slice, np.ndarray, None] = None,
+        ranges: Optional[Sequence[Tuple[float, float]]] = None,
+        percentile: float = 0,
+        log: bool = False,
+    ) -> np.ndarray:
+        if len(indices) != 3:
+            raise ValueError("expected (r, g, b) indices, not %s" % (indices))
+        if segments is None:
+            segments = slice(None)
+        if ranges is None:
+            ranges = [self.getColorRange(i, percentile) for i in indices]
+        results = [self.getResult(index)[segments] for index in indices]
+        num_segments, freq = results[0].shape
+        image = np.empty((freq, num_segments, 3), dtype=np.uint8)
+        # (segments, frequencies) view of each colour
+        channels = image.transpose(1, 0, 2)
+        block = np.empty((_color_block, freq), dtype=np.float32)
+        for start in range(0, num_segments, _color_block):
+            end = min(start + _color_block, num_segments)
+            colors = block[: end - start]
+            for channel, (result, (low, high)) in enumerate(
+                zip(results, ranges)
+            ):
+                np.subtract(result[start:end], low, out=colors)
+                _scale_colors(colors, low, high, log)
+                np.nan_to_num(colors, copy=False)
+                colors *= 255.999
+                channels[start:end, :, channel] = colors
+        return image
+
+    # colour ranges of results written in place, e.g. by workers into
+    # shared memory, are calculated again
+    def invalidate(self, *indices: str) -> None:
+        with self._color_ranges_lock:
+            for key in list(self._color_ranges):
+                if key[0] in indices:
+                    del self._color_ranges[key]
+
+    def removeIndex(self, index: str) -> None:
+        self.result.pop(index, None)
+        self.invalidate(index)
 
     def addSegment(self, i: int, result: Dict[str, np.ndarray]) -> None:
         if i >= self.shape[0]:
@@ -45,6 +134,7 @@ class Spectrogram(ISpectrogram):
                     "Result does not have the correct shape. Expected shape is %s. Result shape is %s."
                     % ((self.shape[1],), result[index].shape)
                 )
+            self.invalidate(index)
             if index in self.result:
                 self.result[index][i] = result[index]
             else:
@@ -60,6 +150,36 @@ class Spectrogram(ISpectrogram):
                 % (self.shape, result.shape)
             )
         self.result[index] = result
+        self.invalidate(index)
 
     def _createZeroArray(self):
         return np.zeros(shape=self.shape)
+
+
+def _color_range(result: np.ndarray, percentile: float) -> Tuple[float, float]:
+    with warnings.catch_warnings():
+        # indices that failed on every segment are all nan
+        warnings.simplefilter("ignore", RuntimeWarning)
+        if percentile:
+            low, high = np.nanpercentile(
+                result, [percentile, 100 - percentile]
+            )
+        else:
+            low, high = np.nanmin(result), np.nanmax(result)
+    if np.isnan(low) or np.isnan(high):
+        low, high = 0.0, 0.0
+    return float(low), float(high)
+
+
+# scale values already offset by low to [0, 1] in place, on a log scale
+# (of base 10 between 1 and 10) if asked
+def _scale_colors(
+    colors: np.ndarray, low: float, high: float, log: bool
+) -> None:
+    if high > low:
+        colors *= 1.0 / (high - low)
+    np.clip(colors, 0, 1, out=colors)
+    if log:
+        colors *= 9
+        np.log1p(colors, out=colors)
+        colors *= 1 / np.log(10)
@@ -0,0 +1,129 @@
+# columnar store of acoustic index results: a directory with one
+# (segments, frequencies) .npy array per index and the analysis metadata
+
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .spectrogram import Spectrogram
+from src.tools.interfaces import ISpectrogram
+
+
+class IndexStore:
+    extension = ".indices"
+    version = 1
+
+    def __init__(self, path: str):
+        metadata_path = os.path.join(path, "metadata.json")
+        if not os.path.isfile(metadata_path):
+            raise ValueError("not an index store: %s" % (path))
+        with open(metadata_path) as f:
+            self.metadata: Dict[str, Any] = json.load(f)
+        if self.metadata.get("version") != self.version:
+            raise ValueError(
+                "unsupported index store version %s: %s"
+                % (self.metadata.get("version"), path)
+            )
+        self.path = path
+
+    def getIndices(self) -> List[str]:
+        return list(self.metadata["indices"])
+
+    def getShape(self) -> Tuple[int, int]:
+        return tuple(self.metadata["shape"])  # type: ignore
+
+    # start of each segment, relative to the start of the analysed range
+    def getTimes(self) -> np.ndarray:
+        return np.arange(self.getShape()[0]) * self.metadata["duration"]
+
+    # segments starting within [start, end) seconds
+    def getSegmentRange(
+        self, start: Optional[float] = None, end: Optional[float] = None
+    ) -> slice:
+        times = self.getTimes()
+        first = 0 if start is None else np.searchsorted(times, start)
+        last = len(times) if end is None else np.searchsorted(times, end)
+        return slice(int(first), int(last))
+
+    # memory-mapped result of one index, reading only the rows sliced
+    def getResult(
+        self,
+        index: str,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+    ) -> np.ndarray:
+        if index not in self.metadata["indices"]:
+            raise ValueError("%s not in index store: %s" % (index, self.path))
+        result = np.load(self._indexPath(index), mmap_mode="r")
+        return result[self.getSegmentRange(start, end)]
+
+    def toSpectrogram(
+        self, indices: Optional[List[str]] = None
+    ) -> ISpectrogram:
+        if indices is None:
+            indices = self.getIndices()
+        # copy-on-write maps, so pages are read lazily and segments can
+        # still be added without touching the files
+        result = {
+            index: np.load(self._indexPath(index), mmap_mode="c")
+            for index in indices
+        }
+        spectrogram = Spectrogram(result, sr=self.metadata["sr"])
+        spectrogram.shape = self.getShape()
+        return spectrogram
+
+    def _indexPath(self, index: str) -> str:
+        return os.path.join(self.path, index + ".npy")
+
+
+def save_store(
+    path: str, spectrogram: ISpectrogram, metadata: Dict[str, Any]
+) -> IndexStore:
+    os.makedirs(path, exist_ok=True)
+    indices = spectrogram.getIndices()
+    for index in indices:
+        # results loaded from this store map the files about to be
+        # replaced, which windows refuses while they are mapped, so they
+        # are read into memory and the maps released first
+        if _maps_file(spectrogram.getResult(index), path):
+            spectrogram.addIndex(index, np.array(spectrogram.getResult(index)))
+    for index in indices:
+        replace_file(
+            os.path.join(path, index + ".npy"),
+            lambda f: np.save(f, spectrogram.getResult(index)),
+        )
+    metadata = dict(
+        metadata,
+        version=IndexStore.version,
+        indices=indices,
+        shape=list(getattr(spectrogram, "shape", (0, 0))),
+        sr=spectrogram.sr,
+    )
+    replace_file(
+        os.path.join(path, "metadata.json"),
+        lambda f: f.write(json.dumps(metadata, indent=2).encode()),
+    )
+    return IndexStore(path)
+
+
+# whether an array, or the array it views, maps a file in a directory
+def _maps_file(result: np.ndarray, directory: str) -> bool:
+    while result is not None:
+        filename = getattr(result, "filename", None)
+        if filename is not None and os.path.dirname(
+            os.path.abspath(filename)
+        ) == os.path.abspath(directory):
+            return True
+        result = result.base if isinstance(result, np.ndarray) else None
+    return False
+
+
+# write through a temporary file, as the old file may be memory-mapped
+# or read concurrently
+def replace_file(path: str, write) -> None:
+    temporary = "%s.%d.tmp" % (path, os.getpid())
+    with open(temporary, "wb") as f:
+        write(f)
+    os.replace(temporary, path)
@@ -1,6 +1,6 @@
 # functions to calculate acoustic indices given time audio
 
-from typing import Tuple
+from typing import Optional, Tuple
 
 import maad
 import numpy as np
@@ -8,9 +8,32 @@ import numpy as np
 from src.tools.interfaces import IAudioSegment
 
 
-def temporal_entropy(segment: IAudioSegment, frame_size: int = 512) -> float:
-    x = segment.data
-    result = maad.features.temporal_entropy(x, Nt=frame_size)
+# maximum absolute amplitude of each frame of the raw signal
+def temporal_envelope(
+    segment: IAudioSegment, frame_size: int = 512
+) -> np.ndarray:
+    return maad.sound.envelope(segment.data, Nt=frame_size)
+
+
+# median envelope level in dB, maad's temporal background noise estimate
+def temporal_background(
+    segment: IAudioSegment,
+    frame_size: int = 512,
+    envelope: Optional[np.ndarray] = None,
+) -> float:
+    if envelope is None:
+        envelope = temporal_envelope(segment, frame_size)
+    return np.median(maad.util.power2dB(envelope**2))
+
+
+def temporal_entropy(
+    segment: IAudioSegment,
+    frame_size: int = 512,
+    envelope: Optional[np.ndarray] = None,
+) -> float:
+    if envelope is None:
+        envelope = temporal_envelope(segment, frame_size)
+    result = maad.util.entropy(envelope**2)
     if result is None:
         return 0.0
     return float(result)
@@ -32,21 +55,37 @@ def signal_to_noise_ratio(segment: IAudioSegment) -> float:
 
 
 def acoustic_activity(
-    segment: IAudioSegment, db_threshold: int = 3, frame_size: int = 512
+    segment: IAudioSegment,
+    db_threshold: int = 3,
+    frame_size: int = 512,
+    envelope: Optional[np.ndarray] = None,
+    background: Optional[float] = None,
 ) -> float:
-    x = segment.data
-    frac, _, _ = maad.features.temporal_activity(
-        x, dB_threshold=db_threshold, Nt=frame_size
-    )
-    return frac
+    if envelope is None:
+        envelope = temporal_envelope(segment, frame_size)
+    if background is None:
+        background = temporal_background(segment, frame_size, envelope)
+    # same as maad.features.temporal_activity, reusing the envelope
+    env_dB = maad.util.amplitude2dB(envelope) - background
+    return np.sum(env_dB >= db_threshold) / len(env_dB)
 
 
 def acoustic_event_proportion_and_duration(
-    segment: IAudioSegment, db_threshold: int = 3, frame_size: int = 512
-):
-    x = segment.data
-    sr = segment.sr
-    frac, dur, _, _ = maad.features.temporal_events(
-        x, sr, dB_threshold=db_threshold, Nt=frame_size
-    )
-    return float(frac), dur
+    segment: IAudioSegment,
+    db_threshold: int = 3,
+    frame_size: int = 512,
+    envelope: Optional[np.ndarray] = None,
+    background: Optional[float] = None,
+) -> Tuple[float, float]:
+    if envelope is None:
+        envelope = temporal_envelope(segment, frame_size)
+    if background is None:
+        background = temporal_background(segment, frame_size, envelope)
+    # same as maad.features.temporal_events, reusing the envelope
+    dt = 1 / segment.sr * frame_size
+    env_dB = 10 * np.log10(envelope**2) - background
+    events = np.diff(np.concatenate([[0], env_dB >= db_threshold, [0]]))
+    lengths = np.flatnonzero(events == -1) - np.flatnonzero(events == 1)
+    total = np.sum(lengths) * dt
+    dur = np.mean(lengths) * dt if total != 0 else 0
+    return float(total / (dt * len(env_dB))), dur
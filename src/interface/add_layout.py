@@ -4,11 +4,15 @@ from kivy.properties import ObjectProperty
 from kivy.lang import Builder
 
 from . import custom_button, error_popup
+from src.analysis.store import IndexStore
 
 import os
 
 Builder.load_file("src/interface/layouts/add_layout.kv")
 
+# index stores are directories; .csv is kept for exporting
+results_formats = (IndexStore.extension, ".csv")
+
 
 class AddLayout(Screen):
     audio_file = ObjectProperty()
@@ -41,17 +45,19 @@ class AddLayout(Screen):
             if not os.path.exists(audio_file):
                 raise ValueError("audio file doesn't exist")
             if use_csv:
-                _, csv_file_ext = os.path.splitext(csv_file)
-                if csv_file_ext.lower() != ".csv":
-                    raise ValueError("csv file is not a .csv")
+                _, csv_file_ext = os.path.splitext(csv_file.rstrip(os.sep))
+                if csv_file_ext.lower() not in results_formats:
+                    raise ValueError("indices file is not a .indices or .csv")
                 if not os.path.exists(csv_file):
-                    raise ValueError("csv file doesn't exist")
+                    raise ValueError("indices file doesn't exist")
             if save_csv:
-                save_path, save_file_ext = os.path.splitext(save_file)
+                save_path, save_file_ext = os.path.splitext(
+                    save_file.rstrip(os.sep)
+                )
                 if save_file_ext == "":
-                    save_file_ext = ".csv"
-                if save_file_ext != ".csv":
-                    raise ValueError("save file is not a .csv")
+                    save_file_ext = IndexStore.extension
+                if save_file_ext.lower() not in results_formats:
+                    raise ValueError("save file is not a .indices or .csv")
                 save_file = save_path + save_file_ext
 
             self.manager.transition.direction = "left"
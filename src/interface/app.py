@@ -8,9 +8,20 @@ from kivy.app import App
 from kivy.properties import ObjectProperty
 from kivy.lang import Builder
 
-from . import layout_manager, toolbar
+from . import frame_layout, layout_manager, toolbar
+from src.analysis import pool
+from src.tools import profiling
 
 
 class MyApp(App):
     def build(self):
         return Builder.load_file("src/interface/layouts/app.kv")
+
+    def on_stop(self):
+        # interrupted analyses keep their journals, and the pool doesn't
+        # wait for segments still being analysed
+        frame_layout.cancel_all()
+        pool.shutdown(wait=False)
+        # enabled by setting ACOUSTIC_INDICES_PROFILE
+        if profiling.is_enabled():
+            print(profiling.format_summary())
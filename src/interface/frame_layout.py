@@ -4,14 +4,26 @@ from kivy.properties import ObjectProperty, NumericProperty, StringProperty
 from kivy.lang import Builder
 from kivy.clock import Clock
 
-from multiprocessing.pool import Pool
+import threading
 import traceback
+import weakref
+from functools import partial
 
 Builder.load_file("src/interface/layouts/frame_layout.kv")
 
 from . import spectrogram, custom_button
+from src.analysis.journal import ResultJournal, journal_path
+from src.tools import profiling
 from src.tools.interfaces import IAudioStream, ICoordinator
 
+# frames alive, to cancel their analyses when the application stops
+_frames = weakref.WeakSet()
+
+
+def cancel_all():
+    for frame in list(_frames):
+        frame.cancelIndices()
+
 
 class FrameLayout(BoxLayout):
     spectrogram = ObjectProperty()
@@ -30,7 +42,11 @@ class FrameLayout(BoxLayout):
     ):
         self.stream = stream
         self.coordinator = coordinator
-        self._pool = Pool(processes=6)
+        # redraw at most once a frame, however many segments finish in it
+        self._redraw = Clock.create_trigger(lambda _: self._showSegments())
+        self._finished = []
+        self._cancelled = False
+        _frames.add(self)
         super().__init__(**kwargs)
 
     def on_r_index(self, *args):
@@ -66,53 +82,124 @@ class FrameLayout(BoxLayout):
             self.b_index = available_indices[0]
         self.spectrogram.setSpectrogram(self.coordinator.spectrogram)
 
-    def _calculateIndicesCallback(self, results):
+    # runs in its own thread, handing each segment to the kivy thread as
+    # it finishes
+    def _analyse(self, save_csv, save_file):
+        try:
+            # looking results up in the cache hashes the whole recording
+            cached = self.coordinator.loadCachedIndices(*self._indices)
+            if set(cached) == set(self._indices):
+                if save_csv:
+                    self.coordinator.saveIndices(save_file)
+                return
+            journal = None
+            if save_csv:
+                # resume an interrupted analysis from its journal
+                journal = ResultJournal(
+                    journal_path(save_file), self.coordinator.getMetadata()
+                )
+            events = self.coordinator.iterSegments(
+                *self._indices, journal=journal
+            )
+            # cancelIndices sets the flag before cancelling the coordinator,
+            # so one arriving while the cache was read is caught here
+            if self._cancelled:
+                self.coordinator.cancel()
+            failed = False
+            for event in events:
+                failed = failed or bool(event.errors)
+                Clock.schedule_once(partial(self._segmentCallback, event))
+            if journal is not None and (failed or self._cancelled):
+                # the journal holds only the segments that succeeded, to
+                # resume from and calculate the rest again
+                journal.close()
+            elif journal is not None:
+                # checkpointed as segments finished, written once at the end
+                self.coordinator.saveIndices(save_file)
+                journal.remove()
+        except Exception as exc:
+            traceback.print_exception(exc)
+        finally:
+            Clock.schedule_once(self._analysisCallback)
+
+    def _segmentCallback(self, event, *args):
+        self.coordinator.reportErrors(event.segment, event.errors)
+        if not self._shown:
+            self._shown = True
+            # time from starting the analysis to its first results shown
+            profiling.record(
+                "first segment", event.elapsed, segment=event.segment
+            )
+        print("added segment %d" % (event.segment))
+        # the spectrogram views the results as workers write them, so only
+        # the columns of the segments finished since the last redraw change
+        self._finished.append(event.segment)
+        self._redraw()
+
+    def _analysisCallback(self, *args):
         self.processing -= 1
-        i, result, save_csv, save_file = results
-        if not hasattr(self.coordinator.spectrogram, "shape"):
-            self.coordinator.spectrogram.shape = (
-                self.stream.getNumberOfSegments(),
-                len(list(result.values())[0]),
+        self._showSpectrogram()
+
+    def _showSpectrogram(self):
+        self._finished = []
+        if self._checkIndices():
+            self.spectrogram.setSpectrogram(self.coordinator.spectrogram)
+
+    def _showSegments(self):
+        segments, self._finished = self._finished, []
+        if segments and self._checkIndices():
+            self.spectrogram.updateSegments(
+                self.coordinator.spectrogram, segments
             )
-        self.coordinator.spectrogram.addSegment(i, result)
-        print("added segment %d" % (i))
-        if save_csv:
-            self.coordinator.saveIndices(save_file)
+
+    # fall back to the first calculated index for colours without results
+    def _checkIndices(self) -> bool:
         available_indices = self.coordinator.spectrogram.getIndices()
+        if not available_indices:
+            return False
         if self.r_index not in available_indices:
             self.r_index = available_indices[0]
         if self.g_index not in available_indices:
             self.g_index = available_indices[0]
         if self.b_index not in available_indices:
             self.b_index = available_indices[0]
-        self.spectrogram.setSpectrogram(self.coordinator.spectrogram)
+        return True
 
     def calculateIndices(self, use_csv, csv_file, save_csv, save_file):
         if use_csv:
-            self._pool.apply_async(
+            self._submit(
                 _loadIndices,
-                args=(self.coordinator, csv_file, save_csv, save_file),
-                callback=self._loadIndicesCallback,
-                error_callback=lambda exc: traceback.print_exc(),
+                (self.coordinator, csv_file, save_csv, save_file),
+                self._loadIndicesCallback,
             )
             self.processing += 1
         else:
-            for i in range(self.stream.getNumberOfSegments()):
-                self._pool.apply_async(
-                    _calculateSegment,
-                    args=(
-                        self.coordinator,
-                        i,
-                        self.r_index,
-                        self.g_index,
-                        self.b_index,
-                        save_csv,
-                        save_file,
-                    ),
-                    callback=self._calculateIndicesCallback,
-                    error_callback=lambda exc: traceback.print_exc(),
-                )
-                self.processing += 1
+            self._indices = (self.r_index, self.g_index, self.b_index)
+            self._cancelled = False
+            self._shown = False
+            self.processing += 1
+            threading.Thread(
+                target=self._analyse, args=(save_csv, save_file), daemon=True
+            ).start()
+
+    # stop calculating indices, keeping the journal to resume from
+    def cancelIndices(self):
+        self._cancelled = True
+        self.coordinator.cancel()
+
+    # run in a thread of its own rather than the worker pool, so the
+    # coordinator isn't copied to another process and back, handing the
+    # result to the callback on the kivy thread
+    def _submit(self, function, args, callback):
+        def run():
+            try:
+                result = function(*args)
+            except Exception as exc:
+                traceback.print_exception(exc)
+                return
+            Clock.schedule_once(lambda _: callback(result))
+
+        threading.Thread(target=run, daemon=True).start()
 
     def setOffset(self, offset: int):
         true_offset = offset - self.stream.time_limits[0]
@@ -147,10 +234,3 @@ def _loadIndices(coordinator, csv_file, save_csv, save_file):
     if save_csv:
         coordinator.saveIndices(save_file)
     return coordinator.getSpectrogram()
-
-
-def _calculateSegment(
-    coordinator, i, r_index, g_index, b_index, save_csv, save_file
-):
-    result = coordinator.calculateSegment(i, r_index, g_index, b_index)
-    return (i, result, save_csv, save_file)
@@ -7,6 +7,7 @@ Builder.load_file("src/interface/layouts/main_layout.kv")
 
 from . import frame_layout
 from src.tools.loader import load_audio
+from src.analysis.cache import IndexCache
 from src.analysis.coordinator import AnalysisCoordinator
 
 
@@ -22,7 +23,7 @@ class MainLayout(Screen):
         save_csv: bool,
     ):
         stream = load_audio(audio_file)
-        coordinator = AnalysisCoordinator(stream)
+        coordinator = AnalysisCoordinator(stream, cache=IndexCache())
         frame = frame_layout.FrameLayout(stream, coordinator)
         frame.calculateIndices(use_csv, csv_file, save_csv, save_file)
         self.layout.add_widget(frame)
@@ -1,11 +1,20 @@
 # widget to represent a spectrogram drawing
-from kivy.clock import mainthread
+from kivy.clock import Clock, mainthread
 from kivy.uix.anchorlayout import AnchorLayout
-from kivy.properties import ObjectProperty, ListProperty
+from kivy.properties import (
+    BooleanProperty,
+    ListProperty,
+    NumericProperty,
+    ObjectProperty,
+)
 from kivy.lang import Builder
 from kivy.uix.image import Image
+from kivy.uix.relativelayout import RelativeLayout
+from kivy.uix.widget import Widget
 from kivy.graphics.texture import Texture
-from kivy.graphics import Color, Line
+from kivy.graphics import Color, Line, Rectangle
+
+from collections import OrderedDict
 
 import numpy as np
 
@@ -13,23 +22,55 @@ Builder.load_file("src/interface/layouts/spectrogram.kv")
 
 from src.tools.interfaces import ISpectrogram
 
+# segments per tile texture, tiles kept uploaded, and tiles either side of
+# the viewport drawn ahead of scrolling
+TILE_SEGMENTS = 256
+TILE_CACHE = 32
+PREFETCH_TILES = 1
+
 
 class Spectrogram(AnchorLayout):
     spectrogram = ObjectProperty()
     indices = ListProperty(["SpDiv", "ACI", "HfVar"])
     scrollview = ObjectProperty()
+    # clip colours to these percentiles of each index, and show them on a
+    # log scale
+    clip_percentile = NumericProperty(0)
+    log_scale = BooleanProperty(False)
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.scale = 1.0
+        # a strip as wide as the spectrogram, of which only the tiles in
+        # view are converted to colours and uploaded, most recently shown
+        # last so the cache evicts tiles scrolled away from first
+        self._strip = None
+        self._tiles: OrderedDict = OrderedDict()
+        self._shown = None
+        self._shape = None
+        # segments drawn and the (min, max) of each colour over them
+        self._drawn = np.zeros(0, dtype=bool)
+        self._ranges = _empty_ranges()
+        self._cull = Clock.create_trigger(lambda _: self._showTiles())
 
+    # show a spectrogram whose segments have all been calculated
     @mainthread
     def setSpectrogram(self, spectrogram: ISpectrogram):
         self.spectrogram = spectrogram
         self.on_spectrogram()
+        if self._strip is not None:
+            self._drawSegments(np.arange(len(self._drawn)))
 
+    # draw only the columns of segments that finished since the last call
     @mainthread
-    def setImage(self, image: Image):
+    def updateSegments(self, spectrogram: ISpectrogram, segments):
+        self.spectrogram = spectrogram
+        self.on_spectrogram()
+        if self._strip is not None:
+            self._drawSegments(np.asarray(segments, dtype=int))
+
+    @mainthread
+    def setImage(self, image: Widget):
         for child in self.scrollview.children:
             self.scrollview.remove_widget(child)
         self.scrollview.add_widget(image)
@@ -38,40 +79,201 @@ class Spectrogram(AnchorLayout):
     def setOffset(self, offset):
         pass
 
+    def on_scrollview(self, *args):
+        self.scrollview.bind(scroll_x=self._cull, size=self._cull)
+
     def on_touch_down(self, touch):
         if self.collide_point(*touch.pos):
             if touch.is_mouse_scrolling:
                 if touch.button == "scrollup":
                     self.scale = max(self.scale - 0.1, 0.5)
-                    self.on_spectrogram()
+                    self._resize()
                 elif touch.button == "scrolldown":
                     self.scale = min(self.scale + 0.1, 4)
-                    self.on_spectrogram()
+                    self._resize()
             AnchorLayout.on_touch_down(self, touch)
 
+    # new colours rescale every segment drawn so far
+    def on_indices(self, *args):
+        if self._strip is not None:
+            self._ranges = _empty_ranges()
+            self._drawSegments(np.flatnonzero(self._drawn))
+
+    def on_clip_percentile(self, *args):
+        self.on_indices()
+
+    def on_log_scale(self, *args):
+        if self._strip is not None:
+            for tile in self._tiles:
+                self._fillTile(tile)
+            self._strip.canvas.ask_update()
+
     def on_spectrogram(self, *args):
-        if self.spectrogram is not None:
-            # get colors and convert to ubyte
-            r = self.spectrogram.getColorResult(self.indices[0]) * 255.999
-            g = self.spectrogram.getColorResult(self.indices[1]) * 255.999
-            b = self.spectrogram.getColorResult(self.indices[2]) * 255.999
-            img_data = np.dstack((r, g, b)).astype(np.uint8)
-            # swap axes - numpy shape needs to be the transpose of the texture
-            img_data = np.swapaxes(img_data, 0, 1)
-            freq, index, _ = img_data.shape
-            texture = Texture.create(size=(index, freq), colorfmt="rgb")
-            texture.blit_buffer(
-                img_data.flatten(), colorfmt="rgb", bufferfmt="ubyte"
-            )
-            image = Image(
-                size=(index * self.scale, self.height),
-                texture=texture,
-                allow_stretch=True,
-                keep_ratio=False,
-            )
-            image.size_hint_x = None
-            self.setImage(image)
-        else:
+        shape = getattr(self.spectrogram, "shape", None)
+        if self.spectrogram is None or shape is None:
+            self._strip = None
+            self._shown = None
+            self._tiles.clear()
             image = Image(source="src/interface/resources/loading.gif")
             image.size_hint_x = None
             self.setImage(image)
+            return
+        if (
+            self._strip is None
+            or self._shown is not self.spectrogram
+            or self._shape != tuple(shape)
+        ):
+            self._createStrip(*shape)
+        self._resize()
+
+    def _createStrip(self, segments: int, freq: int):
+        self._shown = self.spectrogram
+        self._shape = (segments, freq)
+        self._tiles.clear()
+        self._drawn = np.zeros(segments, dtype=bool)
+        self._ranges = _empty_ranges()
+        self._strip = RelativeLayout(size_hint=(None, 1))
+        self._strip.bind(height=self._cull)
+        self.setImage(self._strip)
+
+    def _resize(self):
+        if self._strip is not None:
+            self._strip.width = self._shape[0] * self.scale
+            self._cull()
+
+    # tiles intersecting the viewport, and a margin either side of it
+    def _getVisibleTiles(self) -> range:
+        width = self._strip.width
+        view = min(self.scrollview.width, width)
+        left = self.scrollview.scroll_x * (width - view)
+        first = int(left / self.scale) // TILE_SEGMENTS
+        last = int((left + view) / self.scale) // TILE_SEGMENTS
+        tiles = -(self._shape[0] // -TILE_SEGMENTS)
+        return range(
+            max(first - PREFETCH_TILES, 0),
+            min(last + PREFETCH_TILES + 1, tiles),
+        )
+
+    def _showTiles(self):
+        if self._strip is None:
+            return
+        visible = self._getVisibleTiles()
+        textures = [self._getTile(tile) for tile in visible]
+        # evict the tiles shown longest ago, keeping at least those in view
+        while len(self._tiles) > max(TILE_CACHE, len(visible)):
+            self._tiles.popitem(last=False)
+        self._strip.canvas.clear()
+        with self._strip.canvas:
+            Color(1, 1, 1, 1)
+            for tile, texture in zip(visible, textures):
+                Rectangle(
+                    texture=texture,
+                    pos=(tile * TILE_SEGMENTS * self.scale, 0),
+                    size=(texture.width * self.scale, self._strip.height),
+                )
+
+    def _getTile(self, tile: int) -> Texture:
+        if tile in self._tiles:
+            self._tiles.move_to_end(tile)
+            return self._tiles[tile]
+        segments, freq = self._shape
+        width = min(TILE_SEGMENTS, segments - tile * TILE_SEGMENTS)
+        texture = Texture.create(size=(width, freq), colorfmt="rgb")
+        self._tiles[tile] = texture
+        self._fillTile(tile)
+        return texture
+
+    # convert every column of a tile, undrawn segments staying black
+    def _fillTile(self, tile: int):
+        texture = self._tiles[tile]
+        first = tile * TILE_SEGMENTS
+        segments = np.arange(first, first + texture.width)
+        pixels = self._getPixels(segments)
+        pixels[:, ~self._drawn[segments]] = 0
+        texture.blit_buffer(
+            pixels.tobytes(), colorfmt="rgb", bufferfmt="ubyte"
+        )
+
+    def _drawSegments(self, segments: np.ndarray):
+        available = self.spectrogram.getIndices()
+        if len(segments) == 0 or any(
+            index not in available for index in self.indices
+        ):
+            return
+        segments = np.unique(segments)
+        self._drawn[segments] = True
+        if self._drawn.all():
+            # ranges of the whole results, kept by the spectrogram
+            ranges = np.array(
+                [
+                    self.spectrogram.getColorRange(index, self.clip_percentile)
+                    for index in self.indices
+                ]
+            )
+        else:
+            ranges = self._getRunningRanges(segments)
+        if not np.array_equal(ranges, self._ranges):
+            # the colours of every drawn segment change with the range, but
+            # only tiles uploaded need converting again now
+            self._ranges = ranges
+            for tile in self._tiles:
+                self._fillTile(tile)
+        else:
+            self._drawColumns(segments)
+        self._strip.canvas.ask_update()
+
+    # ranges of the segments drawn so far, widened by those just finished
+    def _getRunningRanges(self, segments: np.ndarray) -> np.ndarray:
+        ranges = self._ranges.copy()
+        if self.clip_percentile:
+            # percentiles can't be widened, so they are taken over every
+            # segment drawn, as the spectrogram does once all are
+            segments = np.flatnonzero(self._drawn)
+        for colour, index in enumerate(self.indices):
+            # rows copied out of the results, which may be shared memory
+            values = np.asarray(
+                self.spectrogram.getResult(index)[segments], float
+            )
+            if not np.isfinite(values).any():
+                continue
+            if self.clip_percentile:
+                ranges[colour] = np.nanpercentile(
+                    values, [self.clip_percentile, 100 - self.clip_percentile]
+                )
+            else:
+                ranges[colour, 0] = min(ranges[colour, 0], np.nanmin(values))
+                ranges[colour, 1] = max(ranges[colour, 1], np.nanmax(values))
+        return ranges
+
+    # blit the columns of the given segments into the tiles uploaded, one
+    # call per run of consecutive segments
+    def _drawColumns(self, segments: np.ndarray):
+        segments = segments[
+            np.isin(segments // TILE_SEGMENTS, list(self._tiles))
+        ]
+        if len(segments) == 0:
+            return
+        pixels = self._getPixels(segments)
+        tiles = segments // TILE_SEGMENTS
+        runs = np.flatnonzero((np.diff(segments) != 1) | (np.diff(tiles) != 0))
+        runs += 1
+        for start, end in zip(np.r_[0, runs], np.r_[runs, len(segments)]):
+            texture = self._tiles[tiles[start]]
+            texture.blit_buffer(
+                np.ascontiguousarray(pixels[:, start:end]).tobytes(),
+                pos=(int(segments[start] % TILE_SEGMENTS), 0),
+                size=(int(end - start), texture.height),
+                colorfmt="rgb",
+                bufferfmt="ubyte",
+            )
+
+    # (frequencies, segments, rgb) colours of segments, as textures are
+    # (width, height)
+    def _getPixels(self, segments: np.ndarray) -> np.ndarray:
+        return self.spectrogram.getColorImage(
+            list(self.indices), segments, self._ranges, log=self.log_scale
+        )
+
+
+def _empty_ranges() -> np.ndarray:
+    return np.tile([np.inf, -np.inf], (3, 1))
@@ -1,7 +1,7 @@
 # define class interfaces
 
 from abc import abstractmethod
-from typing import Iterable, List, Optional, Tuple, Union, Dict
+from typing import Any, Iterable, Iterator, List, Optional, Tuple, Union, Dict
 from typing_extensions import Protocol
 
 import numpy as np
@@ -25,6 +25,24 @@ class IAudioSegment(Protocol):
     def getSpectrogram(self) -> Tuple[np.ndarray, List[float], List[float]]:
         raise NotImplementedError
 
+    @abstractmethod
+    def getAmplitudeSpectrogram(self) -> np.ndarray:
+        raise NotImplementedError
+
+    @abstractmethod
+    def getDecibelSpectrogram(self) -> np.ndarray:
+        raise NotImplementedError
+
+    @abstractmethod
+    def getBandSpectrogram(
+        self, flim: Tuple[float, float], kind: str = "power"
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def release(self) -> None:
+        raise NotImplementedError
+
 
 class IPlaybackThread(Protocol):
     playback_time: float
@@ -40,6 +58,8 @@ class IAudioStream(Iterable[IAudioSegment], Protocol):
     time_limits: Tuple[float, float]
     file_duration: float
     segment_duration: float
+    backend: str
+    denoise: bool
 
     @abstractmethod
     def createStream(
@@ -51,7 +71,28 @@ class IAudioStream(Iterable[IAudioSegment], Protocol):
         raise NotImplementedError
 
     @abstractmethod
-    def createSTFT(self, n_fft: int, hop_length: int) -> np.ndarray:
+    def getSegment(self, i: int) -> IAudioSegment:
+        raise NotImplementedError
+
+    @abstractmethod
+    def createSTFT(
+        self, n_fft: int, hop_length: int, path: Union[str, None] = None
+    ) -> np.ndarray:
+        raise NotImplementedError
+
+    @abstractmethod
+    def countSTFTFrames(self, n_fft: int, hop_length: int) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    def getNativeSampleRate(self) -> int:
+        raise NotImplementedError
+
+    # (first frame, its time, magnitudes) per block of the stft
+    @abstractmethod
+    def iterSTFT(
+        self, n_fft: int, hop_length: int, block_length: int
+    ) -> Iterator[Tuple[int, float, np.ndarray]]:
         raise NotImplementedError
 
     @abstractmethod
@@ -85,9 +126,33 @@ class ISpectrogram(Protocol):
         raise NotImplementedError
 
     @abstractmethod
-    def getColorResult(self, index: str) -> np.ndarray:
+    def getColorResult(
+        self, index: str, percentile: float = 0, log: bool = False
+    ) -> np.ndarray:
         raise NotImplementedError
 
+    @abstractmethod
+    def getColorRange(
+        self, index: str, percentile: float = 0
+    ) -> Tuple[float, float]:
+        raise NotImplementedError
+
+    # uint8 (frequencies, segments, rgb) image of an (r, g, b) index triple
+    @abstractmethod
+    def getColorImage(
+        self,
+        indices: List[str],
+        segments: Any = None,
+        ranges: Optional[List[Tuple[float, float]]] = None,
+        percentile: float = 0,
+        log: bool = False,
+    ) -> np.ndarray:
+        raise NotImplementedError
+
+    # results of the indices were changed in place
+    def invalidate(self, *indices: str) -> None:
+        pass
+
     @abstractmethod
     def addSegment(self, i: int, result: Dict[str, np.ndarray]) -> None:
         raise NotImplementedError
@@ -96,6 +161,9 @@ class ISpectrogram(Protocol):
     def addIndex(self, index: str, result: np.ndarray) -> None:
         raise NotImplementedError
 
+    def removeIndex(self, index: str) -> None:
+        self.result.pop(index, None)
+
     def getShape(self) -> Tuple[int, int]:
         return self.shape
 
@@ -121,7 +189,12 @@ class ICoordinator(Protocol):
         raise NotImplementedError
 
     @abstractmethod
-    def getSTFT(self) -> np.ndarray:
+    def getSTFT(
+        self,
+        n_fft: int = 2048,
+        hop_length: int = 1024,
+        path: Optional[str] = None,
+    ) -> np.ndarray:
         raise NotImplementedError
 
     @abstractmethod
@@ -132,6 +205,10 @@ class ICoordinator(Protocol):
     def saveIndices(self, path) -> None:
         raise NotImplementedError
 
+    @abstractmethod
+    def getMetadata(self) -> Dict[str, Any]:
+        raise NotImplementedError
+
     def getSpectrogram(self) -> ISpectrogram:
         return self.spectrogram
 
@@ -1,19 +1,29 @@
 # class for representing audio as a stream of segments
 
 import os
-from typing import List, Tuple, Union
+from typing import Dict, Iterator, List, NamedTuple, Tuple, Union
 import threading
 import queue
 
 import librosa
 import maad
 import numpy as np
+import soundfile as sf
+import soxr
 import sounddevice as sd
 
+from src.tools import profiling
 from src.tools.noise import waveform_denoise, spectrogram_denoise
+from src.tools.wav import map_wav, read_wav_header, to_float
 from src.tools.interfaces import IAudioSegment, IAudioStream, IPlaybackThread
 
 
+class STFTBlock(NamedTuple):
+    frame: int
+    time: float
+    magnitudes: np.ndarray
+
+
 class PlaybackThread(threading.Thread, IPlaybackThread):
     def __init__(
         self,
@@ -75,6 +85,9 @@ class PlaybackThread(threading.Thread, IPlaybackThread):
 
 
 class AudioSegment(IAudioSegment):
+    # parameters of the spectrogram every index is calculated from
+    spectrogram_params = {"window": "hamming", "mode": "psd", "nperseg": 512}
+
     def __init__(self, data, sr: int, denoise: bool = True):
         self.data = data
         self.sr = sr
@@ -83,28 +96,30 @@ class AudioSegment(IAudioSegment):
         self._waveform = None
         self._spectrogram, self._tn, self._fn = None, None, None
         self._bg_noise = None
+        # read-only arrays derived from the spectrogram, shared by indices
+        self._derived: Dict[str, np.ndarray] = {}
+        self._bands: Dict[tuple, Tuple[np.ndarray, np.ndarray]] = {}
 
     # in dB using average as baseline dB
     def getWaveform(self) -> np.ndarray:
-        if self._waveform is not None:
-            return self._waveform
-        # convert to dB based on average amplitude
-        avg = np.average(self.data)
-        waveform = 20 * np.log10(np.abs(self.data / avg))
-        if self.denoise:
-            waveform, noise = waveform_denoise(waveform)
-            self._bg_noise = noise
-        self._waveform = waveform
-        return waveform
+        if self._waveform is None:
+            self._calculateWaveform()
+        return self._waveform
 
     def getNoise(self) -> float:
-        if self._bg_noise is not None:
-            return self._bg_noise
+        if self._bg_noise is None:
+            self._calculateWaveform()
+        return self._bg_noise
+
+    # the waveform and its background noise come from one denoising pass
+    def _calculateWaveform(self) -> None:
+        # convert to dB based on average amplitude
         avg = np.average(self.data)
         waveform = 20 * np.log10(np.abs(self.data / avg))
-        _, noise = waveform_denoise(waveform)
-        self._bg_noise = noise
-        return noise
+        with profiling.stage("denoise", "waveform") as entry:
+            denoised, self._bg_noise = waveform_denoise(waveform)
+            entry["bytes"] = waveform.nbytes
+        self._waveform = denoised if self.denoise else waveform
 
     def getSpectrogram(
         self,
@@ -115,34 +130,194 @@ class AudioSegment(IAudioSegment):
             and self._fn is not None
         ):
             return self._spectrogram, self._tn, self._fn
-        spectrogram, tn, fn, _ = maad.sound.spectrogram(
-            self.data, self.sr, window="hamming", mode="psd", nperseg=512
-        )
+        data = self.data
+        with profiling.stage("stft") as entry:
+            spectrogram, tn, fn, _ = maad.sound.spectrogram(
+                data, self.sr, **self.spectrogram_params
+            )
+            entry["bytes"] = spectrogram.nbytes
         if self.denoise:
-            spectrogram = spectrogram_denoise(spectrogram)
+            with profiling.stage("denoise", "spectrogram") as entry:
+                spectrogram = spectrogram_denoise(spectrogram)
+                entry["bytes"] = spectrogram.nbytes
         self._spectrogram, self._tn, self._fn = spectrogram, tn, fn
         return spectrogram, tn, fn
 
+    def getAmplitudeSpectrogram(self) -> np.ndarray:
+        if "amplitude" not in self._derived:
+            S, _, _ = self.getSpectrogram()
+            self._derived["amplitude"] = _read_only(np.sqrt(S))
+        return self._derived["amplitude"]
+
+    def getDecibelSpectrogram(self) -> np.ndarray:
+        if "decibels" not in self._derived:
+            S, _, _ = self.getSpectrogram()
+            self._derived["decibels"] = _read_only(maad.util.power2dB(S))
+        return self._derived["decibels"]
+
+    # rows of a spectrogram (power, amplitude or decibels) within the
+    # frequency limits, as views along with their frequencies
+    def getBandSpectrogram(
+        self, flim: Tuple[float, float], kind: str = "power"
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        spectrograms = {
+            "power": lambda: self.getSpectrogram()[0],
+            "amplitude": self.getAmplitudeSpectrogram,
+            "decibels": self.getDecibelSpectrogram,
+        }
+        if kind not in spectrograms:
+            raise ValueError(
+                "unknown spectrogram %s, expected one of %s"
+                % (kind, list(spectrograms))
+            )
+        key = (kind, tuple(flim))
+        if key not in self._bands:
+            _, _, fn = self.getSpectrogram()
+            rows = np.flatnonzero(maad.util.index_bw(fn, flim))
+            band = slice(rows[0], rows[-1] + 1) if len(rows) else slice(0, 0)
+            S = spectrograms[kind]()
+            self._bands[key] = (_read_only(S[band]), _read_only(fn[band]))
+        return self._bands[key]
+
+    # drop cached arrays once the segment has been analysed
+    def release(self) -> None:
+        self._derived, self._bands = {}, {}
+        self._waveform = None
+        self._spectrogram, self._tn, self._fn = None, None, None
+
+
+def _read_only(array: np.ndarray) -> np.ndarray:
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+
+class MappedAudioSegment(AudioSegment):
+    # segment backed by a read-only memory map of the file's samples, which
+    # is only converted to float (and resampled) when data is first used
+    def __init__(
+        self, file: str, start: int, frames: int, sr: int, denoise=True
+    ):
+        self.file = file
+        self.start = start
+        self.frames = frames
+        AudioSegment.__init__(self, None, sr, denoise)
+
+    @property
+    def data(self) -> np.ndarray:
+        if self._data is None:
+            with profiling.stage("decode") as entry:
+                _, header = map_wav(self.file)
+                y = to_float(self.getRawData(), header)
+                if header.sr != self.sr and len(y) > 0:
+                    y = soxr.resample(y, header.sr, self.sr, quality="soxr_hq")
+                entry["bytes"] = y.nbytes
+            self._data = y
+        return self._data
+
+    @data.setter
+    def data(self, data: np.ndarray):
+        self._data = data
+
+    def release(self) -> None:
+        AudioSegment.release(self)
+        # the samples can be converted again from the map
+        self._data = None
+
+    # zero-copy (frames, channels) view of the samples in the file
+    def getRawData(self) -> np.ndarray:
+        samples, _ = map_wav(self.file)
+        return samples[self.start : self.start + self.frames]
+
+    # workers reopen the map by path instead of receiving the samples
+    def __reduce__(self):
+        return (
+            MappedAudioSegment,
+            (self.file, self.start, self.frames, self.sr, self.denoise),
+        )
+
+
+class StreamingDecoder:
+    # decodes a file sequentially through one open handle, resampling with
+    # a single stateful resampler so filter state carries across segments
+    def __init__(self, file: str, sr: int, offset: float = 0):
+        self._handle = sf.SoundFile(file)
+        self.native_sr = self._handle.samplerate
+        self.sr = sr
+        # match librosa.load's frame arithmetic
+        self._handle.seek(int(offset * self.native_sr))
+        self._resampler = None
+        if self.native_sr != sr:
+            self._resampler = soxr.ResampleStream(
+                self.native_sr, sr, 1, dtype="float32", quality="HQ"
+            )
+        self._buffer: List[np.ndarray] = []
+        self._buffered = 0
+        self._finished = False
+
+    def read(self, duration: float) -> np.ndarray:
+        with profiling.stage("decode") as entry:
+            y = self._read(duration)
+            entry["bytes"] = y.nbytes
+        return y
+
+    def _read(self, duration: float) -> np.ndarray:
+        n_in = int(duration * self.native_sr)
+        n_out = int(np.ceil(n_in * self.sr / self.native_sr))
+        while self._buffered < n_out and not self._finished:
+            block = self._handle.read(n_in, dtype="float32", always_2d=True)
+            self._finished = len(block) < n_in
+            # downmix to mono as librosa.to_mono does
+            y = block[:, 0]
+            if block.shape[1] > 1:
+                y = np.mean(block, axis=1)
+            if self._resampler is not None:
+                y = self._resampler.resample_chunk(y, last=self._finished)
+            self._buffer.append(y)
+            self._buffered += len(y)
+        data = np.concatenate(self._buffer) if self._buffer else np.zeros(0)
+        y, rest = data[:n_out], data[n_out:]
+        self._buffer, self._buffered = [rest], len(rest)
+        return y.astype(np.float32, copy=False)
+
+    def close(self) -> None:
+        self._handle.close()
+
 
 class AudioStream(IAudioStream):
+    backends = ("librosa", "stream", "mmap")
+
     def __init__(
         self,
         file: str,
         sr: int = 22050,
         duration: float = 60,
         time_limits: Union[Tuple[float, float], None] = None,
+        backend: str = "librosa",
+        denoise: bool = True,
     ):
+        if backend not in self.backends:
+            raise ValueError(
+                "unsupported decoding backend %s, expected one of %s"
+                % (backend, self.backends)
+            )
         self.file = file
         self.sr = sr
         self.segment_duration = duration
+        self.backend = backend
+        self.denoise = denoise
         # file metadata
         self.file_duration: float = librosa.get_duration(filename=file)
+        if backend == "mmap":
+            # fail early on files that can't be mapped
+            self._header = read_wav_header(file)
         if time_limits is None:
             self.time_limits = (0, self.file_duration)
         else:
             self.time_limits = time_limits
         # iteration
         self.position = self.time_limits[0]
+        self._decoder: Union[StreamingDecoder, None] = None
         # playback
         self._playback_thread = None
 
@@ -154,15 +329,65 @@ class AudioStream(IAudioStream):
 
     def next(self):
         if self.position < self.time_limits[1]:
-            y, sr = librosa.load(
+            if self.backend == "stream":
+                if self._decoder is None:
+                    self._decoder = StreamingDecoder(
+                        self.file, self.sr, self.position
+                    )
+                y = self._decoder.read(self.segment_duration)
+            elif self.backend == "mmap":
+                segment = self._mapSegment(self.position)
+                self.position += self.segment_duration
+                return segment
+            else:
+                y = self._loadSegment(self.position)
+            self.position += self.segment_duration
+            return AudioSegment(y, sr=self.sr, denoise=self.denoise)
+        if self._decoder is not None:
+            self._decoder.close()
+            self._decoder = None
+        raise StopIteration()
+
+    def __getitem__(self, i: int) -> IAudioSegment:
+        return self.getSegment(i)
+
+    # random access by segment number, independent of iteration position
+    def getSegment(self, i: int) -> IAudioSegment:
+        num_segments = self.getNumberOfSegments()
+        if i < 0:
+            i += num_segments
+        if i < 0 or i >= num_segments:
+            raise IndexError(
+                "Segment %d is out of range for a stream of %d segments."
+                % (i, num_segments)
+            )
+        offset = self.time_limits[0] + self.segmentToTimestamp(i)
+        if self.backend == "mmap":
+            return self._mapSegment(offset)
+        return AudioSegment(
+            self._loadSegment(offset), sr=self.sr, denoise=self.denoise
+        )
+
+    def _mapSegment(self, offset: float) -> IAudioSegment:
+        # same frame arithmetic as librosa.load
+        start = min(int(offset * self._header.sr), self._header.frames)
+        frames = int(self.segment_duration * self._header.sr)
+        frames = min(frames, self._header.frames - start)
+        return MappedAudioSegment(
+            self.file, start, frames, self.sr, self.denoise
+        )
+
+    def _loadSegment(self, offset: float) -> np.ndarray:
+        # librosa.load seeks straight to the offset in the file
+        with profiling.stage("decode") as entry:
+            y, _ = librosa.load(
                 self.file,
                 sr=self.sr,
-                offset=self.position,
+                offset=offset,
                 duration=self.segment_duration,
             )
-            self.position += self.segment_duration
-            return AudioSegment(y, sr=sr)
-        raise StopIteration()
+            entry["bytes"] = y.nbytes
+        return y
 
     def createStream(
         self,
@@ -175,32 +400,85 @@ class AudioStream(IAudioStream):
                 end_time - start_time
             ) / self.getNumberOfSegments()
         return AudioStream(
-            self.file, self.sr, segment_duration, (start_time, end_time)
+            self.file,
+            self.sr,
+            segment_duration,
+            (start_time, end_time),
+            self.backend,
+            self.denoise,
         )
 
+    # magnitude spectrogram of the whole stream at the file's own sample
+    # rate, written to a memory-mapped .npy at path if one is given so that
+    # it doesn't have to fit in memory
     def createSTFT(
-        self, n_fft: int = 2048, hop_length: int = 1024
+        self,
+        n_fft: int = 2048,
+        hop_length: int = 1024,
+        path: Union[str, None] = None,
     ) -> np.ndarray:
+        shape = (1 + n_fft // 2, self.countSTFTFrames(n_fft, hop_length))
+        if path is None:
+            S = np.empty(shape, dtype=np.float32)
+        else:
+            S = np.lib.format.open_memmap(
+                path, mode="w+", dtype=np.float32, shape=shape
+            )
+        for frame, _, block in self.iterSTFT(n_fft, hop_length):
+            S[:, frame : frame + block.shape[1]] = block
+        if path is None:
+            return S
+        S.flush()
+        del S
+        return np.load(path, mmap_mode="r")
+
+    # blocks of the magnitude spectrogram with the number and time (s) of
+    # their first frame, so only one block of the complex stft is held at
+    # a time
+    def iterSTFT(
+        self,
+        n_fft: int = 2048,
+        hop_length: int = 1024,
+        block_length: int = 256,
+    ) -> Iterator[STFTBlock]:
         stream = librosa.stream(
             self.file,
-            block_length=256,
+            block_length=block_length,
             frame_length=n_fft,
             hop_length=hop_length,
             offset=self.time_limits[0],
             duration=self.getDuration(),
         )
-        # concatenate block stfts horizontally
-        S = np.concatenate(
-            [
-                librosa.stft(
-                    y_block, n_fft=n_fft, hop_length=hop_length, center=False
+        sr = self.getNativeSampleRate()
+        frame = 0
+        for y_block in stream:
+            with profiling.stage("stft", "stream") as entry:
+                block = np.abs(
+                    librosa.stft(
+                        y_block,
+                        n_fft=n_fft,
+                        hop_length=hop_length,
+                        center=False,
+                        dtype=np.complex64,
+                    )
                 )
-                for y_block in stream
-            ],
-            axis=1,
+                entry["bytes"] = block.nbytes
+            time = self.time_limits[0] + frame * hop_length / sr
+            yield STFTBlock(frame, time, block)
+            frame += block.shape[1]
+
+    # frames of the stft without centering, as librosa.stream reads them
+    def countSTFTFrames(self, n_fft: int, hop_length: int) -> int:
+        info = sf.info(self.file)
+        start = int(self.time_limits[0] * info.samplerate)
+        samples = min(
+            int(self.getDuration() * info.samplerate), info.frames - start
         )
-        # and return the amplitude
-        return np.abs(S)
+        return max(0, 1 + (samples - n_fft) // hop_length)
+
+    # sample rate of the file, at which the stft is computed
+    def getNativeSampleRate(self) -> int:
+        return librosa.get_samplerate(self.file)
 
     def play(
         self, offset: float = 0, duration: Union[float, None] = None
@@ -232,11 +510,11 @@ class AudioStream(IAudioStream):
                 self._playback_thread = None
 
 
-def load_audio(file: str) -> IAudioStream:
+def load_audio(file: str, backend: str = "librosa") -> IAudioStream:
     _, ext = os.path.splitext(file)
     if ext.lower() != ".wav":
         raise ValueError("file is not a .wav")
     if not os.path.exists(file):
         raise ValueError("file doesn't exist")
 
-    return AudioStream(file)
+    return AudioStream(file, backend=backend)
@@ -7,14 +7,9 @@ T = TypeVar("T", int, float)
 
 
 def moving_average(data: List[T], window_size: int) -> List[T]:
-    cumsum = np.cumsum(data)
-    diff = cumsum - (
-        np.concatenate([np.zeros(window_size), cumsum])[0 : len(cumsum)]
-    )
-    smoothed = diff / np.concatenate(
-        [
-            np.arange(1, window_size + 1),
-            np.ones(len(cumsum) - window_size) * window_size,
-        ]
-    )
-    return smoothed
+    # trailing average over the last axis, with a shorter window at the start
+    cumsum = np.cumsum(data, axis=-1)
+    shifted = np.zeros_like(cumsum)
+    shifted[..., window_size:] = cumsum[..., :-window_size]
+    counts = np.minimum(np.arange(1, cumsum.shape[-1] + 1), window_size)
+    return (cumsum - shifted) / counts
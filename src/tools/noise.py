@@ -1,6 +1,5 @@
 # remove background noise of audio
 
-from collections import Counter
 from typing import Tuple
 
 import numpy as np
@@ -25,27 +24,30 @@ def waveform_denoise(
     upper_mode_bound = int(num_bins * 0.95)
     bin_width = noise_threshold_dB / num_bins
     # get signal envelope (average of frames)
-    envelope = np.array(maad.sound.envelope(data, Nt=frame_size))
+    envelope = np.asarray(maad.sound.envelope(data, Nt=frame_size))
     # get minimum dBs
     min_dB = min(np.min(envelope), min_env_dB)
     # populate histogram
     bg_threshold = min_dB + noise_threshold_dB
     bg_signal = envelope[(envelope >= min_dB) | (envelope <= bg_threshold)]
-    h_indices = [
-        min(num_bins - 1, max(0, int((x - min_dB) / bin_width)))
-        for x in bg_signal
-    ]
-    counts = Counter(h_indices)
-    histogram = [counts[i] for i in range(0, num_bins)]
+    h_indices = np.clip(
+        np.floor((bg_signal - min_dB) / bin_width), 0, num_bins - 1
+    ).astype(np.intp)
+    histogram = np.bincount(h_indices, minlength=num_bins)
     # smooth histogram
     smoothed = moving_average(histogram, filter_window)
     # calculate mode and std
     mode_index = min(int(np.argmax(smoothed)), upper_mode_bound)
-    smoothed_cumsum = np.cumsum(smoothed[0:mode_index])
-    threshold_sum = smoothed_cumsum[-1] * 0.68  # one std. dev.
-    std_index = int(
-        np.argmax(np.cumsum(smoothed[mode_index - 1 : 0 : -1]) > threshold_sum)
-    )
+    if mode_index == 0:
+        std_index = 0
+    else:
+        smoothed_cumsum = np.cumsum(smoothed[0:mode_index])
+        threshold_sum = smoothed_cumsum[-1] * 0.68  # one std. dev.
+        std_index = int(
+            np.argmax(
+                np.cumsum(smoothed[mode_index - 1 : 0 : -1]) > threshold_sum
+            )
+        )
     noise_mode = min_dB + ((mode_index + 1) * bin_width)
     noise_std = (mode_index - std_index) * bin_width
     # calculate background dB threshold
@@ -62,48 +64,58 @@ def spectrogram_denoise(
     data: np.ndarray, filter_window: int = 5, sd_count: float = 0.1
 ) -> np.ndarray:
     # calculate thresholds
-    thresholds = [
-        _calculate_spectral_threshold(xs, filter_window, sd_count)
-        for xs in data
-    ]
+    thresholds = _calculate_spectral_thresholds(data, filter_window, sd_count)
     thresholds = moving_average(thresholds, filter_window)
     # subtract threshold values
     result = np.clip(data.transpose() - thresholds, 0, None).transpose()
     return result
 
 
-# calculate spectral threshold per frequency bin for noise reduction
+# calculate spectral thresholds of every frequency bin for noise reduction
+# at once, with one histogram, mode and std. dev. per row
 
 
-def _calculate_spectral_threshold(
+def _calculate_spectral_thresholds(
     data: np.ndarray, filter_window: int, sd_count: float
-) -> float:
+) -> np.ndarray:
     # define constants
-    num_bins = int(len(data) / 8)
+    num_rows, num_frames = data.shape
+    num_bins = max(1, int(num_frames / 8))
     upper_mode_bound = int(num_bins * 0.95)
-    min_power = np.min(data)
-    max_power = np.max(data)
+    min_power = np.min(data, axis=1)
+    max_power = np.max(data, axis=1)
     bin_width = (max_power - min_power) / num_bins
-    # populate histogram
-    h_indices = [
-        min(num_bins - 1, max(0, int((x - min_power) / bin_width)))
-        for x in data
-    ]
-    counts = Counter(h_indices)
-    histogram = [counts[i] for i in range(0, num_bins)]
-    # smooth histogram
-    smoothed = moving_average(histogram, filter_window)
-    # calculate mode and std
-    mode_index = min(int(np.argmax(smoothed)), upper_mode_bound)
-    if mode_index == 0:
-        std_index = 0
-    else:
-        smoothed_cumsum = np.cumsum(smoothed[0:mode_index])
-        threshold_sum = smoothed_cumsum[-1] * 0.68  # one std. dev.
-        std_index = np.argmax(
-            np.cumsum(smoothed[mode_index - 1 :: -1]) > threshold_sum
-        )
+    # populate histograms, offsetting each row's bins so that one bincount
+    # fills all of them (constant rows have no width and fall in bin 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        h_indices = (data - min_power[:, None]) / bin_width[:, None]
+    h_indices = np.nan_to_num(h_indices, nan=0, posinf=0)
+    h_indices = np.clip(np.floor(h_indices), 0, num_bins - 1).astype(np.intp)
+    h_indices += (np.arange(num_rows) * num_bins)[:, None]
+    histograms = np.bincount(
+        h_indices.ravel(), minlength=num_rows * num_bins
+    ).reshape(num_rows, num_bins)
+    # smooth histograms
+    smoothed = moving_average(histograms, filter_window)
+    # calculate modes
+    mode_index = np.minimum(np.argmax(smoothed, axis=1), upper_mode_bound)
+    rows = np.arange(num_rows)
+    threshold_sum = (
+        np.cumsum(smoothed, axis=1)[rows, np.maximum(mode_index - 1, 0)] * 0.68
+    )  # one std. dev.
+    # and std. devs. by accumulating downwards from each row's mode
+    offsets = np.arange(num_bins)
+    below_mode = offsets[None, :] < mode_index[:, None]
+    downwards = np.take_along_axis(
+        smoothed,
+        np.clip(mode_index[:, None] - 1 - offsets[None, :], 0, None),
+        axis=1,
+    )
+    downwards_cumsum = np.cumsum(np.where(below_mode, downwards, 0), axis=1)
+    std_index = np.argmax(
+        below_mode & (downwards_cumsum > threshold_sum[:, None]), axis=1
+    )
     noise_mode = min_power + ((mode_index + 1) * bin_width)
     noise_std = (mode_index - std_index) * bin_width
-    # calculate threshold
+    # calculate thresholds
     return noise_mode + (noise_std * sd_count)
@@ -0,0 +1,229 @@
+# opt-in timing of the analysis stages (decoding, spectrograms, denoising,
+# each index, transfers between processes and assembling results), with
+# the records of every worker gathered by the process that started them
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+Record = Dict[str, Any]
+
+_enabled = os.environ.get("ACOUSTIC_INDICES_PROFILE", "") not in ("", "0")
+_records: List[Record] = []
+_lock = threading.Lock()
+_tags = threading.local()
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def enable(enabled: bool = True) -> None:
+    global _enabled
+    _enabled = enabled
+
+
+# label the records of stages within, e.g. with the segment being analysed
+@contextmanager
+def tags(**values: Any) -> Iterator[None]:
+    previous = getattr(_tags, "values", {})
+    _tags.values = dict(previous, **values)
+    try:
+        yield
+    finally:
+        _tags.values = previous
+
+
+# time the stage within, yielding its record so the caller can set the
+# bytes it processed. stages nest (an index computes the spectrogram it
+# needs), so the time spent in the stage itself is kept apart from its
+# time including nested stages
+@contextmanager
+def stage(name: str, index: Optional[str] = None) -> Iterator[Record]:
+    if not _enabled:
+        # a record of its own, so callers can always add to its fields
+        yield {"bytes": 0}
+        return
+    entry: Record = {"bytes": 0, "self_wall": 0.0, "self_cpu": 0.0}
+    stack = getattr(_tags, "stack", None)
+    if stack is None:
+        stack = _tags.stack = []
+    stack.append(entry)
+    start = time.time()
+    wall = time.perf_counter()
+    cpu = time.thread_time()
+    try:
+        yield entry
+    finally:
+        wall = time.perf_counter() - wall
+        cpu = time.thread_time() - cpu
+        stack.pop()
+        entry.update(
+            stage=name,
+            index=index,
+            start=start,
+            wall=wall,
+            cpu=cpu,
+            self_wall=entry["self_wall"] + wall,
+            self_cpu=entry["self_cpu"] + cpu,
+        )
+        if stack:
+            stack[-1]["self_wall"] -= wall
+            stack[-1]["self_cpu"] -= cpu
+        _add(entry)
+
+
+# a stage measured elsewhere, e.g. the transfer of a job between processes
+def record(
+    name: str,
+    wall: float,
+    cpu: float = 0.0,
+    nbytes: int = 0,
+    index: Optional[str] = None,
+    **values: Any,
+) -> None:
+    if not _enabled:
+        return
+    entry = {
+        "stage": name,
+        "index": index,
+        "start": time.time() - wall,
+        "wall": wall,
+        "cpu": cpu,
+        "self_wall": wall,
+        "self_cpu": cpu,
+        "bytes": nbytes,
+    }
+    _add(dict(entry, **values))
+
+
+def _add(entry: Record) -> None:
+    entry.update(getattr(_tags, "values", {}))
+    entry.setdefault("pid", os.getpid())
+    entry.setdefault("tid", threading.get_ident())
+    with _lock:
+        _records.append(entry)
+
+
+def get_records() -> List[Record]:
+    with _lock:
+        return list(_records)
+
+
+# take the records so far, e.g. to send them from a worker to its parent
+def drain() -> List[Record]:
+    global _records
+    with _lock:
+        records, _records = _records, []
+    return records
+
+
+def extend(records: List[Record]) -> None:
+    with _lock:
+        _records.extend(records)
+
+
+def reset() -> None:
+    drain()
+
+
+# totals per stage and index of the time spent in the stages themselves,
+# most expensive first
+def summarise(records: Optional[List[Record]] = None) -> List[Record]:
+    if records is None:
+        records = get_records()
+    totals: Dict[Tuple[str, Optional[str]], Record] = {}
+    for entry in records:
+        key = (entry["stage"], entry.get("index"))
+        total = totals.setdefault(
+            key,
+            {
+                "stage": key[0],
+                "index": key[1],
+                "count": 0,
+                "wall": 0.0,
+                "cpu": 0.0,
+                "bytes": 0,
+            },
+        )
+        total["count"] += 1
+        total["wall"] += entry["self_wall"]
+        total["cpu"] += entry["self_cpu"]
+        total["bytes"] += entry["bytes"]
+    return sorted(totals.values(), key=lambda total: -total["wall"])
+
+
+def format_summary(records: Optional[List[Record]] = None) -> str:
+    lines = [
+        "%-12s %-10s %7s %10s %10s %10s %10s"
+        % (
+            "stage",
+            "index",
+            "count",
+            "wall (s)",
+            "cpu (s)",
+            "mean (ms)",
+            "MiB",
+        )
+    ]
+    for total in summarise(records):
+        lines.append(
+            "%-12s %-10s %7d %10.3f %10.3f %10.3f %10.2f"
+            % (
+                total["stage"],
+                total["index"] or "",
+                total["count"],
+                total["wall"],
+                total["cpu"],
+                1000 * total["wall"] / total["count"],
+                total["bytes"] / 2**20,
+            )
+        )
+    return "\n".join(lines)
+
+
+def write_json(path: str, records: Optional[List[Record]] = None) -> None:
+    if records is None:
+        records = get_records()
+    with open(path, "w") as f:
+        json.dump(
+            {"summary": summarise(records), "records": records},
+            f,
+            indent=2,
+            default=str,
+        )
+
+
+# chrome://tracing and Perfetto show each process and thread as a track
+def write_chrome_trace(
+    path: str, records: Optional[List[Record]] = None
+) -> None:
+    if records is None:
+        records = get_records()
+    events = []
+    for entry in records:
+        name = entry["stage"]
+        if entry.get("index"):
+            name = "%s %s" % (name, entry["index"])
+        arguments = {
+            key: value
+            for key, value in entry.items()
+            if key not in ("stage", "index", "start", "wall", "pid", "tid")
+        }
+        events.append(
+            {
+                "name": name,
+                "cat": entry["stage"],
+                "ph": "X",
+                "ts": entry["start"] * 1e6,
+                "dur": entry["wall"] * 1e6,
+                "pid": entry["pid"],
+                "tid": entry["tid"],
+                "args": arguments,
+            }
+        )
+    with open(path, "w") as f:
+        json.dump({"traceEvents": events}, f, default=str)
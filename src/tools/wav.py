@@ -0,0 +1,123 @@
+# read the header of uncompressed .wav files and memory-map their samples
+
+from functools import lru_cache
+import os
+import struct
+from typing import NamedTuple, Tuple
+
+import numpy as np
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# (format, bits per sample) -> (sample dtype, zero point, full scale)
+_sample_formats = {
+    (WAVE_FORMAT_PCM, 8): (np.dtype("u1"), 128, 128),
+    (WAVE_FORMAT_PCM, 16): (np.dtype("<i2"), 0, 2**15),
+    (WAVE_FORMAT_PCM, 32): (np.dtype("<i4"), 0, 2**31),
+    (WAVE_FORMAT_IEEE_FLOAT, 32): (np.dtype("<f4"), 0, 1),
+    (WAVE_FORMAT_IEEE_FLOAT, 64): (np.dtype("<f8"), 0, 1),
+}
+
+
+class WavHeader(NamedTuple):
+    sr: int
+    channels: int
+    dtype: np.dtype
+    zero: int
+    scale: int
+    offset: int
+    frames: int
+
+
+def read_wav_header(file: str) -> WavHeader:
+    file_size = os.path.getsize(file)
+    with open(file, "rb") as f:
+        riff, _, wave = struct.unpack("<4sI4s", f.read(12))
+        if riff != b"RIFF" or wave != b"WAVE":
+            raise ValueError("file is not a RIFF .wav: %s" % (file))
+        fmt = None
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                break
+            chunk_id, chunk_size = struct.unpack("<4sI", chunk)
+            if chunk_id == b"fmt ":
+                body = f.read(chunk_size + (chunk_size & 1))
+                tag, channels, sr, _, block_align, bits = struct.unpack(
+                    "<HHIIHH", body[:16]
+                )
+                if tag == WAVE_FORMAT_EXTENSIBLE and len(body) >= 26:
+                    # the subformat GUID starts with the actual format tag
+                    (tag,) = struct.unpack("<H", body[24:26])
+                if (tag, bits) not in _sample_formats:
+                    raise ValueError(
+                        "can't memory-map %d-bit samples of format %#x: %s"
+                        % (bits, tag, file)
+                    )
+                fmt = (sr, channels, block_align, tag, bits)
+            elif chunk_id == b"data":
+                if fmt is None:
+                    raise ValueError(
+                        "data chunk precedes fmt chunk: %s" % file
+                    )
+                sr, channels, block_align, tag, bits = fmt
+                dtype, zero, scale = _sample_formats[(tag, bits)]
+                offset = f.tell()
+                # recorders that were cut off leave the chunk size unset
+                size = min(chunk_size, file_size - offset)
+                return WavHeader(
+                    sr,
+                    channels,
+                    dtype,
+                    zero,
+                    scale,
+                    offset,
+                    size // block_align,
+                )
+            else:
+                # chunks are padded to an even number of bytes
+                f.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+    raise ValueError("file has no data chunk: %s" % (file))
+
+
+# size and modification time of a file, which change when it is rewritten
+def file_version(file: str) -> Tuple[int, int]:
+    stat = os.stat(file)
+    return stat.st_size, stat.st_mtime_ns
+
+
+# maps are cached so every segment (and every pool worker) shares one
+# mapping, until the file is rewritten
+def map_wav(file: str) -> Tuple[np.memmap, WavHeader]:
+    return _map_wav(file, file_version(file))
+
+
+@lru_cache(maxsize=16)
+def _map_wav(
+    file: str, version: Tuple[int, int]
+) -> Tuple[np.memmap, WavHeader]:
+    header = read_wav_header(file)
+    samples = np.memmap(
+        file,
+        dtype=header.dtype,
+        mode="r",
+        offset=header.offset,
+        shape=(header.frames, header.channels),
+    )
+    return samples, header
+
+
+def to_float(samples: np.ndarray, header: WavHeader) -> np.ndarray:
+    # convert (frames, channels) samples to mono float32 in [-1, 1)
+    if header.dtype == np.float32 and header.channels == 1:
+        return samples[:, 0]
+    y = samples.astype(np.float32)
+    if header.zero != 0:
+        y -= header.zero
+    if header.scale != 1:
+        y *= 1.0 / header.scale
+    if header.channels == 1:
+        return y[:, 0]
+    return np.mean(y, axis=1)
@@ -1,4 +1,5 @@
 import unittest
+import warnings
 
 import numpy as np
 from numpy.testing import assert_array_almost_equal
@@ -7,6 +8,11 @@ from src.tools.loader import load_audio
 from src.analysis.temporal_indices import *
 from src.analysis.spectral_indices import *
 from src.analysis.secondary_indices import *
+from src.analysis.spectral_indices import (
+    _cluster_peaks,
+    _group_frames,
+    _remove_isolated_peaks,
+)
 
 
 class TestAcousticFunctions(unittest.TestCase):
@@ -143,3 +149,70 @@ class TestAcousticFunctions(unittest.TestCase):
             result = acoustic_entropy(segment)
 
             self.assertAlmostEqual(result, expected_results[i], places=2)
+
+
+def _reference_remove_isolated_peaks(band):
+    band = band.copy()
+    for i in range(1, len(band) - 1):
+        if band[i - 1] == 0 and band[i + 1] == 0:
+            band[i] = 0
+    return band
+
+
+class TestSpectralDiversity(unittest.TestCase):
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+
+    def test_isolated_peaks_match_reference(self):
+        S_binary = self.rng.random((32, 101)) < 0.3
+        expected = np.vstack(
+            [_reference_remove_isolated_peaks(band) for band in S_binary]
+        )
+
+        np.testing.assert_array_equal(
+            _remove_isolated_peaks(S_binary), expected
+        )
+
+    def test_grouped_frames_match_padded_means(self):
+        S = self.rng.random((4, 10))
+        expected = [
+            np.nanmean(np.append(band, [np.nan, np.nan]).reshape(-1, 3), 1)
+            for band in S
+        ]
+
+        np.testing.assert_allclose(_group_frames(S), expected)
+
+    def test_grouped_frames_of_multiples_of_three_keep_empty_group(self):
+        S = self.rng.random((4, 9))
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            expected = [
+                np.nanmean(np.append(band, [np.nan] * 3).reshape(-1, 3), 1)
+                for band in S
+            ]
+
+        np.testing.assert_allclose(_group_frames(S), expected)
+
+    def test_clusters_of_distinct_patterns_are_counted(self):
+        # three patterns in disjoint frames, each repeated with noise
+        patterns = np.zeros((3, 900), dtype=bool)
+        for i in range(3):
+            patterns[i, 300 * i : 300 * (i + 1)] = self.rng.random(300) < 0.5
+        S_binary = np.vstack(
+            [
+                pattern ^ (self.rng.random(900) < 0.01)
+                for pattern in patterns
+                for _ in range(10)
+            ]
+        )
+        S_binary = S_binary[self.rng.permutation(len(S_binary))]
+
+        for seed in range(5):
+            self.assertEqual(_cluster_peaks(S_binary, seed), 3)
+
+    def test_result_is_reproducible_for_a_seed(self):
+        S_ampl = self.rng.gamma(0.5, 0.1, (64, 300))
+
+        results = [spectral_diversity(None, S_ampl, seed=3) for _ in range(3)]
+
+        self.assertEqual(len(set(results)), 1)
@@ -0,0 +1,128 @@
+import unittest
+
+import numpy as np
+from maad.util import index_bw
+from numpy.testing import assert_array_almost_equal
+
+from src.tools.loader import AudioSegment
+from src.analysis.analyzer import Analyzer
+from src.analysis.batch_analyzer import BatchAnalyzer
+from src.analysis.temporal_indices import *
+from src.analysis.secondary_indices import *
+
+
+class TestAnalyzer(unittest.TestCase):
+    def assertArrayEqual(self, a, b, msg=None):
+        try:
+            assert_array_almost_equal(a, b)
+        except AssertionError:
+            raise self.failureException(msg)
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        sr = 22050
+        data = rng.normal(0, 0.01, sr * 10)
+        data[sr : 2 * sr] += 0.3 * np.sin(
+            2 * np.pi * 3000 * np.arange(sr) / sr
+        )
+        self.segment = AudioSegment(data.astype(np.float32), sr)
+
+        self.addTypeEqualityFunc(np.ndarray, self.assertArrayEqual)
+
+    def test_shared_results_are_computed_once(self):
+        analyzer = Analyzer(self.segment)
+        _, log = analyzer.calculateIndices(
+            "Ht", "AcAct", "AEFrac", "AEDur", "Hf", "HfVar", "ARI", "H"
+        )
+        stats = analyzer.getCacheStats()
+
+        self.assertEqual(log, [])
+        for hits, misses in stats.values():
+            self.assertEqual(misses, 1)
+        self.assertEqual(stats["envelope"], (3, 1))
+        self.assertEqual(stats["Ht"], (2, 1))
+        self.assertEqual(stats["AE"], (1, 1))
+        self.assertEqual(stats["Hf"], (2, 1))
+
+    def test_graph_results_match_index_functions(self):
+        results, _ = Analyzer(self.segment).calculateIndices(
+            "Ht", "AcAct", "AEFrac", "AEDur", "ARI", "H"
+        )
+        frac, dur = acoustic_event_proportion_and_duration(self.segment)
+
+        expected = {
+            "Ht": temporal_entropy(self.segment),
+            "AcAct": acoustic_activity(self.segment),
+            "AEFrac": frac,
+            "AEDur": dur,
+            "ARI": acoustic_richness_index(self.segment),
+            "H": acoustic_entropy(self.segment),
+        }
+        for index, value in expected.items():
+            self.assertEqual(results[index], value * np.ones(256))
+
+    def test_derived_spectrograms_are_shared_views(self):
+        S, _, fn = self.segment.getSpectrogram()
+        amplitude = self.segment.getAmplitudeSpectrogram()
+        band, band_fn = self.segment.getBandSpectrogram((2000, 4000))
+
+        self.assertIs(amplitude, self.segment.getAmplitudeSpectrogram())
+        self.assertFalse(amplitude.flags.writeable)
+        self.assertEqual(amplitude, np.sqrt(S))
+        self.assertTrue(np.shares_memory(band, S))
+        self.assertEqual(band_fn, fn[index_bw(fn, (2000, 4000))])
+
+        self.segment.release()
+        self.assertIsNot(amplitude, self.segment.getAmplitudeSpectrogram())
+
+    def test_failed_index_is_logged(self):
+        results, log = Analyzer(self.segment).calculateIndices("Ht", "XYZ")
+
+        self.assertEqual(list(results), ["Ht"])
+        self.assertEqual(log[0][0], "XYZ")
+
+
+class TestBatchAnalyzer(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        sr = 22050
+        self.segments = []
+        # the shorter last segment is batched on its own
+        for i, duration in enumerate([5, 5, 5, 3]):
+            t = np.arange(sr * duration) / sr
+            data = rng.normal(0, 0.01, t.size)
+            data += 0.2 * np.sin(2 * np.pi * (1500 + 1000 * i) * t)
+            self.segments.append(AudioSegment(data.astype(np.float32), sr))
+
+    def test_batch_matches_per_segment_results(self):
+        indices = [
+            "SpAct",
+            "ACI",
+            "AEI",
+            "BioI",
+            "LFreqCov",
+            "MFreqCov",
+            "HFreqCov",
+            "NDSI",
+            "Ht",
+            "H",
+        ]
+        batch = BatchAnalyzer(self.segments).calculateIndices(*indices)
+
+        self.assertEqual(len(batch), len(self.segments))
+        for segment, (results, log) in zip(self.segments, batch):
+            expected, _ = Analyzer(segment).calculateIndices(*indices)
+            self.assertEqual(log, [])
+            for index in indices:
+                np.testing.assert_allclose(
+                    results[index], expected[index], rtol=1e-9, atol=1e-12
+                )
+
+    def test_batched_nodes_are_not_recomputed(self):
+        analyzer = BatchAnalyzer(self.segments)
+        analyzer.calculateIndices("NDSI", "Ht")
+
+        for segment_analyzer in analyzer.analyzers:
+            stats = segment_analyzer.getCacheStats()
+            self.assertEqual(stats["NDSI"], (1, 0))
+            self.assertEqual(stats["Ht"], (0, 1))
@@ -0,0 +1,103 @@
+import os
+import tempfile
+import unittest
+from concurrent.futures import Future
+
+import numpy as np
+import soundfile as sf
+
+from src.analysis.batch import BatchRunner, FileAnalysis, find_recordings
+from src.analysis.coordinator import AnalysisCoordinator, calculate_segments
+from src.analysis.journal import journal_path
+from src.analysis.pool import get_executor
+from src.analysis.store import IndexStore
+from src.tools.loader import AudioStream
+
+
+class TestBatchRunner(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        rng = np.random.default_rng(0)
+        self.files = []
+        for name, seconds in [("a.wav", 12), ("b.wav", 7)]:
+            file = os.path.join(self.directory.name, name)
+            sf.write(file, rng.normal(0, 0.1, 22050 * seconds), 22050)
+            self.files.append(file)
+        self.output = os.path.join(self.directory.name, "indices")
+        os.mkdir(self.output)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_directories_are_searched_for_recordings(self):
+        with open(os.path.join(self.directory.name, "notes.txt"), "w"):
+            pass
+
+        self.assertEqual(find_recordings([self.directory.name]), self.files)
+
+    def test_every_file_gets_a_store(self):
+        runner = BatchRunner(
+            self.files, ["ACI", "NDSI"], self.output, duration=5, max_workers=2
+        )
+        report = runner.run()
+
+        self.assertAlmostEqual(report["audio_hours"], 19 / 3600)
+        for file in self.files:
+            store = IndexStore(runner.getStorePath(file))
+            self.assertEqual(sorted(store.getIndices()), ["ACI", "NDSI"])
+            self.assertFalse(os.path.exists(store.path + ".journal"))
+        expected = (
+            AnalysisCoordinator(AudioStream(self.files[1], duration=5))
+            .calculateIndices("ACI")
+            .getResult("ACI")
+        )
+        np.testing.assert_allclose(
+            IndexStore(runner.getStorePath(self.files[1])).getResult("ACI"),
+            expected,
+        )
+
+    def test_finished_stores_are_not_analysed_again(self):
+        BatchRunner(self.files, ["ACI"], self.output, duration=5).run()
+
+        report = BatchRunner(
+            self.files, ["ACI", "NDSI"], self.output, duration=5
+        ).run()
+        again = BatchRunner(
+            self.files, ["ACI", "NDSI"], self.output, duration=5
+        ).run()
+
+        self.assertAlmostEqual(report["audio_hours"], 19 / 3600)
+        self.assertEqual(again["audio_hours"], 0)
+        store = IndexStore(os.path.join(self.output, "a.indices"))
+        self.assertEqual(sorted(store.getIndices()), ["ACI", "NDSI"])
+
+    def test_failed_segments_are_analysed_again_next_run(self):
+        path = os.path.join(self.output, "a.indices")
+        analysis = FileAnalysis(
+            self.files[0], path, ["ACI"], duration=5, batch_size=1
+        )
+        jobs = list(analysis.getJobs())
+        # the worker of the first job crashed
+        crashed = Future()
+        crashed.set_exception(RuntimeError("worker died"))
+        analysis.collectSegments(crashed, jobs[0], 0, 0)
+        for job in jobs[1:]:
+            future = get_executor().submit(calculate_segments, job)
+            analysis.collectSegments(future, job, 0, 0)
+
+        self.assertEqual(analysis.failed_indices, {"ACI"})
+        self.assertFalse(os.path.exists(path))
+        self.assertTrue(os.path.exists(journal_path(path)))
+
+        runner = BatchRunner(self.files[:1], ["ACI"], self.output, duration=5)
+        report = runner.run()
+
+        self.assertEqual(report["failed"], 0)
+        self.assertAlmostEqual(report["audio_hours"], 5 / 3600)
+        self.assertFalse(os.path.exists(journal_path(path)))
+        np.testing.assert_allclose(
+            IndexStore(path).getResult("ACI"),
+            AnalysisCoordinator(AudioStream(self.files[0], duration=5))
+            .calculateIndices("ACI")
+            .getResult("ACI"),
+        )
@@ -0,0 +1,107 @@
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import soundfile as sf
+
+from src.analysis.cache import IndexCache
+from src.analysis.coordinator import AnalysisCoordinator
+from src.tools.loader import AudioStream
+
+
+class TestIndexCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.file = os.path.join(self.directory.name, "noise.wav")
+        rng = np.random.default_rng(0)
+        sf.write(self.file, rng.normal(0, 0.1, 22050 * 12), 22050)
+        self.cache = IndexCache(os.path.join(self.directory.name, "cache"))
+        self.result = rng.random((3, 256))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_results_are_keyed_by_content_and_parameters(self):
+        stream = AudioStream(self.file, duration=5)
+        self.cache.put(stream, "ACI", self.result)
+        copy = os.path.join(self.directory.name, "copy.wav")
+        shutil.copy(self.file, copy)
+
+        np.testing.assert_array_equal(
+            self.cache.get(AudioStream(copy, duration=5), "ACI"), self.result
+        )
+        self.assertIsNone(self.cache.get(stream, "NDSI"))
+        self.assertIsNone(self.cache.get(AudioStream(self.file), "ACI"))
+        self.assertIsNone(
+            self.cache.get(AudioStream(self.file, 5, denoise=False), "ACI")
+        )
+
+    def test_least_recently_used_entries_are_evicted(self):
+        stream = AudioStream(self.file, duration=5)
+        for index in ["ACI", "NDSI", "Ht"]:
+            self.cache.put(stream, index, self.result)
+        # make the entries' last uses distinct
+        for i, entry in enumerate(self.cache.getEntries()):
+            os.utime(entry["path"], (i, i))
+        self.cache.get(stream, "ACI")
+
+        self.cache.evict(2 * self.cache.getEntries()[0]["size"])
+
+        remaining = [entry["index"] for entry in self.cache.getEntries()]
+        self.assertEqual(sorted(remaining), ["ACI", "Ht"])
+
+    def test_purge_removes_entries_of_a_file(self):
+        self.cache.put(AudioStream(self.file, duration=5), "ACI", self.result)
+
+        self.assertEqual(self.cache.purge(self.file), 1)
+        self.assertEqual(self.cache.getEntries(), [])
+
+    def test_coordinator_uses_cached_results(self):
+        stream = AudioStream(self.file, duration=5)
+        first = AnalysisCoordinator(stream, max_workers=1, cache=self.cache)
+        expected = first.calculateIndices("ACI").getResult("ACI")
+
+        second = AnalysisCoordinator(stream, max_workers=1, cache=self.cache)
+
+        self.assertEqual(second.loadCachedIndices("ACI", "Ht"), ["ACI"])
+        np.testing.assert_array_equal(
+            second.calculateIndices("ACI").getResult("ACI"), expected
+        )
+
+    def test_backends_have_their_own_entries(self):
+        self.cache.put(AudioStream(self.file, duration=5), "ACI", self.result)
+
+        self.assertIsNone(
+            self.cache.get(
+                AudioStream(self.file, duration=5, backend="stream"), "ACI"
+            )
+        )
+
+    def test_digests_of_removed_files_are_dropped(self):
+        copy = os.path.join(self.directory.name, "copy.wav")
+        shutil.copy(self.file, copy)
+        self.cache.getFileDigest(copy)
+        os.remove(copy)
+
+        self.cache.getFileDigest(self.file)
+
+        with open(os.path.join(self.cache.directory, "files.json")) as f:
+            digests = json.load(f)
+        self.assertEqual(
+            [key.rsplit(":", 2)[0] for key in digests],
+            [os.path.abspath(self.file)],
+        )
+
+    def test_coordinator_with_a_cache_pickles(self):
+        stream = AudioStream(self.file, duration=5)
+        self.cache.getFileDigest(self.file)
+        coordinator = AnalysisCoordinator(stream, cache=self.cache)
+
+        copy = pickle.loads(pickle.dumps(coordinator))
+
+        self.cache.put(stream, "ACI", self.result)
+        self.assertEqual(copy.loadCachedIndices("ACI"), ["ACI"])
@@ -0,0 +1,129 @@
+import asyncio
+import os
+import pickle
+import tempfile
+import unittest
+
+import numpy as np
+import soundfile as sf
+
+from src.analysis.coordinator import (
+    AnalysisCoordinator,
+    _open_stream,
+    stream_source,
+)
+from src.analysis.cache import IndexCache
+from src.analysis.journal import ResultJournal
+from src.tools.loader import AudioStream
+
+
+class TestAnalysisCoordinator(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.file = os.path.join(self.directory.name, "noise.wav")
+        rng = np.random.default_rng(0)
+        sf.write(self.file, rng.normal(0, 0.1, 22050 * 12), 22050)
+        self.stream = AudioStream(self.file, duration=2)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_workers_reopen_rewritten_files(self):
+        source = stream_source(self.stream)
+        opened = _open_stream(source)
+        self.assertIs(_open_stream(source), opened)
+
+        sf.write(self.file, np.zeros(22050 * 4), 22050)
+
+        reopened = _open_stream(source)
+        self.assertIsNot(reopened, opened)
+        self.assertEqual(reopened.getNumberOfSegments(), 2)
+
+    def test_short_recordings_are_spread_over_the_workers(self):
+        coordinator = AnalysisCoordinator(self.stream, max_workers=4)
+
+        jobs = list(coordinator.getJobs(list(range(6)), ["ACI"], None))
+
+        self.assertEqual(
+            [job.segments for job in jobs], [(0, 1), (2, 3), (4, 5)]
+        )
+
+    def test_coordinator_pickles_with_its_cache(self):
+        cache = IndexCache(os.path.join(self.directory.name, "cache"))
+        coordinator = AnalysisCoordinator(self.stream, cache=cache)
+        coordinator.calculateIndices("ACI")
+        coordinator.spectrogram.getColorRange("ACI")
+
+        copy = pickle.loads(pickle.dumps(coordinator))
+
+        np.testing.assert_array_equal(
+            copy.spectrogram.getResult("ACI"),
+            coordinator.spectrogram.getResult("ACI"),
+        )
+        copy.spectrogram.invalidate("ACI")
+        self.assertEqual(copy.loadCachedIndices("ACI"), ["ACI"])
+        events = copy.iterSegments("NDSI")
+        copy.cancel()
+        self.assertEqual(list(events), [])
+
+    def test_every_segment_yields_an_event(self):
+        coordinator = AnalysisCoordinator(self.stream, batch_size=2)
+
+        events = list(coordinator.iterSegments("ACI", "NDSI"))
+
+        self.assertEqual(
+            sorted(event.segment for event in events), list(range(6))
+        )
+        for event in events:
+            self.assertEqual(sorted(event.result), ["ACI", "NDSI"])
+            self.assertEqual(event.errors, [])
+            self.assertGreaterEqual(event.elapsed, event.latency)
+            self.assertGreater(event.compute_time, 0)
+            np.testing.assert_array_equal(
+                coordinator.spectrogram.getResult("ACI")[event.segment],
+                event.result["ACI"],
+            )
+
+    def test_cancelled_analysis_keeps_journal_but_not_results(self):
+        coordinator = AnalysisCoordinator(
+            self.stream, max_pending=1, batch_size=1
+        )
+        journal = ResultJournal(
+            os.path.join(self.directory.name, "noise.journal"),
+            coordinator.getMetadata(),
+        )
+
+        events = coordinator.iterSegments("ACI", journal=journal)
+        first = next(events)
+        coordinator.cancel()
+        remaining = list(events)
+
+        self.assertLess(1 + len(remaining), 6)
+        self.assertNotIn("ACI", coordinator.spectrogram.getIndices())
+        self.assertIn(first.segment, journal.getCompleted(["ACI"]))
+        journal.close()
+
+    def test_cancel_before_the_first_segment_stops_the_analysis(self):
+        coordinator = AnalysisCoordinator(self.stream)
+
+        events = coordinator.iterSegments("ACI")
+        coordinator.cancel()
+
+        self.assertEqual(list(events), [])
+        self.assertNotIn("ACI", coordinator.spectrogram.getIndices())
+        # the next run isn't cancelled
+        self.assertEqual(len(list(coordinator.iterSegments("ACI"))), 6)
+
+    def test_async_iteration(self):
+        coordinator = AnalysisCoordinator(self.stream)
+
+        async def collect():
+            return [
+                event.segment
+                async for event in coordinator.aiterSegments("ACI")
+            ]
+
+        segments = asyncio.run(collect())
+
+        self.assertEqual(sorted(segments), list(range(6)))
+        self.assertEqual(coordinator.spectrogram.getResult("ACI").shape[0], 6)
@@ -0,0 +1,81 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from src.analysis.journal import ResultJournal
+from src.analysis.store import IndexStore
+
+
+class TestResultJournal(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "results.journal")
+        self.metadata = {
+            "file": "a.wav",
+            "sr": 22050,
+            "duration": 60,
+            "time_limits": [0.0, 240.0],
+            "segments": 4,
+        }
+        self.results = [
+            {"ACI": np.full(256, i, dtype=float), "NDSI": np.arange(256.0)}
+            for i in range(4)
+        ]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_reopened_journal_resumes_completed_segments(self):
+        journal = ResultJournal(self.path, self.metadata)
+        journal.append(0, self.results[0])
+        journal.append(2, self.results[2])
+        journal.append(3, {"ACI": self.results[3]["ACI"]})
+        journal.close()
+
+        journal = ResultJournal(self.path, self.metadata)
+
+        self.assertEqual(journal.getCompleted(["ACI", "NDSI"]), {0, 2})
+        self.assertEqual(journal.getCompleted(["ACI"]), {0, 2, 3})
+        np.testing.assert_array_equal(
+            journal.getResults()[2]["ACI"], self.results[2]["ACI"]
+        )
+        journal.close()
+
+    def test_torn_record_is_dropped(self):
+        journal = ResultJournal(self.path, self.metadata)
+        journal.append(0, self.results[0])
+        journal.append(1, self.results[1])
+        journal.close()
+        with open(self.path, "r+b") as f:
+            f.truncate(os.path.getsize(self.path) - 10)
+
+        journal = ResultJournal(self.path, self.metadata)
+        journal.append(1, self.results[1])
+        journal.close()
+
+        journal = ResultJournal(self.path, self.metadata)
+        self.assertEqual(journal.getCompleted(["ACI", "NDSI"]), {0, 1})
+        journal.close()
+
+    def test_different_analysis_raises(self):
+        ResultJournal(self.path, self.metadata).close()
+
+        with self.assertRaises(ValueError):
+            ResultJournal(self.path, dict(self.metadata, duration=30))
+
+    def test_compact_writes_an_index_store(self):
+        journal = ResultJournal(self.path, self.metadata)
+        for i, result in enumerate(self.results):
+            journal.append(i, result)
+
+        store_path = os.path.join(self.directory.name, "results.indices")
+        store = journal.compact(store_path)
+        journal.remove()
+
+        self.assertFalse(os.path.exists(self.path))
+        self.assertEqual(IndexStore(store_path).getShape(), (4, 256))
+        np.testing.assert_array_equal(
+            store.getResult("ACI")[:, 0], [0, 1, 2, 3]
+        )
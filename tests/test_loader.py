@@ -0,0 +1,135 @@
+import os
+import pickle
+import tempfile
+import unittest
+
+import librosa
+import numpy as np
+import soundfile as sf
+from numpy.testing import assert_array_almost_equal
+
+from src.tools.loader import AudioStream
+
+
+class TestAudioStream(unittest.TestCase):
+    def assertArrayEqual(self, a, b, msg=None):
+        try:
+            assert_array_almost_equal(a, b)
+        except AssertionError:
+            raise self.failureException(msg)
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.file = os.path.join(self.directory.name, "tone.wav")
+        sr = 44100
+        t = np.arange(int(sr * 25)) / sr
+        data = 0.5 * np.sin(2 * np.pi * 440 * t) * np.sin(np.pi * t / 25)
+        sf.write(self.file, data, sr, subtype="PCM_16")
+
+        self.addTypeEqualityFunc(np.ndarray, self.assertArrayEqual)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_get_segment_returns_iterated_segment(self):
+        stream = AudioStream(self.file, duration=10)
+        for i, segment in enumerate(AudioStream(self.file, duration=10)):
+            self.assertEqual(stream.getSegment(i).data, segment.data)
+        self.assertEqual(stream[-1].data, segment.data)
+
+    def test_get_segment_does_not_advance_stream(self):
+        stream = AudioStream(self.file, duration=10)
+        stream.getSegment(2)
+        self.assertEqual(stream.position, 0)
+        self.assertEqual(len(list(stream)), 3)
+
+    def test_get_segment_out_of_range_raises(self):
+        stream = AudioStream(self.file, duration=10)
+        with self.assertRaises(IndexError):
+            stream.getSegment(3)
+
+    def test_mmap_backend_returns_same_segments(self):
+        loaded = AudioStream(self.file, duration=10)
+        mapped = AudioStream(self.file, duration=10, backend="mmap")
+        for expected, result in zip(loaded, mapped):
+            self.assertEqual(result.sr, expected.sr)
+            self.assertEqual(result.data, expected.data)
+
+    def assertSameSegments(self, expected, result, edge=256):
+        for i, (a, b) in enumerate(zip(expected, result)):
+            self.assertEqual(b.sr, a.sr)
+            self.assertEqual(len(b.data), len(a.data), "segment %d" % (i))
+            # librosa resamples each segment on its own, so only samples
+            # within the resampling filter of a boundary may differ much
+            np.testing.assert_allclose(b.data, a.data, atol=1e-2)
+            np.testing.assert_allclose(
+                b.data[edge:-edge], a.data[edge:-edge], atol=1e-5
+            )
+
+    def test_stream_backend_returns_same_segments(self):
+        # 10 s segments of a 25 s file, the last one short
+        loaded = list(AudioStream(self.file, duration=10))
+        streamed = list(AudioStream(self.file, duration=10, backend="stream"))
+
+        self.assertEqual(
+            [len(segment.data) for segment in streamed],
+            [220500, 220500, 110250],
+        )
+        self.assertSameSegments(loaded, streamed)
+
+    def test_stream_backend_resamples_across_boundaries(self):
+        # a rate that isn't a multiple of the target, from an offset
+        file = os.path.join(self.directory.name, "tone48k.wav")
+        t = np.arange(48000 * 25) / 48000
+        sf.write(file, 0.5 * np.sin(2 * np.pi * 440 * t), 48000)
+
+        loaded = list(AudioStream(file, duration=7, time_limits=(1.5, 25)))
+        streamed = list(
+            AudioStream(
+                file, duration=7, time_limits=(1.5, 25), backend="stream"
+            )
+        )
+
+        self.assertEqual(len(streamed), 4)
+        self.assertEqual(len(streamed[-1].data), int(2.5 * 22050))
+        self.assertSameSegments(loaded, streamed)
+
+    def test_mmap_backend_reads_rewritten_file(self):
+        before = AudioStream(self.file, duration=10, backend="mmap")[0].data
+        sf.write(self.file, np.zeros(44100 * 25), 44100, subtype="PCM_16")
+        # a size and time of its own, however coarse the file system's clock
+        stat = os.stat(self.file)
+        os.utime(self.file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+        after = AudioStream(self.file, duration=10, backend="mmap")[0].data
+
+        self.assertNotEqual(np.abs(before).max(), 0)
+        self.assertEqual(np.abs(after).max(), 0)
+
+    def test_mmap_segment_pickles_without_samples(self):
+        segment = AudioStream(self.file, duration=10, backend="mmap")[0]
+        pickled = pickle.dumps(segment)
+        self.assertLess(len(pickled), 1024)
+        self.assertEqual(pickle.loads(pickled).data, segment.data)
+
+    def test_stft_blocks_match_whole_stft(self):
+        stream = AudioStream(self.file, time_limits=(1.5, 20))
+        y, sr = librosa.load(
+            self.file, sr=None, offset=1.5, duration=18.5, dtype=np.float32
+        )
+        expected = np.abs(
+            librosa.stft(y, n_fft=1024, hop_length=512, center=False)
+        )
+
+        S = stream.createSTFT(1024, 512)
+        path = os.path.join(self.directory.name, "stft.npy")
+        mapped = stream.createSTFT(1024, 512, path)
+        blocks = list(stream.iterSTFT(1024, 512, block_length=64))
+
+        self.assertEqual(S.dtype, np.float32)
+        self.assertEqual(S.shape, expected.shape)
+        np.testing.assert_allclose(S, expected, atol=1e-4)
+        self.assertIsInstance(mapped, np.memmap)
+        np.testing.assert_array_equal(mapped, S)
+        self.assertEqual(blocks[1].frame, 64)
+        self.assertAlmostEqual(blocks[1].time, 1.5 + 64 * 512 / sr)
@@ -1,10 +1,17 @@
 import operator
 import unittest
+from collections import Counter
 
+import maad
 import numpy as np
-from numpy.testing import assert_array_compare
+from numpy.testing import assert_array_compare, assert_array_equal
 
 from src.tools.loader import load_audio, AudioSegment
+from src.tools.noise import (
+    waveform_denoise,
+    spectrogram_denoise,
+    _calculate_spectral_thresholds,
+)
 
 
 class TestNoiseReduction(unittest.TestCase):
@@ -58,3 +65,123 @@ class TestNoiseReduction(unittest.TestCase):
             denoised_spectrogram, _, _ = segment.getSpectrogram()
 
             self.assertEqual(denoised_spectrogram, unnoised_spectrogram)
+
+
+# element-wise implementations that the denoisers used to run
+
+
+def _reference_waveform_denoise(data, frame_size=512, filter_window=3):
+    envelope = np.array(maad.sound.envelope(data, Nt=frame_size))
+    min_dB = min(np.min(envelope), -60)
+    bin_width = 10 / 100
+    h_indices = [
+        min(99, max(0, int((x - min_dB) / bin_width))) for x in envelope
+    ]
+    counts = Counter(h_indices)
+    histogram = [counts[i] for i in range(0, 100)]
+    smoothed = _reference_moving_average(histogram, filter_window)
+    mode_index = min(int(np.argmax(smoothed)), 95)
+    smoothed_cumsum = np.cumsum(smoothed[0:mode_index])
+    threshold_sum = smoothed_cumsum[-1] * 0.68
+    std_index = int(
+        np.argmax(np.cumsum(smoothed[mode_index - 1 : 0 : -1]) > threshold_sum)
+    )
+    noise_mode = min_dB + ((mode_index + 1) * bin_width)
+    noise_std = (mode_index - std_index) * bin_width
+    noise_threshold = noise_mode + (noise_std * 0.1)
+    return (data - noise_threshold).clip(0), noise_threshold
+
+
+def _reference_moving_average(data, window_size):
+    cumsum = np.cumsum(data)
+    diff = cumsum - (
+        np.concatenate([np.zeros(window_size), cumsum])[0 : len(cumsum)]
+    )
+    smoothed = diff / np.concatenate(
+        [
+            np.arange(1, window_size + 1),
+            np.ones(len(cumsum) - window_size) * window_size,
+        ]
+    )
+    return smoothed
+
+
+def _reference_spectral_threshold(data, filter_window, sd_count):
+    num_bins = int(len(data) / 8)
+    upper_mode_bound = int(num_bins * 0.95)
+    min_power = np.min(data)
+    max_power = np.max(data)
+    bin_width = (max_power - min_power) / num_bins
+    h_indices = [
+        min(num_bins - 1, max(0, int((x - min_power) / bin_width)))
+        for x in data
+    ]
+    counts = Counter(h_indices)
+    histogram = [counts[i] for i in range(0, num_bins)]
+    smoothed = _reference_moving_average(histogram, filter_window)
+    mode_index = min(int(np.argmax(smoothed)), upper_mode_bound)
+    if mode_index == 0:
+        std_index = 0
+    else:
+        smoothed_cumsum = np.cumsum(smoothed[0:mode_index])
+        threshold_sum = smoothed_cumsum[-1] * 0.68
+        std_index = np.argmax(
+            np.cumsum(smoothed[mode_index - 1 :: -1]) > threshold_sum
+        )
+    noise_mode = min_power + ((mode_index + 1) * bin_width)
+    noise_std = (mode_index - std_index) * bin_width
+    return noise_mode + (noise_std * sd_count)
+
+
+class TestSpectralThresholds(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        # power spectrogram-like data with a louder band and a quiet band
+        self.data = rng.exponential(1e-6, size=(256, 2000))
+        self.data[40:60] *= rng.uniform(1, 100, size=(20, 2000))
+        self.data[200:] = rng.exponential(1e-9, size=(56, 2000)) ** 2
+
+    def test_thresholds_match_per_row_implementation(self):
+        expected = [
+            _reference_spectral_threshold(row, 5, 0.1) for row in self.data
+        ]
+        result = _calculate_spectral_thresholds(self.data, 5, 0.1)
+
+        assert_array_equal(result, expected)
+
+    def test_denoise_matches_per_row_implementation(self):
+        thresholds = _reference_moving_average(
+            [_reference_spectral_threshold(row, 5, 0.1) for row in self.data],
+            5,
+        )
+        expected = np.clip(self.data.transpose() - thresholds, 0, None)
+
+        assert_array_equal(
+            spectrogram_denoise(self.data), expected.transpose()
+        )
+
+    def test_constant_rows_have_constant_threshold(self):
+        self.data[10] = 0.0
+        self.data[11] = 1e-6
+        result = _calculate_spectral_thresholds(self.data, 5, 0.1)
+
+        self.assertTrue(np.all(np.isfinite(result)))
+        self.assertEqual(result[10], 0.0)
+        self.assertEqual(result[11], 1e-6)
+
+
+class TestWaveformNoiseFloor(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        data = rng.normal(0, 0.01, 22050 * 10).astype(np.float32)
+        data[50000:60000] += np.sin(np.arange(10000) / 5).astype(np.float32)
+        self.waveform = 20 * np.log10(np.abs(data / np.average(data)))
+
+    def test_noise_floor_matches_element_wise_implementation(self):
+        expected_waveform, expected_noise = _reference_waveform_denoise(
+            self.waveform
+        )
+        waveform, noise = waveform_denoise(self.waveform)
+
+        self.assertEqual(noise, expected_noise)
+        assert_array_equal(waveform, expected_waveform)
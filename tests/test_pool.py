@@ -0,0 +1,25 @@
+import os
+import unittest
+
+from src.analysis import pool
+
+
+class TestPool(unittest.TestCase):
+    def tearDown(self):
+        pool.set_max_workers(None)
+
+    def test_executor_is_shared(self):
+        self.assertIs(pool.get_executor(), pool.get_executor())
+
+    def test_resizing_restarts_the_pool(self):
+        executor = pool.get_executor()
+
+        pool.set_max_workers(2)
+
+        self.assertEqual(pool.get_max_workers(), 2)
+        self.assertIsNot(pool.get_executor(), executor)
+        self.assertGreater(pool.get_executor().submit(os.getpid).result(), 0)
+
+    def test_workers_must_be_positive(self):
+        with self.assertRaises(ValueError):
+            pool.set_max_workers(0)
@@ -0,0 +1,106 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+import numpy as np
+import soundfile as sf
+
+from src.analysis.coordinator import AnalysisCoordinator
+from src.tools import profiling
+from src.tools.loader import AudioStream
+
+
+class TestProfiling(unittest.TestCase):
+    def setUp(self):
+        profiling.reset()
+        profiling.enable()
+
+    def tearDown(self):
+        profiling.enable(False)
+        profiling.reset()
+
+    def test_nested_stages_are_not_counted_twice(self):
+        with profiling.stage("node", "ACI"):
+            with profiling.stage("stft") as entry:
+                time.sleep(0.02)
+                entry["bytes"] = 10
+
+        totals = {
+            (total["stage"], total["index"]): total
+            for total in profiling.summarise()
+        }
+        self.assertLess(totals[("node", "ACI")]["wall"], 0.01)
+        self.assertGreaterEqual(totals[("stft", None)]["wall"], 0.02)
+        self.assertEqual(totals[("stft", None)]["bytes"], 10)
+
+    def test_disabled_profiling_records_nothing(self):
+        profiling.enable(False)
+        with profiling.stage("stft"):
+            pass
+        profiling.record("ipc", 1.0)
+
+        self.assertEqual(profiling.get_records(), [])
+
+    def test_records_of_workers_are_gathered(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file = os.path.join(directory, "noise.wav")
+            rng = np.random.default_rng(0)
+            sf.write(file, rng.normal(0, 0.1, 22050 * 6), 22050)
+            stream = AudioStream(file, duration=2)
+            AnalysisCoordinator(stream).calculateIndices("ACI", "Ht")
+
+            trace = os.path.join(directory, "trace.json")
+            profiling.write_chrome_trace(trace)
+            with open(trace) as f:
+                events = json.load(f)["traceEvents"]
+
+        records = profiling.get_records()
+        stages = {entry["stage"] for entry in records}
+        self.assertTrue({"decode", "stft", "node", "ipc"} <= stages)
+        self.assertEqual(
+            {
+                entry["segment"]
+                for entry in records
+                if entry["stage"] == "stft"
+            },
+            {0, 1, 2},
+        )
+        self.assertNotIn(
+            os.getpid(),
+            {entry["pid"] for entry in records if entry["stage"] == "stft"},
+        )
+        self.assertEqual(len(events), len(records))
+
+    def test_analysis_runs_with_profiling_disabled_in_a_new_process(self):
+        script = (
+            "import numpy as np, soundfile as sf, sys\n"
+            "from src.analysis.coordinator import AnalysisCoordinator\n"
+            "from src.tools.loader import AudioStream\n"
+            "sf.write(sys.argv[1], np.random.default_rng(0)"
+            ".normal(0, 0.1, 22050 * 4), 22050)\n"
+            "coordinator = AnalysisCoordinator("
+            "AudioStream(sys.argv[1], duration=2))\n"
+            "coordinator.calculateIndices('ACI')\n"
+            "print(coordinator.spectrogram.getResult('ACI').shape)\n"
+        )
+        environment = dict(os.environ)
+        environment.pop("ACOUSTIC_INDICES_PROFILE", None)
+        with tempfile.TemporaryDirectory() as directory:
+            completed = subprocess.run(
+                [
+                    sys.executable,
+                    "-c",
+                    script,
+                    os.path.join(directory, "noise.wav"),
+                ],
+                capture_output=True,
+                text=True,
+                env=environment,
+            )
+
+        self.assertEqual(completed.returncode, 0, completed.stderr)
+        self.assertIn("(2, 256)", completed.stdout)
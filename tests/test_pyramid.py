@@ -0,0 +1,75 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import soundfile as sf
+
+from src.analysis.pyramid import (
+    STFTPyramid,
+    build_pyramid,
+    open_pyramid,
+    pool_frames,
+)
+from src.tools.loader import AudioStream
+
+
+class TestSTFTPyramid(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.file = os.path.join(self.directory.name, "noise.wav")
+        rng = np.random.default_rng(0)
+        sf.write(self.file, rng.normal(0, 0.1, 8000 * 30), 8000)
+        self.stream = AudioStream(self.file)
+        self.path = os.path.join(self.directory.name, "noise.pyramid")
+        self.S = self.stream.createSTFT(512, 256)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_levels_pool_the_level_below(self):
+        pyramid = build_pyramid(
+            self.stream, self.path, 512, 256, tile_frames=64
+        )
+
+        # 936 frames -> 468 -> 234 -> 117 -> 59, which fits in a tile
+        self.assertEqual(pyramid.getLevels(), 5)
+        expected = self.S
+        for level in range(pyramid.getLevels()):
+            tiles = [
+                pyramid.getTile(level, tile)
+                for tile in range(pyramid.getTiles(level))
+            ]
+            np.testing.assert_array_equal(np.hstack(tiles), expected)
+            expected = pool_frames(expected, 2, "max")
+
+    def test_range_reads_the_tiles_it_spans(self):
+        pyramid = build_pyramid(
+            self.stream, self.path, 512, 256, tile_frames=64, pooling="mean"
+        )
+
+        S, start = pyramid.getRange(1, 5, 12)
+
+        duration = pyramid.getFrameDuration(1)
+        first, last = int(5 // duration), int(-(-12 // duration))
+        self.assertAlmostEqual(start, first * duration)
+        np.testing.assert_allclose(
+            S, pool_frames(self.S, 2, "mean")[:, first:last], rtol=1e-6
+        )
+        self.assertEqual(pyramid.chooseLevel(duration * 2.5), 2)
+
+    def test_matching_pyramid_is_reused(self):
+        built = open_pyramid(self.stream, self.path, 512, 256, tile_frames=64)
+        modified = os.path.getmtime(built._tilePath(0, 0))
+
+        reopened = open_pyramid(
+            self.stream, self.path, 512, 256, tile_frames=64
+        )
+        self.assertIsInstance(reopened, STFTPyramid)
+        self.assertEqual(os.path.getmtime(built._tilePath(0, 0)), modified)
+
+        rebuilt = open_pyramid(self.stream, self.path, 1024, 256)
+
+        self.assertEqual(rebuilt.metadata["n_fft"], 1024)
+        with self.assertRaises(ValueError):
+            build_pyramid(self.stream, self.path, tile_frames=63)
@@ -0,0 +1,62 @@
+import os
+import unittest
+
+import numpy as np
+
+from src.analysis.pool import get_executor
+from src.analysis.shared import SharedResults, attach_results
+
+
+def _write_row(layout, i):
+    with attach_results(layout) as results:
+        for index in results:
+            results[index][i] = i
+
+
+class TestSharedResults(unittest.TestCase):
+    def test_workers_write_rows_in_place(self):
+        shared = SharedResults(["ACI", "NDSI"], (4, 256))
+        try:
+            for i in (1, 3):
+                get_executor().submit(
+                    _write_row, shared.getLayout(), i
+                ).result()
+
+            np.testing.assert_array_equal(
+                shared.results["ACI"][:, 0], [0, 1, 0, 3]
+            )
+            np.testing.assert_array_equal(
+                shared.copy(3, ["NDSI"])["NDSI"], np.full(256, 3.0)
+            )
+        finally:
+            shared.release()
+
+    def test_copies_outlive_the_shared_memory(self):
+        shared = SharedResults(["ACI"], (2, 256))
+        shared.results["ACI"][1] = 1
+        copies = shared.copy()
+        layout = shared.getLayout()
+
+        shared.release()
+
+        np.testing.assert_array_equal(copies["ACI"][:, 0], [0, 1])
+        with self.assertRaises(FileNotFoundError):
+            with attach_results(layout):
+                pass
+
+    def test_results_can_be_mapped_from_files(self):
+        shared = SharedResults(["ACI", "NDSI"], (4, 256), on_disk=True)
+        layout = shared.getLayout()
+        try:
+            get_executor().submit(_write_row, layout, 2).result()
+
+            self.assertTrue(layout.on_disk)
+            np.testing.assert_array_equal(
+                shared.results["ACI"][:, 0], [0, 0, 2, 0]
+            )
+            np.testing.assert_array_equal(
+                shared.copy(2, ["NDSI"])["NDSI"], np.full(256, 2.0)
+            )
+        finally:
+            shared.release()
+        self.assertFalse(os.path.exists(layout.names[0][1]))
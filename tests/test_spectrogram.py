@@ -0,0 +1,59 @@
+import unittest
+
+import numpy as np
+
+from src.analysis.spectrogram import Spectrogram
+
+
+class TestSpectrogramColors(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.spectrogram = Spectrogram(
+            {
+                index: rng.normal(i, i + 1, (20, 256))
+                for i, index in enumerate(["SpDiv", "ACI", "HfVar"])
+            },
+            sr=22050,
+        )
+
+    def test_image_matches_color_results(self):
+        image = self.spectrogram.getColorImage(["SpDiv", "ACI", "HfVar"])
+
+        self.assertEqual(image.shape, (256, 20, 3))
+        self.assertEqual(image.dtype, np.uint8)
+        for colour, index in enumerate(["SpDiv", "ACI", "HfVar"]):
+            result = self.spectrogram.getResult(index)
+            expected = (result - result.min()) / np.ptp(result)
+            np.testing.assert_allclose(
+                self.spectrogram.getColorResult(index), expected
+            )
+            np.testing.assert_allclose(
+                image[:, :, colour], (expected * 255.999).T, atol=1
+            )
+
+    def test_ranges_are_kept_until_results_change(self):
+        before = self.spectrogram.getColorRange("ACI")
+        self.spectrogram.result["ACI"][0, 0] = 100
+
+        self.assertEqual(self.spectrogram.getColorRange("ACI"), before)
+        self.spectrogram.addSegment(1, {"ACI": np.full(256, -100.0)})
+        self.assertEqual(self.spectrogram.getColorRange("ACI"), (-100, 100))
+        self.spectrogram.result["ACI"][2] = 200
+        self.spectrogram.invalidate("ACI")
+        self.assertEqual(self.spectrogram.getColorRange("ACI")[1], 200)
+
+    def test_percentile_clipping_and_log_scale(self):
+        result = self.spectrogram.getResult("ACI")
+        low, high = np.percentile(result, [5, 95])
+
+        clipped = self.spectrogram.getColorResult("ACI", percentile=5)
+        logged = self.spectrogram.getColorResult("ACI", log=True)
+
+        self.assertEqual(self.spectrogram.getColorRange("ACI", 5), (low, high))
+        np.testing.assert_allclose(
+            clipped, np.clip((result - low) / (high - low), 0, 1)
+        )
+        linear = self.spectrogram.getColorResult("ACI")
+        np.testing.assert_allclose(logged, np.log10(1 + 9 * linear))
+        with self.assertRaises(ValueError):
+            self.spectrogram.getColorRange("ACI", 50)
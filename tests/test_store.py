@@ -0,0 +1,89 @@
+import json
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from src.analysis.spectrogram import Spectrogram
+from src.analysis.store import IndexStore, save_store
+
+
+class TestIndexStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "results.indices")
+        rng = np.random.default_rng(0)
+        self.spectrogram = Spectrogram(
+            {"ACI": rng.random((10, 256)), "NDSI": rng.random((10, 256))},
+            sr=22050,
+        )
+        self.metadata = {
+            "file": "a.wav",
+            "duration": 60,
+            "time_limits": [0, 600],
+        }
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_results_round_trip(self):
+        store = save_store(self.path, self.spectrogram, self.metadata)
+        loaded = store.toSpectrogram()
+
+        self.assertEqual(loaded.getIndices(), ["ACI", "NDSI"])
+        self.assertEqual(loaded.getShape(), (10, 256))
+        self.assertEqual(store.metadata["sr"], 22050)
+        for index in loaded.getIndices():
+            np.testing.assert_array_equal(
+                loaded.getResult(index), self.spectrogram.getResult(index)
+            )
+
+    def test_time_range_reads_only_those_segments(self):
+        store = save_store(self.path, self.spectrogram, self.metadata)
+
+        result = store.getResult("ACI", 120, 300)
+
+        self.assertIsInstance(result, np.memmap)
+        np.testing.assert_array_equal(
+            result, self.spectrogram.getResult("ACI")[2:5]
+        )
+
+    def test_loaded_results_can_be_changed_without_writing(self):
+        save_store(self.path, self.spectrogram, self.metadata)
+        loaded = IndexStore(self.path).toSpectrogram()
+
+        loaded.addSegment(0, {"ACI": np.zeros(256)})
+
+        self.assertEqual(loaded.getResult("ACI")[0].sum(), 0)
+        self.assertNotEqual(IndexStore(self.path).getResult("ACI")[0].sum(), 0)
+
+    def test_unknown_version_raises(self):
+        save_store(self.path, self.spectrogram, self.metadata)
+        metadata_path = os.path.join(self.path, "metadata.json")
+        with open(metadata_path) as f:
+            metadata = json.load(f)
+        with open(metadata_path, "w") as f:
+            json.dump(dict(metadata, version=0), f)
+
+        with self.assertRaises(ValueError):
+            IndexStore(self.path)
+
+    def test_loaded_results_can_be_saved_over_their_store(self):
+        save_store(self.path, self.spectrogram, self.metadata)
+        loaded = IndexStore(self.path).toSpectrogram()
+        loaded.addSegment(0, {"ACI": np.zeros(256)})
+
+        save_store(self.path, loaded, self.metadata)
+
+        # the files replaced are no longer mapped
+        self.assertNotIsInstance(loaded.getResult("ACI"), np.memmap)
+        expected = self.spectrogram.getResult("ACI").copy()
+        expected[0] = 0
+        np.testing.assert_array_equal(
+            IndexStore(self.path).getResult("ACI"), expected
+        )
+        np.testing.assert_array_equal(
+            IndexStore(self.path).getResult("NDSI"),
+            self.spectrogram.getResult("NDSI"),
+        )